@@ -0,0 +1,96 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from supabase_client import supabase
+
+logger = logging.getLogger(__name__)
+
+def payload_etag(payload) -> str:
+    """Strong ETag (quoted SHA-256) of a JSON-serialisable payload."""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return f'"{hashlib.sha256(canonical.encode()).hexdigest()}"'
+
+
+def _opaque_tag(etag: str) -> str:
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    True if an If-None-Match header value covers etag (incl. *), using the
+    weak comparison If-None-Match calls for: W/"x" and "x" match.
+    """
+    if not if_none_match:
+        return False
+    candidates = [c.strip() for c in if_none_match.split(",")]
+    return "*" in candidates or _opaque_tag(etag) in {_opaque_tag(c) for c in candidates}
+
+
+class AnalysisStore:
+    """
+    Finished /api/analyze payloads by analysis_id, so reports and re-fetches
+    never need the client to post the results back.
+
+    Reads are served from a bounded in-process map; Supabase's analyses
+    table is the durable copy shared across workers. max_entries defaults
+    to PHARMAGUARD_ANALYSIS_CACHE_SIZE, read on first use.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self._max_entries = max_entries
+        self._analyses: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def max_entries(self) -> int:
+        if self._max_entries is None:
+            return int(os.getenv("PHARMAGUARD_ANALYSIS_CACHE_SIZE", "2000"))
+        return self._max_entries
+
+    async def save(self, analysis: Dict):
+        """Stores a format_analysis_result payload under its analysis_id."""
+        analysis_id = analysis["analysis_id"]
+        self._remember(analysis_id, analysis)
+
+        if supabase.configured:
+            try:
+                await supabase.insert("analyses", {"id": analysis_id, "payload": analysis}, upsert=True)
+            except Exception as e:
+                logger.warning(f"[Analyses] Supabase save failed: {e}")
+
+    async def load(self, analysis_id: str) -> Optional[Dict]:
+        """Returns the stored payload, or None if the id is unknown."""
+        with self._lock:
+            analysis = self._analyses.get(analysis_id)
+            if analysis is not None:
+                self._analyses.move_to_end(analysis_id)
+                return analysis
+
+        if not supabase.configured:
+            return None
+        try:
+            rows = await supabase.select("analyses", {"id": f"eq.{analysis_id}", "select": "payload", "limit": "1"})
+        except Exception as e:
+            logger.warning(f"[Analyses] Supabase load failed: {e}")
+            return None
+
+        if not rows:
+            return None
+        analysis = rows[0]["payload"]
+        self._remember(analysis_id, analysis)
+        return analysis
+
+    def _remember(self, analysis_id: str, analysis: Dict):
+        with self._lock:
+            self._analyses[analysis_id] = analysis
+            self._analyses.move_to_end(analysis_id)
+            while len(self._analyses) > self.max_entries:
+                self._analyses.popitem(last=False)
+
+
+analysis_store = AnalysisStore()
@@ -0,0 +1,216 @@
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import tarfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from drug_risk_engine import predict_drug_risks
+from explanation_templates import call_groq_batch_api, get_template_explanation
+from explanation_cache import get_explanation_cache
+from response_formatter import format_analysis_result
+from vcf_processor import process_vcf_stream, vcf_extension, MAX_FILE_SIZE
+from vcf_stream import COMPRESSED_EXTENSIONS
+from profile_cache import get_profile_cache, profile_cache_key
+from analysis_store import analysis_store
+
+logger = logging.getLogger(__name__)
+
+
+def batch_workers() -> int:
+    """PHARMAGUARD_BATCH_WORKERS; defaults to one worker per core (override for shared hosts)."""
+    return int(os.getenv("PHARMAGUARD_BATCH_WORKERS", "0")) or os.cpu_count() or 1
+
+
+def max_batch_files() -> int:
+    return int(os.getenv("PHARMAGUARD_MAX_BATCH_FILES", "5000"))
+
+
+VCF_EXTENSIONS = (".vcf",) + COMPRESSED_EXTENSIONS
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz")
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_batch_pool() -> ProcessPoolExecutor:
+    """Returns the shared process pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        # spawn avoids forking a process that already runs the event loop's threads
+        workers = batch_workers()
+        _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        logger.info(f"[Batch] Started process pool with {workers} workers")
+    return _pool
+
+
+def shutdown_batch_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def analyze_vcf_bytes(data: bytes, filename: str, drugs: str, api_key: Optional[str] = None) -> Dict:
+    """
+    Runs the full single-patient pipeline on one in-memory VCF.
+
+    process_vcf_stream -> predict_drug_risks -> explanations (persistent
+    cache, then batched Groq calls, then templates) ->
+    format_analysis_result. Executed inside pool workers, so it must stay a
+    picklable top-level function.
+
+    Returns:
+        The format_analysis_result payload plus "file", or an error record.
+    """
+    # Each worker has its own memory tier; the disk tier (if configured) is shared
+    cache = get_profile_cache()
+    extension = vcf_extension(filename)
+    cache_key = profile_cache_key(hashlib.sha256(data).hexdigest(), extension) if extension else None
+    vcf_result = cache.get(cache_key) if cache_key else None
+    if vcf_result is None:
+        vcf_result = process_vcf_stream(io.BytesIO(data), filename)
+        if cache_key and vcf_result.get("valid"):
+            cache.put(cache_key, vcf_result)
+
+    if not vcf_result.get("valid"):
+        return {
+            "file": filename,
+            "error": "VCF Validation Failed",
+            "error_type": vcf_result.get("error_type"),
+            "message": vcf_result.get("message", "Unknown validation error")
+        }
+
+    genetic_profile = vcf_result.get("genetic_profile", {})
+    simple_profile = {gene: d["phenotype"] for gene, d in genetic_profile.items()}
+    risk_assessments = predict_drug_risks(drugs, simple_profile)
+
+    explanations_map = _explain(risk_assessments, api_key)
+
+    result = format_analysis_result(vcf_result, risk_assessments, explanations_map)
+    result["file"] = filename
+    return result
+
+
+def _explain(risk_assessments: List[Dict], api_key: Optional[str]) -> Dict[str, str]:
+    explanations = {}
+    cache = get_explanation_cache() if api_key else None
+    if cache is not None:
+        cached = cache.get_many([(a["drug"], a["primary_gene"], a["phenotype"]) for a in risk_assessments])
+        for a in risk_assessments:
+            text = cached.get((a["drug"], a["primary_gene"], a["phenotype"]))
+            if text:
+                explanations[a["drug"]] = text
+
+    missing = {
+        a["drug"]: (a["drug"], a["primary_gene"], a["phenotype"])
+        for a in risk_assessments if a["drug"] not in explanations
+    }
+    if missing and api_key:
+        generated = call_groq_batch_api(list(missing.values()), api_key)
+        explanations.update(generated)
+        if cache is not None:
+            for drug, text in generated.items():
+                cache.put(*missing[drug], text, batched=True)
+
+    for a in risk_assessments:
+        if a["drug"] not in explanations:
+            explanations[a["drug"]] = get_template_explanation(a["drug"], a["primary_gene"], a["phenotype"])
+    return explanations
+
+
+def _iter_archive(filename: str, fileobj: BinaryIO) -> Iterator[Tuple[str, bytes]]:
+    # Members are read up to MAX_FILE_SIZE + 1 so process_vcf_stream can still
+    # reject oversized files without the whole member landing in memory.
+    if filename.lower().endswith(".zip"):
+        with zipfile.ZipFile(fileobj) as zf:
+            for info in zf.infolist():
+                if not info.is_dir() and info.filename.lower().endswith(VCF_EXTENSIONS):
+                    with zf.open(info) as member:
+                        yield info.filename, member.read(MAX_FILE_SIZE + 1)
+        return
+
+    with tarfile.open(fileobj=fileobj, mode="r:*") as tf:
+        for info in tf:
+            if info.isfile() and info.name.lower().endswith(VCF_EXTENSIONS):
+                member = tf.extractfile(info)
+                if member is not None:
+                    yield info.name, member.read(MAX_FILE_SIZE + 1)
+
+
+def iter_batch_sources(uploads: List[Tuple[str, BinaryIO]]) -> Iterator[Tuple[str, bytes]]:
+    """
+    Expands uploaded files into (filename, bytes) pairs, one per VCF.
+
+    Archives (.zip / .tar / .tar.gz) are unpacked lazily; anything else is
+    treated as a single VCF.
+    """
+    for filename, fileobj in uploads:
+        name = filename or "upload.vcf"
+        if name.lower().endswith(ARCHIVE_EXTENSIONS):
+            try:
+                yield from _iter_archive(name, fileobj)
+            except (zipfile.BadZipFile, tarfile.TarError) as e:
+                logger.warning(f"[Batch] Unreadable archive {name}: {e}")
+                yield name, b""
+        else:
+            yield name, fileobj.read(MAX_FILE_SIZE + 1)
+
+
+async def stream_batch_results(
+    sources: Iterator[Tuple[str, bytes]],
+    drugs: str,
+    api_key: Optional[str] = None,
+    window: Optional[int] = None
+) -> AsyncIterator[str]:
+    """
+    Fans VCFs out to the process pool and yields one NDJSON line per patient
+    as soon as it finishes (completion order, not upload order).
+
+    At most `window` files are in flight, so a 2,000-file cohort never has
+    more than a few VCFs buffered in memory at once.
+    """
+    loop = asyncio.get_running_loop()
+    pool = get_batch_pool()
+    window = window or batch_workers() * 2
+    max_files = max_batch_files()
+    pending: Dict[asyncio.Future, str] = {}
+    submitted = 0
+    exhausted = False
+
+    while True:
+        while not exhausted and len(pending) < window:
+            # Reading/unpacking uploads touches disk, so keep it off the loop
+            item = await run_in_threadpool(next, sources, None)
+            if item is None:
+                exhausted = True
+                break
+            if submitted >= max_files:
+                exhausted = True
+                yield json.dumps({"error": "BatchTooLarge", "message": f"Batch limited to {max_files} files; remaining files skipped"}) + "\n"
+                break
+            filename, data = item
+            future = loop.run_in_executor(pool, analyze_vcf_bytes, data, filename, drugs, api_key)
+            pending[future] = filename
+            submitted += 1
+
+        if not pending:
+            break
+
+        done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for future in done:
+            filename = pending.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"[Batch] {filename} failed: {e}")
+                result = {"file": filename, "error": "Internal Server Error", "message": str(e)}
+            if "analysis_id" in result:
+                await analysis_store.save(result)
+            yield json.dumps(result) + "\n"
@@ -0,0 +1,98 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+CHAT_CHANNEL = "pharmaguard:chat"
+
+Handler = Callable[[str, Dict], Awaitable[None]] # (user_id, event)
+
+
+class InProcessPubSub:
+    """
+    Delivers published events straight to this process's handler.
+    Correct only when the app runs as a single worker.
+    """
+
+    def __init__(self):
+        self._handler: Optional[Handler] = None
+
+    async def start(self, handler: Handler):
+        self._handler = handler
+
+    async def publish(self, user_id: str, event: Dict):
+        if self._handler is not None:
+            await self._handler(user_id, event)
+
+    async def close(self):
+        self._handler = None
+
+
+class RedisPubSub:
+    """
+    Broker-backed fan-out: every worker publishes to one Redis channel and
+    every worker's listener delivers the events to the sockets it holds.
+
+    Args:
+        url: Redis URL; ignored when client is given.
+        client: A redis.asyncio-compatible client (e.g. fakeredis in tests).
+        channel: Channel shared by all workers.
+    """
+
+    def __init__(self, url: str = "", client=None, channel: str = CHAT_CHANNEL):
+        if client is None:
+            import redis.asyncio as redis # optional dependency, only needed here
+            client = redis.from_url(url)
+        self.client = client
+        self.channel = channel
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+
+    async def start(self, handler: Handler):
+        self._pubsub = self.client.pubsub()
+        await self._pubsub.subscribe(self.channel)
+        self._listener = asyncio.create_task(self._listen(handler))
+
+    async def _listen(self, handler: Handler):
+        while True:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is None:
+                    continue
+                payload = json.loads(message["data"])
+                await handler(payload["user_id"], payload["event"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # A bad payload or a Redis hiccup must not kill the listener
+                logger.warning(f"[PubSub] Listener error: {e}")
+                await asyncio.sleep(0.5)
+
+    async def publish(self, user_id: str, event: Dict):
+        await self.client.publish(self.channel, json.dumps({"user_id": user_id, "event": event}))
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+        if self._pubsub is not None:
+            await self._pubsub.unsubscribe(self.channel)
+            await self._pubsub.aclose()
+            self._pubsub = None
+
+
+def create_pubsub():
+    """
+    Redis-backed when PHARMAGUARD_REDIS_URL is set, in-process otherwise.
+
+    Set the URL to fan chat events out across uvicorn workers/hosts (requires
+    the optional `redis` package).
+    """
+    redis_url = os.getenv("PHARMAGUARD_REDIS_URL", "")
+    if redis_url:
+        logger.info("[PubSub] Using Redis for cross-worker chat delivery")
+        return RedisPubSub(redis_url)
+    return InProcessPubSub()
@@ -0,0 +1,78 @@
+"""
+Cold-start import budget check.
+
+Imports vcf_authenticator (what api/index.py loads on every cold start) in a
+fresh interpreter under `python -X importtime`, prints the slowest imports
+and fails if the total exceeds the budget or a lazily-loaded dependency was
+pulled in at import time.
+
+Usage:
+    python check_import_time.py [--budget-ms 1000] [--top 15]
+"""
+import argparse
+import os
+import subprocess
+import sys
+from typing import List, Tuple
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+IMPORT_BUDGET_MS = float(os.getenv("PHARMAGUARD_IMPORT_BUDGET_MS", "1000"))
+
+# Loaded on first use only (report workers, batch workers, ML inference process)
+LAZY_MODULES = ("reportlab", "requests", "vcf_feature_extractor")
+
+
+def measure_imports(module: str) -> List[Tuple[str, int, int, int]]:
+    """
+    Runs `import module` under -X importtime in a subprocess.
+
+    Returns:
+        (name, depth, self_us, cumulative_us) per imported module, in the
+        order Python reports them (children before their parent).
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise SystemExit(f"import {module} failed:\n{proc.stderr[-2000:]}")
+
+    imports = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PharmaGuard cold-start import budget")
+    parser.add_argument("--module", default="vcf_authenticator")
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    imports = measure_imports(args.module)
+    total_ms = sum(cum for _, depth, _, cum in imports if depth == 0) / 1000
+
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for name, _, self_us, cum_us in sorted(imports, key=lambda i: i[3], reverse=True)[:args.top]:
+        print(f"{cum_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name}")
+    print(f"\nimport {args.module}: {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+
+    failures = []
+    eager = sorted({name.split(".")[0] for name, _, _, _ in imports} & set(LAZY_MODULES))
+    if eager:
+        failures.append(f"lazily-loaded modules imported eagerly: {', '.join(eager)}")
+    if total_ms > args.budget_ms:
+        failures.append(f"import time {total_ms:.1f} ms exceeds budget of {args.budget_ms:.0f} ms")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,65 @@
-from typing import Dict, List
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from phenotype_engine import PHENOTYPES, encode_alleles, phenotype_codes
+from variant_extractor import gt_dosage
+
+# ── Severity and display tables (compiled once) ─────────────────────────
+# Severity ranks decide which two alleles form the diplotype when more than
+# two non-*1 alleles are called: *1 0, high risk 10, medium risk 5, any
+# other allele 2.
+BASE_HIGH_RISK = {
+    "*3", "*4", "*5", "*6", "*8", "*11",
+    "*12", "*13", "*14", "*15"
+}
+
+BASE_MEDIUM_RISK = {
+    "*2", "*9", "*10", "*17", "*41", "*1B"
+}
+
+# *2 is a no-function allele for these genes
+GENE_HIGH_RISK_OVERRIDES = {
+    "CYP2C19": {"*2"},
+    "CYP2C9": {"*2"},
+}
+
+DEFAULT_SEVERITY = 2
+
+
+def _compile_severity(gene: str) -> Dict[str, int]:
+    high = BASE_HIGH_RISK | GENE_HIGH_RISK_OVERRIDES.get(gene, set())
+    medium = BASE_MEDIUM_RISK - high
+    ranks = {allele: 5 for allele in medium}
+    ranks.update({allele: 10 for allele in high})
+    ranks["*1"] = 0
+    return ranks
+
+
+_DEFAULT_SEVERITY_TABLE = _compile_severity("")
+SEVERITY_TABLES: Dict[str, Dict[str, int]] = {gene: _compile_severity(gene) for gene in GENE_HIGH_RISK_OVERRIDES}
+
+
+def severity_table(gene: str) -> Dict[str, int]:
+    """Allele -> severity rank for gene (alleles not listed rank DEFAULT_SEVERITY)."""
+    return SEVERITY_TABLES.get(gene, _DEFAULT_SEVERITY_TABLE)
+
+
+@lru_cache(maxsize=4096)
+def display_rank(allele: str) -> int:
+    """Sort key for the "*a/*b" display order: the allele's digits, *1 and digit-less alleles last."""
+    if allele == "*1":
+        return 999
+    digits = ''.join(filter(str.isdigit, allele))
+    return int(digits) if digits else 999
+
+
+def format_diplotype(first: str, second: str) -> str:
+    """Joins two alleles in display order (stable for equal ranks)."""
+    if display_rank(second) < display_rank(first):
+        first, second = second, first
+    return f"{first}/{second}"
 
 
 def build_diplotype(
@@ -23,92 +84,94 @@ def build_diplotype(
 
     diplotypes = {}
 
-    BASE_HIGH_RISK = {
-        "*3", "*4", "*5", "*6", "*8", "*11",
-        "*12", "*13", "*14", "*15"
-    }
-
-    BASE_MEDIUM_RISK = {
-        "*2", "*9", "*10", "*17", "*41", "*1B"
-    }
-
     for gene, data in variants.items():
 
-        detected_alleles = []
-
         # -----------------------------
-        # ✅ GT-aware allele expansion
+        # ✅ GT-aware allele expansion (explicit *1 dropped)
         # -----------------------------
+        filtered = []
         for var in data.get("variants", []):
             allele = var.get("allele")
             gt = var.get("gt")
 
-            if not allele or not gt:
+            if not allele or not gt or allele == "*1":
                 continue
 
-            if gt == "1/1":
-                detected_alleles.extend([allele, allele])
-
-            elif gt in ["0/1", "1/0"]:
-                detected_alleles.append(allele)
-
-        # -----------------------------
-        # Gene-specific severity copy
-        # -----------------------------
-        HIGH_RISK = set(BASE_HIGH_RISK)
-        MEDIUM_RISK = set(BASE_MEDIUM_RISK)
-
-        if gene in ["CYP2C19", "CYP2C9"]:
-            HIGH_RISK.add("*2")
-            MEDIUM_RISK.discard("*2")
-
-        # -----------------------------
-        # Severity scoring
-        # -----------------------------
-        def severity_score(allele: str):
-            if allele == "*1":
-                return 0
-            if allele in HIGH_RISK:
-                return 10
-            if allele in MEDIUM_RISK:
-                return 5
-            return 2
-
-        # -----------------------------
-        # Remove explicit *1
-        # -----------------------------
-        filtered = [a for a in detected_alleles if a != "*1"]
+            # Same GT parsing as GenotypeMatrix (phased and multi-allelic calls count)
+            filtered.extend([allele] * gt_dosage(gt))
 
         # -----------------------------
         # Diplotype logic
         # -----------------------------
         if len(filtered) == 0:
-            diplotype = "*1/*1"
+            diplotypes[gene] = "*1/*1"
 
         elif len(filtered) == 1:
-            diplotype = f"*1/{filtered[0]}"
+            diplotypes[gene] = format_diplotype("*1", filtered[0])
 
         else:
+            severity = severity_table(gene)
             ranked = sorted(
                 filtered,
-                key=severity_score,
+                key=lambda a: severity.get(a, DEFAULT_SEVERITY),
                 reverse=True
             )
+            diplotypes[gene] = format_diplotype(ranked[0], ranked[1])
 
-            diplotype = f"{ranked[0]}/{ranked[1]}"
+    return diplotypes
 
-        # -----------------------------
-        # Standard display sorting
-        # -----------------------------
-        def display_key(a):
-            if a == "*1":
-                return 999
-            digits = ''.join(filter(str.isdigit, a))
-            return int(digits) if digits else 999
 
-        parts = diplotype.split("/")
-        parts.sort(key=display_key)
-
-        diplotypes[gene] = f"{parts[0]}/{parts[1]}"
-
-    return diplotypes
\ No newline at end of file
+def build_diplotypes_batch(gene: str, alleles: List[str], dosages: np.ndarray) -> Tuple[List[str], List[str]]:
+    """
+    build_diplotype and get_phenotype for one gene across many samples at once.
+
+    Args:
+        gene: e.g. "CYP2D6"
+        alleles: STAR allele of each variant row, in file order.
+        dosages: (n_rows, n_samples) allele dosages (0/1/2), e.g. the
+            gene's rows of GenotypeMatrix.matrix.
+
+    Returns:
+        (diplotypes, phenotypes), one of each per sample: the diplotype
+        build_diplotype gives for that sample's variant map, and its
+        phenotype from the compiled phenotype matrix.
+    """
+    dosages = np.asarray(dosages)
+    n_rows, n_samples = dosages.shape
+    # Row 0 of the candidates stands for *1 (the missing-allele fallback)
+    names = ["*1"] + list(alleles)
+
+    # Higher severity first; among equals the earlier row wins, as in the stable sort
+    severity = severity_table(gene)
+    rank = np.array([0] + [
+        -1 if a == "*1" else severity.get(a, DEFAULT_SEVERITY) * (n_rows + 1) + (n_rows - i)
+        for i, a in enumerate(alleles)
+    ], dtype=np.int64)
+
+    carriers = np.vstack([np.zeros((1, n_samples), dtype=dosages.dtype), dosages])
+    carriers[1:][rank[1:] < 0] = 0
+    keys = np.where(carriers > 0, rank[:, None], -1)
+
+    samples = np.arange(n_samples)
+    first = keys.argmax(axis=0)
+    first[keys[first, samples] < 0] = 0
+
+    # A homozygous top allele fills both slots; otherwise take the next-best row
+    keys[first, samples] = np.where(carriers[first, samples] >= 2, keys[first, samples], -1)
+    second = keys.argmax(axis=0)
+    second[keys[second, samples] < 0] = 0
+
+    # Format each distinct (first, second) pair once; a lone allele pairs as "*1/<allele>"
+    pair_codes, inverse = np.unique(first * (n_rows + 1) + second, return_inverse=True)
+    formatted = []
+    for code in pair_codes.tolist():
+        a, b = divmod(code, n_rows + 1)
+        formatted.append(format_diplotype(names[b], names[a]) if b == 0 else format_diplotype(names[a], names[b]))
+
+    # Phenotypes from the integer matrix, in the displayed allele order
+    shown = [d.split("/") for d in formatted]
+    codes = phenotype_codes(gene, encode_alleles(gene, [s[0] for s in shown]), encode_alleles(gene, [s[1] for s in shown]))
+    phenotypes = [PHENOTYPES[c] for c in codes.tolist()]
+
+    inverse = np.ravel(inverse)
+    return [formatted[i] for i in inverse], [phenotypes[i] for i in inverse]
@@ -1,20 +1,9 @@
 # risk_predictor.py
 
-from typing import List, Dict
-from pydantic import BaseModel
+from functools import lru_cache
+from typing import List, Dict, Tuple, Union
 
-
-# ------------------------------
-# Phenotype Model
-# ------------------------------
-
-class PhenotypeProfile(BaseModel):
-    CYP2D6: str = "Unknown"
-    CYP2C19: str = "Unknown"
-    CYP2C9: str = "Unknown"
-    SLCO1B1: str = "Unknown"
-    TPMT: str = "Unknown"
-    DPYD: str = "Unknown"
+import numpy as np
 
 
 # ------------------------------
@@ -107,6 +96,80 @@ CONFIDENCE = {
 }
 
 
+# ------------------------------
+# Compiled Risk Table
+# ------------------------------
+# RISK_TABLE[drug_id, phenotype_id] indexes OUTCOMES, built once from the
+# rules above. The last row is for drugs without a gene mapping; the last
+# column for any phenotype the rules do not name (the "partial" outcome).
+
+DRUGS = list(DRUG_GENE_MAPPING)
+DRUG_IDS = {drug: i for i, drug in enumerate(DRUGS)}
+DRUG_GENES = [DRUG_GENE_MAPPING[drug] for drug in DRUGS] + [None]
+UNKNOWN_DRUG = len(DRUGS)
+
+RISK_PHENOTYPES = ["Unknown"] + sorted({p for rules in RISK_RULES.values() for p in rules})
+PHENOTYPE_IDS = {p: i for i, p in enumerate(RISK_PHENOTYPES)}
+OTHER_PHENOTYPE = len(RISK_PHENOTYPES)
+
+
+def _assess(drug: str, phenotype_id: int) -> Tuple[str, str, float]:
+    if drug not in DRUG_GENE_MAPPING or phenotype_id == 0:
+        return ("Unknown", "none", CONFIDENCE["unknown"])
+    if phenotype_id < OTHER_PHENOTYPE:
+        rule = RISK_RULES.get(drug, {}).get(RISK_PHENOTYPES[phenotype_id])
+        if rule:
+            return (rule[0], rule[1], CONFIDENCE["known"])
+    return ("Adjust Dosage", "low", CONFIDENCE["partial"])
+
+
+def _compile_risk_table():
+    outcomes, outcome_ids = [], {}
+    table = np.zeros((len(DRUGS) + 1, OTHER_PHENOTYPE + 1), dtype=np.int8)
+    for drug_id, drug in enumerate(DRUGS + [None]):
+        for phenotype_id in range(OTHER_PHENOTYPE + 1):
+            outcome = _assess(drug, phenotype_id)
+            if outcome not in outcome_ids:
+                outcome_ids[outcome] = len(outcomes)
+                outcomes.append(outcome)
+            table[drug_id, phenotype_id] = outcome_ids[outcome]
+    return outcomes, table
+
+
+OUTCOMES, RISK_TABLE = _compile_risk_table()
+_RISK_ROWS = RISK_TABLE.tolist()
+
+
+@lru_cache(maxsize=1024)
+def parse_drugs(drug_names: str) -> Tuple[Tuple[str, int], ...]:
+    """Comma-separated drug names -> ((DRUG, drug_id), ...); unmapped drugs get UNKNOWN_DRUG."""
+    drugs = [d.strip().upper() for d in drug_names.split(",") if d.strip()]
+    return tuple((d, DRUG_IDS.get(d, UNKNOWN_DRUG)) for d in drugs)
+
+
+@lru_cache(maxsize=256)
+def _phenotype_key(value: str) -> Tuple[str, int]:
+    phenotype = normalize_pheno(value)
+    return phenotype, PHENOTYPE_IDS.get(phenotype, OTHER_PHENOTYPE)
+
+
+def _profile_phenotype(profile: Dict, gene: str) -> Tuple[str, int]:
+    value = profile.get(gene, "Unknown")
+    return _phenotype_key(value if isinstance(value, str) else "")
+
+
+def _risk_record(drug: str, drug_id: int, phenotype: str, outcome_id: int) -> Dict:
+    risk, severity, confidence = OUTCOMES[outcome_id]
+    return {
+        "drug": drug,
+        "primary_gene": DRUG_GENES[drug_id] or "Unknown",
+        "phenotype": phenotype,
+        "risk_label": risk,
+        "severity": severity,
+        "confidence_score": confidence
+    }
+
+
 # ------------------------------
 # Core Prediction Engine
 # ------------------------------
@@ -118,41 +181,67 @@ def predict_drug_risks(
 
     results = []
 
-    profile = PhenotypeProfile(**phenotype_profile).dict()
-
-    drugs = [d.strip().upper()
-             for d in drug_names.split(",") if d.strip()]
-
-    for drug in drugs:
-
-        gene = DRUG_GENE_MAPPING.get(drug)
-
-        phenotype = normalize_pheno(
-            profile.get(gene, "Unknown")
-        ) if gene else "Unknown"
-
-        risk = "Unknown"
-        severity = "none"
-        confidence = CONFIDENCE["unknown"]
-
-        if gene:
-            rule = RISK_RULES.get(drug, {}).get(phenotype)
-
-            if rule:
-                risk, severity = rule
-                confidence = CONFIDENCE["known"]
-            elif phenotype != "Unknown":
-                risk = "Adjust Dosage"
-                severity = "low"
-                confidence = CONFIDENCE["partial"]
-
-        results.append({
-            "drug": drug,
-            "primary_gene": gene or "Unknown",
-            "phenotype": phenotype,
-            "risk_label": risk,
-            "severity": severity,
-            "confidence_score": confidence
-        })
-
-    return results
\ No newline at end of file
+    for drug, drug_id in parse_drugs(drug_names):
+
+        gene = DRUG_GENES[drug_id]
+        phenotype, phenotype_id = _profile_phenotype(phenotype_profile, gene) if gene else ("Unknown", 0)
+
+        results.append(_risk_record(drug, drug_id, phenotype, _RISK_ROWS[drug_id][phenotype_id]))
+
+    return results
+
+
+def predict_drug_risks_many(
+    profiles: List[Dict],
+    drugs: Union[str, List[str]]
+) -> List[List[Dict]]:
+    """
+    predict_drug_risks for a whole cohort against one drug panel.
+
+    Each distinct phenotype value is normalised once per gene, every
+    (profile, drug) outcome comes from one RISK_TABLE gather, and each
+    distinct (drug, phenotype) record is built once and copied per patient.
+
+    Args:
+        profiles: Gene -> phenotype maps, one per patient.
+        drugs: Comma-separated names, or a list of names.
+
+    Returns:
+        One predict_drug_risks result list per profile, in order.
+    """
+    panel = parse_drugs(drugs if isinstance(drugs, str) else ",".join(drugs))
+    if not profiles or not panel:
+        return [[] for _ in profiles]
+
+    # Distinct (phenotype, phenotype_id) keys; key 0 is used for unmapped drugs
+    keys = {("Unknown", 0): 0}
+    key_index = np.zeros((len(profiles), len(panel)), dtype=np.intp)
+    for gene in {DRUG_GENES[drug_id] for _, drug_id in panel} - {None}:
+        values = [profile.get(gene, "Unknown") for profile in profiles]
+        try:
+            distinct = set(values)
+        except TypeError: # unhashable junk in a profile counts as Unknown
+            values = [v if isinstance(v, str) else "" for v in values]
+            distinct = set(values)
+        codes = {v: keys.setdefault(_phenotype_key(v if isinstance(v, str) else ""), len(keys)) for v in distinct}
+        column = np.fromiter(map(codes.__getitem__, values), dtype=np.intp, count=len(values))
+        for j, (_, drug_id) in enumerate(panel):
+            if DRUG_GENES[drug_id] == gene:
+                key_index[:, j] = column
+
+    key_list = list(keys)
+    phenotype_ids = np.array([pid for _, pid in key_list], dtype=np.intp)
+    drug_ids = np.array([drug_id for _, drug_id in panel], dtype=np.intp)
+    outcome_ids = RISK_TABLE[drug_ids[None, :], phenotype_ids[key_index]]
+
+    # One record per distinct (panel column, key); patients get copies
+    combos = np.arange(len(panel)) * len(key_list) + key_index
+    unique_combos, first = np.unique(combos, return_index=True)
+    records = {}
+    for combo, flat in zip(unique_combos.tolist(), first.tolist()):
+        j, k = divmod(combo, len(key_list))
+        i = flat // len(panel)
+        drug, drug_id = panel[j]
+        records[combo] = _risk_record(drug, drug_id, key_list[k][0], int(outcome_ids[i, j]))
+
+    return [[records[c].copy() for c in row] for row in combos.tolist()]
@@ -0,0 +1,242 @@
+"""
+Persistent cache of LLM explanations.
+
+Usage (pre-generate every drug x phenotype explanation offline):
+    GROQ_API_KEY=... python explanation_cache.py warm [--concurrency 4]
+    python explanation_cache.py stats
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from explanation_templates import GROQ_MODEL, PROMPT_VERSION, BATCH_PROMPT_VERSION
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "explanation_cache.sqlite3")
+
+# Eviction runs every N writes rather than on every insert.
+_EVICT_EVERY = 100
+
+Key = Tuple[str, str, str] # (drug, gene, phenotype)
+
+
+class ExplanationCache:
+    """
+    SQLite-backed explanation store keyed by (drug, gene, phenotype, model,
+    prompt_version). Rows written from the per-drug prompt carry
+    prompt_version, rows from the batched prompt batch_prompt_version;
+    lookups accept either. Changing the model or a prompt naturally misses
+    that prompt's old rows. Least-recently-used rows are evicted once
+    max_entries is exceeded.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 20000,
+        model: str = GROQ_MODEL,
+        prompt_version: str = PROMPT_VERSION,
+        batch_prompt_version: str = BATCH_PROMPT_VERSION
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.model = model
+        self.prompt_version = prompt_version
+        self.batch_prompt_version = batch_prompt_version
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            create table if not exists explanations (
+                drug           text not null,
+                gene           text not null,
+                phenotype      text not null,
+                model          text not null,
+                prompt_version text not null,
+                explanation    text not null,
+                created_at     real not null,
+                last_used      real not null,
+                primary key (drug, gene, phenotype, model, prompt_version)
+            )
+            """
+        )
+        self._conn.execute("create index if not exists idx_explanations_last_used on explanations(last_used)")
+
+    def get_many(self, keys: List[Key]) -> Dict[Key, str]:
+        """Looks up several (drug, gene, phenotype) keys in one query."""
+        if not keys:
+            return {}
+        clause = " or ".join(["(drug = ? and gene = ? and phenotype = ?)"] * len(keys))
+        params = [v for key in keys for v in key]
+        with self._lock:
+            # Per-drug rows sort last, so they win when both prompts answered
+            rows = self._conn.execute(
+                f"select drug, gene, phenotype, explanation from explanations "
+                f"where model = ? and prompt_version in (?, ?) and ({clause}) "
+                f"order by prompt_version = ?",
+                [self.model, self.batch_prompt_version, self.prompt_version] + params + [self.prompt_version]
+            ).fetchall()
+            found = {(r[0], r[1], r[2]): r[3] for r in rows}
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "update explanations set last_used = ? where drug = ? and gene = ? and phenotype = ? "
+                    "and model = ? and prompt_version in (?, ?)",
+                    [(now, *key, self.model, self.batch_prompt_version, self.prompt_version) for key in found]
+                )
+            self.hits += len(found)
+            self.misses += len(set(keys)) - len(found)
+        return found
+
+    def put(self, drug: str, gene: str, phenotype: str, explanation: str, batched: bool = False):
+        """Stores an explanation; batched=True for answers to the batched prompt."""
+        now = time.time()
+        prompt_version = self.batch_prompt_version if batched else self.prompt_version
+        with self._lock:
+            self._conn.execute(
+                "insert or replace into explanations values (?, ?, ?, ?, ?, ?, ?, ?)",
+                (drug, gene, phenotype, self.model, prompt_version, explanation, now, now)
+            )
+            self._writes += 1
+            if self._writes % _EVICT_EVERY == 0:
+                self._evict()
+
+    def _evict(self):
+        (count,) = self._conn.execute("select count(*) from explanations").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "delete from explanations where rowid in "
+                "(select rowid from explanations order by last_used asc limit ?)",
+                (excess,)
+            )
+
+    def stats(self) -> Dict:
+        with self._lock:
+            (count,) = self._conn.execute("select count(*) from explanations").fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "entries": count,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "model": self.model,
+                "prompt_version": self.prompt_version,
+                "batch_prompt_version": self.batch_prompt_version
+            }
+
+
+_cache: Optional[ExplanationCache] = None
+_cache_failed = False
+
+
+def explanation_cache_path() -> str:
+    return os.getenv("PHARMAGUARD_EXPLANATION_CACHE", DEFAULT_CACHE_PATH)
+
+
+def get_explanation_cache() -> Optional[ExplanationCache]:
+    """
+    Shared cache, or None if the database can't be opened (read-only FS etc.).
+    Configured from PHARMAGUARD_EXPLANATION_CACHE(_SIZE), read on first use.
+    """
+    global _cache, _cache_failed
+    if _cache is None and not _cache_failed:
+        path = explanation_cache_path()
+        try:
+            _cache = ExplanationCache(path, int(os.getenv("PHARMAGUARD_EXPLANATION_CACHE_SIZE", "20000")))
+        except sqlite3.Error as e:
+            _cache_failed = True
+            logger.warning(f"[ExplanationCache] Disabled, cannot open {path}: {e}")
+    return _cache
+
+
+def explanation_key_space() -> List[Key]:
+    """
+    Every (drug, gene, phenotype) that predict_drug_risks can hand to the
+    explanation stage: each mapped drug crossed with the phenotypes its gene
+    can be called as and its CPIC rules name, plus the unknown phenotype.
+    Phenotypes are normalised exactly as predict_drug_risks does, so the
+    warmed keys are the ones looked up at runtime.
+    """
+    from drug_risk_engine import DRUG_GENE_MAPPING, RISK_RULES, normalize_pheno
+    from phenotype_engine import gene_phenotypes
+
+    keys = []
+    for drug, gene in DRUG_GENE_MAPPING.items():
+        phenotypes = {normalize_pheno(p) for p in gene_phenotypes(gene)}
+        phenotypes.update(RISK_RULES.get(drug, {}))
+        phenotypes.add(normalize_pheno("Unknown"))
+        keys.extend((drug, gene, p) for p in sorted(phenotypes))
+    return keys
+
+
+async def warm(api_key: str, concurrency: int = 4) -> Dict[str, int]:
+    """Generates and stores every missing explanation in the key space."""
+    from explanation_client import AsyncExplanationClient
+
+    cache = get_explanation_cache()
+    if cache is None:
+        raise SystemExit(f"Cannot open explanation cache at {explanation_cache_path()}")
+
+    keys = explanation_key_space()
+    cached = cache.get_many(keys)
+    missing = [k for k in keys if k not in cached]
+    client = AsyncExplanationClient()
+    semaphore = asyncio.Semaphore(concurrency)
+    generated = 0
+
+    async def fill(key: Key):
+        nonlocal generated
+        async with semaphore:
+            text = await client.call_groq(*key, api_key)
+        if text:
+            cache.put(*key, text)
+            generated += 1
+
+    try:
+        await asyncio.gather(*(fill(k) for k in missing))
+    finally:
+        await client.aclose()
+    return {"total": len(keys), "missing": len(missing), "generated": generated}
+
+
+def main():
+    # Same .env as the API: GROQ_API_KEY and PHARMAGUARD_EXPLANATION_CACHE*
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass  # dotenv optional — env vars can be set directly
+
+    parser = argparse.ArgumentParser(description="PharmaGuard explanation cache")
+    sub = parser.add_subparsers(dest="command", required=True)
+    warm_cmd = sub.add_parser("warm", help="pre-generate all drug x phenotype explanations")
+    warm_cmd.add_argument("--concurrency", type=int, default=4)
+    sub.add_parser("stats", help="print cache statistics")
+    args = parser.parse_args()
+
+    if args.command == "warm":
+        api_key = os.getenv("GROQ_API_KEY", "")
+        if not api_key:
+            raise SystemExit("GROQ_API_KEY is required to warm the cache")
+        print(json.dumps(asyncio.run(warm(api_key, args.concurrency)), indent=2))
+    else:
+        cache = get_explanation_cache()
+        print(json.dumps(cache.stats() if cache else {"enabled": False}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
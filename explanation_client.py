@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+from starlette.concurrency import run_in_threadpool
+
+from explanation_templates import (
+    GROQ_API_URL, build_groq_request, build_groq_batch_request, batch_chunks,
+    parse_batch_explanations, get_template_explanation
+)
+from explanation_cache import get_explanation_cache
+
+logger = logging.getLogger(__name__)
+
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_SECONDS = 30.0
+
+
+def groq_settings() -> Tuple[float, int, float]:
+    """
+    (per-call timeout, max_connections, deadline) from the PHARMAGUARD_GROQ_*
+    env vars and PHARMAGUARD_EXPLANATION_DEADLINE, the overall budget for
+    all drugs of one analysis.
+    """
+    return (
+        float(os.getenv("PHARMAGUARD_GROQ_TIMEOUT", "5")),
+        int(os.getenv("PHARMAGUARD_GROQ_MAX_CONNECTIONS", "20")),
+        float(os.getenv("PHARMAGUARD_EXPLANATION_DEADLINE", "6"))
+    )
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    closed    -> calls flow; failure_threshold failures in a row open it.
+    open      -> calls are refused until reset_timeout elapses.
+    half-open -> one trial call; success closes, failure re-opens.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning("[Groq] Circuit opened — serving template explanations")
+            self.opened_at = time.monotonic()
+
+
+class AsyncExplanationClient:
+    """
+    Non-blocking Groq client for per-drug explanations.
+
+    One pooled httpx.AsyncClient (keep-alive, bounded connections) is shared
+    by all requests. explain_many answers from the persistent explanation
+    cache first, then asks for the remaining drugs in batched completions
+    under a deadline; any drug that fails, times out, is malformed, or is
+    short-circuited by the breaker gets its template explanation instead.
+    """
+
+    def __init__(self, breaker: Optional[CircuitBreaker] = None):
+        self.breaker = breaker or CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _http(self) -> httpx.AsyncClient:
+        # httpx pools are tied to the loop that created them
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            timeout, max_connections, _ = groq_settings()
+            self._loop = loop
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(timeout),
+                limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _complete(self, payload: Dict, api_key: str) -> Optional[str]:
+        """One chat completion; returns None (and trips the breaker) on any failure."""
+        if not self.breaker.allow():
+            return None
+        try:
+            response = await self._http().post(
+                GROQ_API_URL,
+                headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
+                json=payload
+            )
+            if response.status_code == 200:
+                text = response.json()["choices"][0]["message"]["content"].strip()
+                self.breaker.record_success()
+                return text
+            logger.warning(f"[Groq] API Error: {response.status_code} - {response.text[:200]}")
+        except asyncio.CancelledError:
+            # Deadline hit: count it so a consistently slow upstream opens the breaker
+            self.breaker.record_failure()
+            raise
+        except Exception as e:
+            logger.warning(f"[Groq] Request failed: {e}")
+        self.breaker.record_failure()
+        return None
+
+    async def call_groq(self, drug: str, gene: str, phenotype: str, api_key: str) -> Optional[str]:
+        """Explanation for a single drug."""
+        return await self._complete(build_groq_request(drug, gene, phenotype), api_key)
+
+    async def call_groq_batch(
+        self,
+        triples: List[Tuple[str, str, str]],
+        api_key: str,
+        deadline: Optional[float] = None
+    ) -> Dict[str, str]:
+        """
+        Explanations for several (drug, gene, phenotype) triples. They are
+        split by batch_chunks and the chunks are requested concurrently;
+        chunks still running at the deadline are cancelled. Drugs missing
+        from, or malformed in, the answers are omitted.
+        """
+        if not triples:
+            return {}
+        chunks = batch_chunks(triples)
+        tasks = [asyncio.ensure_future(self._complete(build_groq_batch_request(c), api_key)) for c in chunks]
+        try:
+            await asyncio.wait(tasks, timeout=deadline)
+        finally:
+            for task in tasks:
+                task.cancel()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        explanations = {}
+        for chunk, content in zip(chunks, results):
+            if isinstance(content, str):
+                explanations.update(parse_batch_explanations(content, [t[0] for t in chunk]))
+        if len(explanations) < len(triples):
+            logger.warning(f"[Groq] Batched answers covered {len(explanations)}/{len(triples)} drugs")
+        return explanations
+
+    async def explain_many(
+        self,
+        risk_assessments: List[Dict],
+        api_key: Optional[str] = None,
+        deadline: Optional[float] = None
+    ) -> Dict[str, str]:
+        """
+        Explanations for every assessment from predict_drug_risks, keyed by drug.
+
+        Drugs not in the explanation cache are sent to Groq in batched
+        prompts of up to GROQ_BATCH_SIZE drugs; each drug the answers don't
+        cover gets its template.
+
+        Args:
+            risk_assessments: Dicts with "drug", "primary_gene", "phenotype".
+            api_key: Groq key; without one only templates are used.
+            deadline: Seconds allowed for the LLM calls (default
+                PHARMAGUARD_EXPLANATION_DEADLINE).
+        """
+        if deadline is None:
+            deadline = groq_settings()[2]
+        explanations = {}
+        # SQLite calls run in the threadpool so disk I/O never blocks the event loop
+        cache = await run_in_threadpool(get_explanation_cache) if api_key else None
+        if cache is not None:
+            cached = await run_in_threadpool(
+                cache.get_many, [(a["drug"], a["primary_gene"], a["phenotype"]) for a in risk_assessments]
+            )
+            for a in risk_assessments:
+                text = cached.get((a["drug"], a["primary_gene"], a["phenotype"]))
+                if text:
+                    explanations[a["drug"]] = text
+
+        missing = {}
+        for a in risk_assessments:
+            if a["drug"] not in explanations:
+                missing[a["drug"]] = (a["drug"], a["primary_gene"], a["phenotype"])
+
+        if missing and api_key and self.breaker.state != "open":
+            generated = await self.call_groq_batch(list(missing.values()), api_key, deadline)
+            explanations.update(generated)
+            if cache is not None and generated:
+                await run_in_threadpool(_store_explanations, cache, [(*missing[drug], text) for drug, text in generated.items()])
+
+        for a in risk_assessments:
+            if a["drug"] not in explanations:
+                explanations[a["drug"]] = get_template_explanation(a["drug"], a["primary_gene"], a["phenotype"])
+        return explanations
+
+def _store_explanations(cache, rows: List[Tuple[str, str, str, str]]):
+    for drug, gene, phenotype, text in rows:
+        cache.put(drug, gene, phenotype, text, batched=True)
+
+
+explanation_client = AsyncExplanationClient()
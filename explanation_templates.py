@@ -1,6 +1,6 @@
 
-from typing import Optional, Dict
-import requests
+from typing import Optional, Dict, List, Tuple
+import json
 
 # Central repository of explanations
 # Key format: "{GENE}_{PHENOTYPE}" or "{DRUG}_{PHENOTYPE}"
@@ -106,30 +106,96 @@ EXPLANATION_TEMPLATES = {
     "DEFAULT": "Genetic variants influence drug metabolism and may require dose adjustment. Consult specific CPIC guidelines for dosing."
 }
 
+GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+GROQ_MODEL = "llama-3.3-70b-versatile"
+# Bump whenever build_groq_request's prompt changes; cached explanations are keyed on it.
+PROMPT_VERSION = "1"
+# Same for build_groq_batch_request; its own namespace so either prompt can change alone.
+BATCH_PROMPT_VERSION = "batch-1"
+# Drugs per batched completion; larger panels are split so each request
+# fits comfortably inside the per-call timeout.
+GROQ_BATCH_SIZE = 5
+
+def build_groq_request(drug: str, gene: str, phenotype: str) -> Dict:
+    """
+    Chat-completion payload for one drug explanation (shared by the sync and async clients).
+    """
+    prompt = f"Explain clearly in 2 simple sentences why the drug {drug} might be risky or ineffective for a patient with the {gene} gene phenotype '{phenotype}'. Focus on the biological mechanism but keep it simple."
+    
+    return {
+        "model": GROQ_MODEL,
+        "messages": [
+            {"role": "system", "content": "You are a helpful clinical assistant. output only the explanation, no preamble."},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": 0.3,
+        "max_tokens": 150
+    }
+
+def build_groq_batch_request(triples: List[Tuple[str, str, str]]) -> Dict:
+    """
+    One chat-completion payload covering every (drug, gene, phenotype) of an analysis.
+    The model is asked for a JSON object keyed by drug name.
+    """
+    lines = "\n".join(f"- {drug}: {gene} gene phenotype '{phenotype}'" for drug, gene, phenotype in triples)
+    prompt = (
+        "For each drug below, explain clearly in 2 simple sentences why it might be risky or ineffective "
+        "for a patient with the given gene phenotype. Focus on the biological mechanism but keep it simple.\n"
+        f"{lines}\n"
+        'Respond with a JSON object mapping each drug name exactly as written to its explanation, '
+        'e.g. {"DRUG": "explanation"}.'
+    )
+
+    return {
+        "model": GROQ_MODEL,
+        "messages": [
+            {"role": "system", "content": "You are a helpful clinical assistant. output only valid JSON, no preamble."},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": 0.3,
+        "max_tokens": 150 * len(triples),
+        "response_format": {"type": "json_object"}
+    }
+
+def batch_chunks(triples: List[Tuple[str, str, str]]) -> List[List[Tuple[str, str, str]]]:
+    """
+    Splits triples into GROQ_BATCH_SIZE-sized groups, one batched request each.
+    """
+    return [triples[i:i + GROQ_BATCH_SIZE] for i in range(0, len(triples), GROQ_BATCH_SIZE)]
+
+def parse_batch_explanations(content: str, drugs: List[str]) -> Dict[str, str]:
+    """
+    Per-drug explanations out of a batched completion. Drugs that are missing,
+    empty or not a string are left out so callers can fall back individually.
+    """
+    try:
+        data = json.loads(content)
+    except (TypeError, ValueError):
+        return {}
+    if not isinstance(data, dict):
+        return {}
+
+    by_name = {str(k).strip().upper(): v for k, v in data.items()}
+    explanations = {}
+    for drug in drugs:
+        text = by_name.get(drug.upper())
+        if isinstance(text, str) and text.strip():
+            explanations[drug] = text.strip()
+    return explanations
+
 def call_groq_api(drug: str, gene: str, phenotype: str, api_key: str) -> Optional[str]:
     """
     Calls Groq API to generate a patient-friendly explanation.
     """
+    import requests # sync client is only needed off the event loop (batch workers)
+
     try:
-        url = "https://api.groq.com/openai/v1/chat/completions"
         headers = {
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json"
         }
         
-        prompt = f"Explain clearly in 2 simple sentences why the drug {drug} might be risky or ineffective for a patient with the {gene} gene phenotype '{phenotype}'. Focus on the biological mechanism but keep it simple."
-        
-        data = {
-            "model": "llama-3.3-70b-versatile",
-            "messages": [
-                {"role": "system", "content": "You are a helpful clinical assistant. output only the explanation, no preamble."},
-                {"role": "user", "content": prompt}
-            ],
-            "temperature": 0.3,
-            "max_tokens": 150
-        }
-        
-        response = requests.post(url, headers=headers, json=data, timeout=5)
+        response = requests.post(GROQ_API_URL, headers=headers, json=build_groq_request(drug, gene, phenotype), timeout=5)
         
         if response.status_code == 200:
             content = response.json()
@@ -142,6 +208,33 @@ def call_groq_api(drug: str, gene: str, phenotype: str, api_key: str) -> Optiona
         print(f"Groq Request Failed: {e}")
         return None
 
+def call_groq_batch_api(triples: List[Tuple[str, str, str]], api_key: str) -> Dict[str, str]:
+    """
+    Calls Groq once per batch_chunks group; returns whichever drugs parsed cleanly.
+    """
+    if not triples:
+        return {}
+    import requests
+
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+    explanations = {}
+    for chunk in batch_chunks(triples):
+        try:
+            response = requests.post(GROQ_API_URL, headers=headers, json=build_groq_batch_request(chunk), timeout=10)
+
+            if response.status_code == 200:
+                content = response.json()["choices"][0]["message"]["content"]
+                explanations.update(parse_batch_explanations(content, [t[0] for t in chunk]))
+            else:
+                print(f"Groq API Error: {response.status_code} - {response.text}")
+
+        except Exception as e:
+            print(f"Groq Request Failed: {e}")
+    return explanations
+
 def get_explanation(drug: str, gene: str, phenotype: str, api_key: Optional[str] = None) -> str:
     """
     Retrieves a deterministic explanation or uses LLM if key is provided.
@@ -154,17 +247,23 @@ def get_explanation(drug: str, gene: str, phenotype: str, api_key: Optional[str]
             return llm_explanation
         # Fallback to templates if LLM fails
         
-    # 2. Try Drug-Phenotype Key
+    return get_template_explanation(drug, gene, phenotype)
+
+def get_template_explanation(drug: str, gene: str, phenotype: str) -> str:
+    """
+    Deterministic explanation from EXPLANATION_TEMPLATES (no network).
+    """
+    # 1. Try Drug-Phenotype Key
     drug_key = f"{drug.upper()}_{phenotype}"
     if drug_key in EXPLANATION_TEMPLATES:
         return EXPLANATION_TEMPLATES[drug_key]
         
-    # 3. Try Gene-Phenotype Key
+    # 2. Try Gene-Phenotype Key
     gene_key = f"{gene.upper()}_{phenotype}"
     if gene_key in EXPLANATION_TEMPLATES:
         return EXPLANATION_TEMPLATES[gene_key]
         
-    # 4. Handle specific formatting differences
+    # 3. Handle specific formatting differences
     if gene == "SLCO1B1":
          if "PM" in phenotype or "Low" in phenotype:
               if drug.upper() == "SIMVASTATIN":
@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useRef } from 'react';
+import React, { useState, useEffect, useLayoutEffect, useRef } from 'react';
 import { useChat } from '../context/ChatContext';
 import { useAuth } from '../context/AuthContext';
 import { Send, Wifi, WifiOff, MessageCircle, X } from 'lucide-react';
@@ -11,9 +11,12 @@ interface ChatWindowProps {
 
 export const ChatWindow: React.FC<ChatWindowProps> = ({ receiverId, receiverName, onClose }) => {
     const { user } = useAuth();
-    const { messages, sendMessage, loadHistory, connected, markRead } = useChat();
+    const { messages, sendMessage, loadHistory, loadOlder, hasOlder, connected, markRead } = useChat();
     const [input, setInput] = useState('');
     const bottomRef = useRef<HTMLDivElement>(null);
+    const scrollRef = useRef<HTMLDivElement>(null);
+    // Scroll height before an older page was requested, to keep the view in place once it lands
+    const prependHeight = useRef<number | null>(null);
 
     // Filter messages for this conversation
     const convoMessages = messages.filter(m =>
@@ -27,11 +30,39 @@ export const ChatWindow: React.FC<ChatWindowProps> = ({ receiverId, receiverName
         markRead();
     }, [receiverId]);
 
-    // Auto-scroll to bottom on new messages
+    // Auto-scroll to bottom on new messages (not when older ones are prepended)
+    const newestId = convoMessages.length ? convoMessages[convoMessages.length - 1].id : null;
     useEffect(() => {
         bottomRef.current?.scrollIntoView({ behavior: 'smooth' });
+    }, [newestId]);
+
+    // Older page arrived: shift by the added height so the visible messages stay put
+    useLayoutEffect(() => {
+        const el = scrollRef.current;
+        if (el && prependHeight.current !== null) {
+            el.scrollTop += el.scrollHeight - prependHeight.current;
+            prependHeight.current = null;
+        }
     }, [convoMessages.length]);
 
+    const handleLoadOlder = () => {
+        if (!hasOlder(receiverId) || prependHeight.current !== null) return;
+        prependHeight.current = scrollRef.current?.scrollHeight ?? null;
+        loadOlder(receiverId).then(added => {
+            // Nothing was added (e.g. request failed): drop the pending anchor
+            if (added === 0) prependHeight.current = null;
+        });
+    };
+
+    // Scrolled up to the top: fetch the next older page
+    const lastScrollTop = useRef(0);
+    const handleScroll = () => {
+        const el = scrollRef.current;
+        if (!el) return;
+        if (el.scrollTop < 40 && el.scrollTop < lastScrollTop.current) handleLoadOlder();
+        lastScrollTop.current = el.scrollTop;
+    };
+
     const handleSend = () => {
         if (!input.trim()) return;
         sendMessage(receiverId, input.trim());
@@ -75,7 +106,12 @@ export const ChatWindow: React.FC<ChatWindowProps> = ({ receiverId, receiverName
             </div>
 
             {/* Messages Area */}
-            <div className="flex-1 overflow-y-auto px-5 py-4 space-y-3" style={{ minHeight: '300px', maxHeight: '450px' }}>
+            <div ref={scrollRef} onScroll={handleScroll} className="flex-1 overflow-y-auto px-5 py-4 space-y-3" style={{ minHeight: '300px', maxHeight: '450px' }}>
+                {hasOlder(receiverId) && (
+                    <button onClick={handleLoadOlder} className="block mx-auto text-[11px] font-semibold text-biotech-purple hover:underline">
+                        Load earlier messages
+                    </button>
+                )}
                 {convoMessages.length === 0 && (
                     <div className="flex flex-col items-center justify-center h-full text-center py-12">
                         <div className="w-14 h-14 rounded-3xl bg-gradient-to-br from-biotech-purple/10 to-biotech-blue/10 flex items-center justify-center mb-4">
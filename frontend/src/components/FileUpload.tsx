@@ -21,7 +21,7 @@ export const FileUpload: React.FC<FileUploadProps> = ({ onFileSelect, selectedFi
 
     const validate = (file: File) => {
         setError(null);
-        if (!file.name.toLowerCase().endsWith('.vcf')) { setError("Only .vcf files are accepted."); return; }
+        if (!/\.vcf(\.b?gz)?$/.test(file.name.toLowerCase())) { setError("Only .vcf or .vcf.gz files are accepted."); return; }
         if (file.size > MAX_SIZE_MB * 1024 * 1024) { setError(`File must be under ${MAX_SIZE_MB}MB.`); return; }
         onFileSelect(file);
     };
@@ -49,7 +49,7 @@ export const FileUpload: React.FC<FileUploadProps> = ({ onFileSelect, selectedFi
                     onDragEnter={handleDrag} onDragLeave={handleDrag} onDragOver={handleDrag} onDrop={handleDrop}
                     onClick={() => document.getElementById('vcf-upload')?.click()}
                 >
-                    <input type="file" id="vcf-upload" className="hidden" accept=".vcf" onChange={handleChange} />
+                    <input type="file" id="vcf-upload" className="hidden" accept=".vcf,.gz,.bgz" onChange={handleChange} />
                     <div className={`w-14 h-14 rounded-2xl flex items-center justify-center mb-4 transition-all ${dragActive ? 'bg-biotech-purple/10' : 'bg-slate-100'}`}>
                         <Upload className={`h-6 w-6 ${dragActive ? 'text-biotech-purple' : 'text-slate-400'}`} />
                     </div>
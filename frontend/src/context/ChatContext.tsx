@@ -14,6 +14,8 @@ interface ChatContextType {
     messages: ChatMessage[];
     sendMessage: (receiverId: string, text: string) => void;
     loadHistory: (receiverId: string) => Promise<void>;
+    loadOlder: (receiverId: string) => Promise<number>;
+    hasOlder: (receiverId: string) => boolean;
     connected: boolean;
     unreadCount: number;
     markRead: () => void;
@@ -23,6 +25,8 @@ const ChatContext = createContext<ChatContextType>({
     messages: [],
     sendMessage: () => { },
     loadHistory: async () => { },
+    loadOlder: async () => 0,
+    hasOlder: () => false,
     connected: false,
     unreadCount: 0,
     markRead: () => { },
@@ -30,6 +34,9 @@ const ChatContext = createContext<ChatContextType>({
 
 export const useChat = () => useContext(ChatContext);
 
+/** Messages per history request; matches the backend's CHAT_PAGE_SIZE */
+const CHAT_PAGE_SIZE = 50;
+
 /** Merge new messages into existing list — no duplicates, sorted by time */
 const mergeMessages = (existing: ChatMessage[], incoming: ChatMessage[]): ChatMessage[] => {
     const map = new Map(existing.map(m => [m.id, m]));
@@ -47,6 +54,11 @@ export const ChatProvider = ({ children }: { children: ReactNode }) => {
     const socketRef = useRef<WebSocket | null>(null);
     // Track which conversations have already been loaded so we don't reload on re-open
     const loadedConversations = useRef<Set<string>>(new Set());
+    // Per conversation: created_at of the oldest message fetched (the `before` cursor)
+    const oldestLoaded = useRef<Map<string, string>>(new Map());
+    const loadingOlder = useRef<Set<string>>(new Set());
+    // Conversations whose history may still have older pages on the server
+    const [moreHistory, setMoreHistory] = useState<Record<string, boolean>>({});
     // Track the previous user id — only reset state when a DIFFERENT user logs in,
     // NOT when the same user's WebSocket temporarily drops and reconnects.
     const prevUserIdRef = useRef<string | null>(null);
@@ -62,6 +74,8 @@ export const ChatProvider = ({ children }: { children: ReactNode }) => {
         if (prevUserIdRef.current !== userId) {
             prevUserIdRef.current = userId;
             loadedConversations.current.clear();
+            oldestLoaded.current.clear();
+            setMoreHistory({});
             setMessages([]);
         }
 
@@ -76,6 +90,11 @@ export const ChatProvider = ({ children }: { children: ReactNode }) => {
         ws.onmessage = (event) => {
             try {
                 const data = JSON.parse(event.data);
+                // Heartbeat: the server closes sockets that stay silent past its idle timeout
+                if (data.type === 'ping') {
+                    ws.send('pong');
+                    return;
+                }
                 if (data.type === 'new_message') {
                     const msg: ChatMessage = data.message;
                     setMessages(prev => mergeMessages(prev, [msg]));
@@ -95,25 +114,55 @@ export const ChatProvider = ({ children }: { children: ReactNode }) => {
         return () => { ws.close(); };
     }, [userId]); // depend on userId (primitive string), not the whole user object
 
-    // ── Load history (only once per conversation) ──────────────────────
+    // ── Load history (latest page once per conversation, older pages on demand) ──
+    /** Fetches one page (the latest, or the one before `before`); returns how many messages it held */
+    const fetchPage = useCallback(async (receiverId: string, before?: string): Promise<number> => {
+        if (!user) return 0;
+        const params = new URLSearchParams({ limit: String(CHAT_PAGE_SIZE) });
+        if (before) params.set('before', before);
+
+        const res = await fetch(`/api/chat/${receiverId}?${params}`, {
+            headers: { 'x-user-id': user.id }
+        });
+        if (!res.ok) return 0;
+        const data: ChatMessage[] = await res.json();
+        // Pages come oldest first, so data[0] is the next cursor
+        if (data.length > 0) oldestLoaded.current.set(receiverId, data[0].created_at);
+        setMoreHistory(prev => ({ ...prev, [receiverId]: data.length === CHAT_PAGE_SIZE }));
+        // MERGE — don't overwrite (preserves optimistic + real-time messages)
+        setMessages(prev => mergeMessages(prev, data));
+        return data.length;
+    }, [userId]);
+
     const loadHistory = useCallback(async (receiverId: string) => {
         if (!user) return;
         if (loadedConversations.current.has(receiverId)) return; // already loaded
         loadedConversations.current.add(receiverId);
 
         try {
-            const res = await fetch(`/api/chat/${receiverId}`, {
-                headers: { 'x-user-id': user.id }
-            });
-            if (res.ok) {
-                const data: ChatMessage[] = await res.json();
-                // MERGE — don't overwrite (preserves optimistic + real-time messages)
-                setMessages(prev => mergeMessages(prev, data));
-            }
+            await fetchPage(receiverId);
         } catch (err) {
             console.error('[Chat] Failed to load history:', err);
         }
-    }, [userId]);
+    }, [userId, fetchPage]);
+
+    const loadOlder = useCallback(async (receiverId: string): Promise<number> => {
+        const before = oldestLoaded.current.get(receiverId);
+        if (!user || !before || !moreHistory[receiverId]) return 0;
+        if (loadingOlder.current.has(receiverId)) return 0; // a page is already on its way
+        loadingOlder.current.add(receiverId);
+
+        try {
+            return await fetchPage(receiverId, before);
+        } catch (err) {
+            console.error('[Chat] Failed to load older messages:', err);
+            return 0;
+        } finally {
+            loadingOlder.current.delete(receiverId);
+        }
+    }, [userId, fetchPage, moreHistory]);
+
+    const hasOlder = useCallback((receiverId: string) => !!moreHistory[receiverId], [moreHistory]);
 
     // ── Send a message ──────────────────────────────────────────────────
     const sendMessage = useCallback((receiverId: string, text: string) => {
@@ -155,7 +204,7 @@ export const ChatProvider = ({ children }: { children: ReactNode }) => {
     const markRead = useCallback(() => setUnreadCount(0), []);
 
     return (
-        <ChatContext.Provider value={{ messages, sendMessage, loadHistory, connected, unreadCount, markRead }}>
+        <ChatContext.Provider value={{ messages, sendMessage, loadHistory, loadOlder, hasOlder, connected, unreadCount, markRead }}>
             {children}
         </ChatContext.Provider>
     );
@@ -85,9 +85,10 @@ export const DoctorDashboard = () => {
     const downloadReport = async () => {
         if (!results) return;
         try {
-            const response = await axios.post('/api/generate-report', { results: results.results }, {
-                responseType: 'blob'
-            });
+            // Stored analyses are fetched by id; older saved results are posted back
+            const response = results.analysis_id
+                ? await axios.get(`/api/analyses/${results.analysis_id}/report.pdf`, { responseType: 'blob' })
+                : await axios.post('/api/generate-report', { results: results.results }, { responseType: 'blob' });
             const url = window.URL.createObjectURL(new Blob([response.data]));
             const link = document.createElement('a');
             link.href = url;
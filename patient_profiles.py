@@ -0,0 +1,128 @@
+import datetime
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from supabase_client import supabase
+
+logger = logging.getLogger(__name__)
+
+# Only what the risk/explanation/formatting stages read from vcf_result is
+# persisted. genetic_profile keeps each gene's detected_variants (the report
+# lists them); file-level counts, warnings and cohort sample_profiles stay out.
+_STORED_KEYS = ("valid", "vcf_version", "genes_detected", "genetic_profile")
+
+
+class PatientProfileStore:
+    """
+    Computed genetic profiles per patient, so drug-only risk queries never
+    need the VCF again.
+
+    Reads are served from a bounded in-process map; Supabase's
+    patient_profiles table is the durable copy shared across workers. With
+    Supabase configured, in-memory entries older than ttl seconds are
+    re-read from it, so a profile re-saved through another worker is picked
+    up here; without it the map is the only copy and never expires.
+
+    max_entries and ttl default to PHARMAGUARD_PATIENT_PROFILE_CACHE_SIZE and
+    PHARMAGUARD_PATIENT_PROFILE_CACHE_TTL, read on first use.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, ttl: Optional[float] = None):
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._profiles: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict() # patient_id -> (cached_at, record)
+        self._lock = threading.Lock()
+
+    @property
+    def max_entries(self) -> int:
+        if self._max_entries is None:
+            return int(os.getenv("PHARMAGUARD_PATIENT_PROFILE_CACHE_SIZE", "10000"))
+        return self._max_entries
+
+    @property
+    def ttl(self) -> float:
+        if self._ttl is None:
+            return float(os.getenv("PHARMAGUARD_PATIENT_PROFILE_CACHE_TTL", "60"))
+        return self._ttl
+
+    async def save(self, patient_id: str, vcf_result: Dict) -> Dict:
+        """Stores the profile part of a process_vcf_file result for patient_id."""
+        record = {k: vcf_result[k] for k in _STORED_KEYS if k in vcf_result}
+        record["updated_at"] = datetime.datetime.utcnow().isoformat() + "Z"
+        self._remember(patient_id, record)
+
+        if supabase.configured:
+            try:
+                await supabase.insert(
+                    "patient_profiles",
+                    {"patient_id": patient_id, "profile": record, "updated_at": record["updated_at"]},
+                    upsert=True
+                )
+            except Exception as e:
+                logger.warning(f"[Profiles] Supabase save failed: {e}")
+        return record
+
+    async def load(self, patient_id: str) -> Optional[Dict]:
+        """Returns the stored record for patient_id, or None if never analysed."""
+        record = None
+        with self._lock:
+            entry = self._profiles.get(patient_id)
+            if entry is not None:
+                self._profiles.move_to_end(patient_id)
+                cached_at, record = entry
+                if not supabase.configured or time.monotonic() - cached_at < self.ttl:
+                    return record
+
+        if not supabase.configured:
+            return None
+        try:
+            rows = await supabase.select(
+                "patient_profiles",
+                {"patient_id": f"eq.{patient_id}", "select": "profile", "limit": "1"}
+            )
+        except Exception as e:
+            # Serve the expired copy rather than nothing while Supabase is down
+            logger.warning(f"[Profiles] Supabase load failed: {e}")
+            return record
+
+        if not rows:
+            # e.g. the save's Supabase write failed; keep serving this worker's copy
+            return record
+        record = rows[0]["profile"]
+        self._remember(patient_id, record)
+        return record
+
+    def _remember(self, patient_id: str, record: Dict):
+        with self._lock:
+            self._profiles[patient_id] = (time.monotonic(), record)
+            self._profiles.move_to_end(patient_id)
+            max_entries = self.max_entries
+            while len(self._profiles) > max_entries:
+                self._profiles.popitem(last=False)
+
+
+async def can_access_patient(user_id: str, patient_id: str) -> bool:
+    """
+    True if user_id may read or replace patient_id's stored profile: the
+    patient themselves, or a doctor linked to them in doctor_patients.
+    """
+    if user_id == patient_id:
+        return True
+    if not supabase.configured:
+        return False
+    try:
+        rows = await supabase.select(
+            "doctor_patients",
+            {"doctor_id": f"eq.{user_id}", "patient_id": f"eq.{patient_id}", "select": "doctor_id", "limit": "1"}
+        )
+    except Exception as e:
+        logger.warning(f"[Profiles] Access check failed: {e}")
+        return False
+    return bool(rows)
+
+
+patient_profiles = PatientProfileStore()
@@ -1,42 +1,178 @@
 import json
 import os
+from typing import Dict, List, Tuple
+
+import numpy as np
 
 # Load phenotype data
-DATA_FILE = "gene_phenotypes.json"
+DATA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gene_phenotypes.json")
 PHENOTYPE_DATA = {}
 
+# ── Allele function (CPIC activity values) ──────────────────────────────
+# Any diplotype whose two alleles both have a value here is called from the
+# sum of those values; this is the source of truth, and the curated
+# gene_phenotypes.json entries only cover alleles missing from it.
+# CYP2C19 and SLCO1B1 have no CPIC activity score; their function
+# categories are encoded on the same scale (increased 1.5, normal 1, no
+# function 0).
+ALLELE_ACTIVITY: Dict[str, Dict[str, float]] = {
+    "CYP2D6": {
+        "*1": 1, "*2": 1, "*35": 1,
+        "*9": 0.5, "*14": 0.5, "*17": 0.5, "*29": 0.5, "*41": 0.5,
+        "*10": 0.25,
+        "*3": 0, "*4": 0, "*5": 0, "*6": 0, "*7": 0, "*8": 0,
+        "*11": 0, "*12": 0, "*13": 0, "*15": 0, "*36": 0,
+        "*1xN": 2, "*2xN": 2, "*35xN": 2, "*41xN": 1, "*10xN": 0.5, "*4xN": 0,
+    },
+    "CYP2C19": {
+        "*1": 1, "*17": 1.5,
+        "*2": 0, "*3": 0, "*4": 0, "*5": 0, "*6": 0, "*7": 0, "*8": 0,
+    },
+    "CYP2C9": {
+        "*1": 1,
+        "*2": 0.5, "*5": 0.5, "*8": 0.5, "*11": 0.5, "*12": 0.5,
+        "*3": 0, "*6": 0, "*13": 0,
+    },
+    "SLCO1B1": {
+        "*1": 1, "*1B": 1,
+        "*5": 0, "*15": 0, "*17": 0,
+    },
+    "TPMT": {
+        "*1": 1,
+        "*2": 0, "*3A": 0, "*3B": 0, "*3C": 0, "*4": 0,
+    },
+    "DPYD": {
+        "*1": 1, "*9A": 1,
+        "*2A": 0, "*13": 0,
+    },
+}
+
+# Per gene: (upper bound of the activity score, phenotype), checked in order
+ACTIVITY_THRESHOLDS: Dict[str, List[Tuple[float, str]]] = {
+    "CYP2D6": [(0, "PM"), (1, "IM"), (2.25, "NM"), (float("inf"), "UM")],
+    "CYP2C19": [(0.5, "PM"), (1.5, "IM"), (2, "NM"), (2.5, "RM"), (float("inf"), "UM")],
+    "CYP2C9": [(0.5, "PM"), (1.5, "IM"), (float("inf"), "NM")],
+    "SLCO1B1": [(0, "PM"), (1, "IM"), (float("inf"), "NM")],
+    "TPMT": [(0, "PM"), (1, "IM"), (float("inf"), "NM")],
+    "DPYD": [(0.5, "PM"), (1.5, "IM"), (float("inf"), "NM")],
+}
+
+# ── Compiled tables ─────────────────────────────────────────────────────
+# Phenotypes and alleles are integer coded; code 0 is "Unknown" / an
+# allele the gene's tables do not know. PHENOTYPE_MATRIX[gene][a, b] is
+# the phenotype code of diplotype a/b (symmetric).
+PHENOTYPES: List[str] = ["Unknown", "PM", "IM", "NM", "RM", "UM"]
+PHENOTYPE_CODES: Dict[str, int] = {p: i for i, p in enumerate(PHENOTYPES)}
+
+ALLELE_CODES: Dict[str, Dict[str, int]] = {}
+PHENOTYPE_MATRIX: Dict[str, np.ndarray] = {}
+
+
+def activity_phenotype(gene: str, score: float) -> str:
+    """Phenotype for a diplotype activity score (sum of both allele values)."""
+    for upper, phenotype in ACTIVITY_THRESHOLDS[gene]:
+        if score <= upper:
+            return phenotype
+    return "Unknown"
+
+
+def _phenotype_code(phenotype: str) -> int:
+    if phenotype not in PHENOTYPE_CODES:
+        PHENOTYPE_CODES[phenotype] = len(PHENOTYPES)
+        PHENOTYPES.append(phenotype)
+    return PHENOTYPE_CODES[phenotype]
+
+
+def compile_phenotype_matrices(data: Dict[str, Dict[str, str]]):
+    """
+    Builds ALLELE_CODES and PHENOTYPE_MATRIX.
+
+    Every pair of alleles with activity values is called from the score,
+    so diplotypes with the same activity always agree. Curated knowledge
+    base entries fill in only the pairs that involve an allele without an
+    activity value (in both allele orders; where both orders are listed,
+    each keeps its own).
+    """
+    allele_codes, matrices = {}, {}
+    for gene in sorted(set(ALLELE_ACTIVITY) | set(data)):
+        activity = ALLELE_ACTIVITY.get(gene, {})
+        curated = data.get(gene, {})
+
+        alleles = list(activity)
+        for diplotype in curated:
+            for allele in diplotype.split("/"):
+                if allele not in alleles:
+                    alleles.append(allele)
+        codes = {allele: i + 1 for i, allele in enumerate(alleles)}
+
+        matrix = np.zeros((len(alleles) + 1, len(alleles) + 1), dtype=np.int8)
+        if gene in ACTIVITY_THRESHOLDS:
+            for a, score_a in activity.items():
+                for b, score_b in activity.items():
+                    matrix[codes[a], codes[b]] = _phenotype_code(activity_phenotype(gene, score_a + score_b))
+        scored = activity if gene in ACTIVITY_THRESHOLDS else {}
+        curated_pairs = [
+            (parts, phenotype) for parts, phenotype in ((d.split("/"), p) for d, p in curated.items())
+            if len(parts) == 2 and not (parts[0] in scored and parts[1] in scored)
+        ]
+        for parts, phenotype in curated_pairs:
+            matrix[codes[parts[1]], codes[parts[0]]] = _phenotype_code(phenotype)
+        for parts, phenotype in curated_pairs:
+            matrix[codes[parts[0]], codes[parts[1]]] = _phenotype_code(phenotype)
+
+        allele_codes[gene] = codes
+        matrices[gene] = matrix
+    return allele_codes, matrices
+
+
 def load_data():
-    global PHENOTYPE_DATA
+    global PHENOTYPE_DATA, ALLELE_CODES, PHENOTYPE_MATRIX
     if os.path.exists(DATA_FILE):
         with open(DATA_FILE, "r") as f:
             PHENOTYPE_DATA = json.load(f)
+    ALLELE_CODES, PHENOTYPE_MATRIX = compile_phenotype_matrices(PHENOTYPE_DATA)
 
 load_data()
 
 def get_phenotype(gene: str, diplotype: str) -> str:
     """
     Maps a gene and diplotype to a clinical phenotype.
-    
+
     Args:
         gene: e.g. "CYP2D6"
-        diplotype: e.g. "*4/*4" or "*1/*4"
-        
+        diplotype: e.g. "*4/*4" or "*1/*4" (allele order does not matter)
+
     Returns:
         Phenotype string (e.g. "PM", "IM") or "Unknown"
     """
-    if gene not in PHENOTYPE_DATA:
+    matrix = PHENOTYPE_MATRIX.get(gene)
+    alleles = diplotype.split("/")
+    if matrix is None or len(alleles) != 2:
         return "Unknown"
-        
-    # Try exact match
-    if diplotype in PHENOTYPE_DATA[gene]:
-        return PHENOTYPE_DATA[gene][diplotype]
-        
-    # Try reverse order (*1/*4 vs *4/*1) just in case
-    # My builder standardizes it, but safety check.
-    parts = diplotype.split("/")
-    if len(parts) == 2:
-        reversed_dip = f"{parts[1]}/{parts[0]}"
-        if reversed_dip in PHENOTYPE_DATA[gene]:
-            return PHENOTYPE_DATA[gene][reversed_dip]
-            
-    return "Unknown"
+    codes = ALLELE_CODES[gene]
+    return PHENOTYPES[matrix[codes.get(alleles[0], 0), codes.get(alleles[1], 0)]]
+
+
+def gene_phenotypes(gene: str) -> List[str]:
+    """Every phenotype some diplotype of gene is called as (Unknown excluded)."""
+    matrix = PHENOTYPE_MATRIX.get(gene)
+    if matrix is None:
+        return []
+    return [PHENOTYPES[code] for code in np.unique(matrix).tolist() if code]
+
+
+def encode_alleles(gene: str, alleles: List[str]) -> np.ndarray:
+    """Allele names -> int codes for gene (0 for alleles the tables do not know)."""
+    codes = ALLELE_CODES.get(gene, {})
+    return np.fromiter((codes.get(a, 0) for a in alleles), dtype=np.int16, count=len(alleles))
+
+
+def phenotype_codes(gene: str, allele_a: np.ndarray, allele_b: np.ndarray) -> np.ndarray:
+    """
+    Vectorised lookup: phenotype codes (indices into PHENOTYPES) for the
+    diplotypes allele_a[i]/allele_b[i], as produced by encode_alleles.
+    """
+    matrix = PHENOTYPE_MATRIX.get(gene)
+    if matrix is None:
+        return np.zeros(np.shape(allele_a), dtype=np.int8)
+    return matrix[allele_a, allele_b]
@@ -0,0 +1,172 @@
+import copy
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import BinaryIO, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Bump when the shape of process_vcf_stream's result or the phenotype
+# calling (phenotype_engine's allele tables) changes, so stale
+# on-disk entries are never served with the new code.
+PROFILE_SCHEMA_VERSION = "3"
+
+_KB_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gene_phenotypes.json")
+
+
+def knowledge_base_version() -> str:
+    """
+    Short fingerprint of the phenotype knowledge base plus result schema.
+    Editing gene_phenotypes.json changes every cache key automatically.
+    """
+    h = hashlib.sha256(PROFILE_SCHEMA_VERSION.encode())
+    try:
+        with open(_KB_FILE, "rb") as f:
+            h.update(f.read())
+    except OSError:
+        pass
+    return h.hexdigest()[:12]
+
+
+KB_VERSION = knowledge_base_version()
+
+
+def digest_fileobj(fileobj: BinaryIO, chunk_size: int = 1024 * 1024) -> str:
+    """SHA-256 of a seekable binary file; the position is rewound to 0 afterwards."""
+    fileobj.seek(0)
+    h = hashlib.sha256()
+    for chunk in iter(lambda: fileobj.read(chunk_size), b""):
+        h.update(chunk)
+    fileobj.seek(0)
+    return h.hexdigest()
+
+
+def profile_cache_key(vcf_digest: str, extension: str) -> str:
+    """
+    Key for a validated upload: content digest, the accepted extension it
+    was validated under (see vcf_processor.vcf_extension) and KB_VERSION.
+    Callers only look up files whose name passes the extension check, so a
+    hit never skips validation a miss would have run.
+    """
+    return f"{vcf_digest}-{extension.lstrip('.')}-{KB_VERSION}"
+
+
+class ProfileCache:
+    """
+    Two-tier cache for validated VCF results (incl. genetic_profile).
+
+    Tier 1 is a bounded in-process LRU. Tier 2 is an optional directory of
+    JSON files with a TTL, shared between workers and restarts. Values are
+    deep-copied in and out so callers can't mutate cached entries.
+    """
+
+    def __init__(self, max_entries: int = 256, disk_dir: Optional[str] = None, ttl_seconds: int = 7 * 24 * 3600):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir or None
+        self.ttl_seconds = ttl_seconds
+        self._memory: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return copy.deepcopy(value)
+
+        value = self._disk_get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, value)
+        return copy.deepcopy(value)
+
+    def put(self, key: str, value: Dict):
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._remember(key, value)
+        self._disk_put(key, value)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                "disk_enabled": bool(self.disk_dir),
+                "kb_version": KB_VERSION
+            }
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+
+    def _remember(self, key: str, value: Dict):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _disk_get(self, key: str) -> Optional[Dict]:
+        if not self.disk_dir:
+            return None
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl_seconds:
+                os.remove(path)
+                return None
+            with open(path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _disk_put(self, key: str, value: Dict):
+        if not self.disk_dir:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "w") as f:
+                json.dump(value, f)
+            os.replace(tmp_path, path) # atomic, so readers never see half a file
+        except OSError as e:
+            logger.warning(f"[ProfileCache] Disk write failed: {e}")
+
+
+_cache: Optional[ProfileCache] = None
+
+
+def get_profile_cache() -> ProfileCache:
+    """
+    Process-wide cache configured from PHARMAGUARD_PROFILE_CACHE_* env vars
+    (read on first use).
+    """
+    global _cache
+    if _cache is None:
+        _cache = ProfileCache(
+            int(os.getenv("PHARMAGUARD_PROFILE_CACHE_SIZE", "256")),
+            os.getenv("PHARMAGUARD_PROFILE_CACHE_DIR", ""),
+            int(os.getenv("PHARMAGUARD_PROFILE_CACHE_TTL", str(7 * 24 * 3600)))
+        )
+    return _cache
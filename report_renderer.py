@@ -0,0 +1,271 @@
+import asyncio
+import datetime
+import functools
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+# ── Rendering (report worker processes, or a thread without a pool) ─────
+# reportlab is imported here rather than at module level: the API process
+# only hashes and caches payloads, so it never pays for the import.
+
+@functools.lru_cache(maxsize=None)
+def _styles():
+    # getSampleStyleSheet builds ~30 ParagraphStyles; do it once per process
+    from reportlab.lib.styles import getSampleStyleSheet
+    return getSampleStyleSheet()
+
+
+@functools.lru_cache(maxsize=None)
+def _risk_table_style(color_name: str):
+    # Color the Risk Label; one shared TableStyle per colour
+    from reportlab.lib import colors
+    from reportlab.platypus import TableStyle
+    return TableStyle([
+        ('BACKGROUND', (0, 0), (0, 3), colors.whitesmoke),
+        ('TEXTCOLOR', (0, 0), (0, 3), colors.black),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+        ('TEXTCOLOR', (1, 0), (1, 0), getattr(colors, color_name)),
+    ])
+
+
+def _risk_color_name(label: str) -> str:
+    label = label.upper()
+    if label in ["TOXIC", "INEFFECTIVE", "HIGH"]:
+        return "red"
+    if label == "ADJUST DOSAGE" or label == "MODERATE":
+        return "orange"
+    return "green"
+
+
+def render_report_pdf(results: List[Dict], generated_at: str) -> bytes:
+    """
+    Builds the PharmaGuard PDF for the per-drug results of /api/analyze.
+
+    Args:
+        results: The "results" list of format_analysis_result.
+        generated_at: Timestamp printed under the title.
+    """
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table
+
+    styles = _styles()
+    title_style = styles['Title']
+    heading_style = styles['Heading2']
+    normal_style = styles['Normal']
+
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    story = []
+
+    # Title
+    story.append(Paragraph("PharmaGuard Pharmacogenomic Report", title_style))
+    story.append(Spacer(1, 12))
+    story.append(Paragraph(f"Generated on: {generated_at}", normal_style))
+    story.append(Spacer(1, 24))
+
+    for item in results:
+        drug = item.get("drug", "Unknown Drug")
+        risk = item.get("risk_assessment", {})
+        profile = item.get("pharmacogenomic_profile", {})
+        explanation = item.get("llm_generated_explanation", {}).get("summary", "")
+
+        # Drug Header
+        story.append(Paragraph(f"Drug: {drug}", heading_style))
+
+        # Risk Table Data
+        data = [
+            ["Risk Level", risk.get("risk_label", "Unknown")],
+            ["Severity", risk.get("severity", "None").title()],
+            ["Genotype", f"{profile.get('primary_gene')} {profile.get('diplotype')}"],
+            ["Phenotype", profile.get("phenotype")]
+        ]
+        t = Table(data, colWidths=[150, 300])
+        t.setStyle(_risk_table_style(_risk_color_name(risk.get("risk_label", ""))))
+        story.append(t)
+        story.append(Spacer(1, 12))
+
+        # Explanation
+        story.append(Paragraph("<b>Clinical Explanation:</b>", normal_style))
+        story.append(Paragraph(explanation, normal_style))
+        story.append(Spacer(1, 24))
+
+        # Divider
+        story.append(Paragraph("_" * 60, normal_style))
+        story.append(Spacer(1, 24))
+
+    doc.build(story)
+    return buffer.getvalue()
+
+
+# ── Pool, cache and async entry point (API process) ─────────────────────
+# PHARMAGUARD_REPORT_* settings are read when the pool and cache are first
+# created.
+
+def report_workers() -> int:
+    return int(os.getenv("PHARMAGUARD_REPORT_WORKERS", "2"))
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_unavailable = False
+
+
+def get_report_pool() -> Optional[ProcessPoolExecutor]:
+    """
+    The report worker pool, or None where processes cannot be started
+    (e.g. serverless runtimes without a working SemLock); reports are
+    then rendered in a thread instead.
+    """
+    global _pool, _pool_unavailable
+    if _pool is None and not _pool_unavailable:
+        try:
+            _pool = ProcessPoolExecutor(max_workers=report_workers(), mp_context=multiprocessing.get_context("spawn"))
+        except (ImportError, OSError, NotImplementedError) as e:
+            _pool_unavailable = True
+            logger.warning(f"[Reports] Worker pool unavailable, rendering in threads: {e}")
+    return _pool
+
+
+def _warm_worker() -> bool:
+    _styles()
+    _risk_table_style("green")
+    return True
+
+
+def warm_report_pool():
+    """Starts the report workers and has them import reportlab ahead of the first report."""
+    pool = get_report_pool()
+    if pool is None:
+        return
+    for _ in range(report_workers()):
+        pool.submit(_warm_worker)
+
+
+def shutdown_report_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def report_cache_key(results: List[Dict]) -> str:
+    """SHA-256 of the canonical JSON of a results payload."""
+    canonical = json.dumps(results, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class ReportCache:
+    """Finished PDFs keyed by report_cache_key, LRU-bounded by total bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._pdfs: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            pdf = self._pdfs.get(key)
+            if pdf is None:
+                self.misses += 1
+                return None
+            self._pdfs.move_to_end(key)
+            self.hits += 1
+            return pdf
+
+    def put(self, key: str, pdf: bytes):
+        if len(pdf) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._pdfs.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._pdfs[key] = pdf
+            self.size += len(pdf)
+            while self.size > self.max_bytes:
+                _, evicted = self._pdfs.popitem(last=False)
+                self.size -= len(evicted)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._pdfs),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+_report_cache: Optional[ReportCache] = None
+
+
+def get_report_cache() -> ReportCache:
+    """Process-wide PDF cache bounded by PHARMAGUARD_REPORT_CACHE_MB."""
+    global _report_cache
+    if _report_cache is None:
+        _report_cache = ReportCache(int(os.getenv("PHARMAGUARD_REPORT_CACHE_MB", "64")) * 1024 * 1024)
+    return _report_cache
+
+
+_inflight: Dict[str, asyncio.Future] = {}
+
+
+async def _render(results: List[Dict], generated_at: str) -> bytes:
+    pool = get_report_pool()
+    if pool is not None:
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, render_report_pdf, results, generated_at)
+        except BrokenProcessPool as e:
+            # Workers could not start or died; a fresh pool is tried next time
+            logger.warning(f"[Reports] Worker pool broken, rendering in a thread: {e}")
+            shutdown_report_pool()
+    return await run_in_threadpool(render_report_pdf, results, generated_at)
+
+
+async def get_report_pdf(results: List[Dict]) -> Tuple[bytes, str]:
+    """
+    PDF bytes and cache key for a results payload.
+
+    Served from the report cache when the same payload was rendered before;
+    otherwise rendered once in the report pool, or a thread where no pool
+    can be started (concurrent requests for the same payload share that
+    render), without blocking the event loop.
+    """
+    key = report_cache_key(results)
+    cache = get_report_cache()
+    pdf = cache.get(key)
+    if pdf is not None:
+        return pdf, key
+
+    pending = _inflight.get(key)
+    if pending is not None:
+        return await asyncio.shield(pending), key
+
+    generated_at = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    future = asyncio.ensure_future(_render(results, generated_at))
+    _inflight[key] = future
+    try:
+        pdf = await asyncio.shield(future)
+    finally:
+        _inflight.pop(key, None)
+    cache.put(key, pdf)
+    return pdf, key
@@ -1,12 +1,14 @@
 import datetime
 import uuid
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 def format_analysis_result(
     vcf_result: Dict[str, Any],
     risk_assessments: List[Dict[str, Any]],
-    explanations: Dict[str, str]
-) -> Dict[str, List[Dict[str, Any]]]:
+    explanations: Dict[str, str],
+    patient_id: Optional[str] = None,
+    analysis_id: Optional[str] = None
+) -> Dict[str, Any]:
     """
     Formats the analysis results into the strict hackathon JSON schema.
     
@@ -14,14 +16,16 @@ def format_analysis_result(
         vcf_result: Output from process_vcf_file (profile, validation stats)
         risk_assessments: Output from predict_drug_risks
         explanations: Dictionary mapping drug name to explanation text
+        patient_id: Known patient identifier; a random one is generated if omitted
+        analysis_id: Server-side id for this analysis; a UUID is generated if omitted
         
     Returns:
-        JSON-compliant dictionary with "results" array.
+        JSON-compliant dictionary with "analysis_id" and "results" array.
     """
     
     formatted_results = []
     timestamp = datetime.datetime.utcnow().isoformat() + "Z"
-    patient_id = f"PATIENT_{uuid.uuid4().hex[:8].upper()}"
+    patient_id = patient_id or f"PATIENT_{uuid.uuid4().hex[:8].upper()}"
     
     genetic_profile = vcf_result.get("genetic_profile", {})
     
@@ -94,4 +98,4 @@ def format_analysis_result(
         }
         formatted_results.append(entry)
         
-    return {"results": formatted_results}
\ No newline at end of file
+    return {"analysis_id": analysis_id or str(uuid.uuid4()), "results": formatted_results}
\ No newline at end of file
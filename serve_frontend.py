@@ -1,6 +1,16 @@
-from flask import Flask, send_from_directory, request, Response
+from flask import Flask, send_from_directory, request, Response, stream_with_context
+from requests.adapters import HTTPAdapter
 import requests
+import gzip
+import mimetypes
 import os
+import re
+import shutil
+
+try:
+    import brotli  # optional: enables .br variants
+except ImportError:
+    brotli = None
 
 # Serve from the built React folder
 app = Flask(__name__, static_folder='frontend/dist')
@@ -8,31 +18,128 @@ app = Flask(__name__, static_folder='frontend/dist')
 # Backend runs on port 8001
 BACKEND_URL = "http://localhost:8001"
 
+# One pooled keep-alive session for all proxied calls
+PROXY_POOL_SIZE = int(os.getenv("PHARMAGUARD_PROXY_POOL_SIZE", "32"))
+PROXY_TIMEOUT = (5, 300)  # (connect, read) — analyses and reports can take a while
+STREAM_CHUNK = 64 * 1024
+
+backend = requests.Session()
+backend.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=PROXY_POOL_SIZE))
+backend.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=PROXY_POOL_SIZE))
+
+# Bodies are relayed byte-for-byte (still encoded), so only hop-by-hop headers are dropped
+HOP_BY_HOP_HEADERS = {'connection', 'keep-alive', 'transfer-encoding', 'te', 'trailer',
+                      'upgrade', 'proxy-authenticate', 'proxy-authorization'}
+
+# Vite emits content-hashed file names (assets/index-B2x9Qf1a.js)
+HASHED_ASSET = re.compile(r'(^|/)assets/.+[-.][A-Za-z0-9_-]{8,}\.\w+$')
+COMPRESSIBLE_EXTENSIONS = ('.js', '.css', '.html', '.svg', '.json', '.txt', '.map', '.ico', '.wasm')
+# Preferred first
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+# Methods whose request body is relayed (sized or chunked)
+BODY_METHODS = {'POST', 'PUT', 'DELETE'}
+# The body is streamed on with chunked encoding, so the client's Content-Length is not forwarded
+PROXY_DROPPED_REQUEST_HEADERS = HOP_BY_HOP_HEADERS | {'host', 'content-length'}
+
+
 @app.route('/api/<path:path>', methods=['GET', 'POST', 'PUT', 'DELETE'])
 def proxy_api(path):
-    # Proxy all /api requests to the backend server
-    resp = requests.request(
+    # Proxy all /api requests to the backend server, streaming both ways
+    resp = backend.request(
         method=request.method,
         url=f"{BACKEND_URL}/api/{path}",
-        headers={key: value for (key, value) in request.headers if key != 'Host'},
-        data=request.get_data(),
+        params=request.args,
+        headers={key: value for (key, value) in request.headers if key.lower() not in PROXY_DROPPED_REQUEST_HEADERS},
+        data=request.stream if request.method in BODY_METHODS else None,
         cookies=request.cookies,
-        allow_redirects=False)
+        allow_redirects=False,
+        stream=True,
+        timeout=PROXY_TIMEOUT)
 
-    excluded_headers = ['content-encoding', 'content-length', 'transfer-encoding', 'connection']
     headers = [(name, value) for (name, value) in resp.raw.headers.items()
-               if name.lower() not in excluded_headers]
+               if name.lower() not in HOP_BY_HOP_HEADERS]
+
+    body = stream_with_context(resp.raw.stream(STREAM_CHUNK, decode_content=False))
+    response = Response(body, resp.status_code, headers)
+    response.call_on_close(resp.close)
+    return response
+
+
+def precompress_assets(root):
+    """Writes .gz (and .br, if brotli is installed) next to each compressible file that lacks a fresh one."""
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+                continue
+            src = os.path.join(dirpath, name)
+            mtime = os.path.getmtime(src)
+            for _, suffix in PRECOMPRESSED:
+                dst = src + suffix
+                if os.path.exists(dst) and os.path.getmtime(dst) >= mtime:
+                    continue
+                if suffix == '.gz':
+                    with open(src, 'rb') as f_in, gzip.open(dst, 'wb', compresslevel=9) as f_out:
+                        shutil.copyfileobj(f_in, f_out)
+                elif brotli is not None:
+                    with open(src, 'rb') as f_in, open(dst, 'wb') as f_out:
+                        f_out.write(brotli.compress(f_in.read()))
+
+
+def accepted_encodings(header):
+    """Accept-Encoding -> {coding: q}; codings without a q-value get 1.0, malformed ones 0."""
+    accepted = {}
+    for item in header.split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding.lower()] = q
+    return accepted
+
+
+def accepts_encoding(accepted, encoding):
+    """True if the client allows encoding (named, or via "*") with q > 0."""
+    return accepted.get(encoding, accepted.get('*', 0.0)) > 0
+
+
+def send_static(path):
+    """send_from_directory plus precompressed variants and cache headers."""
+    accepted = accepted_encodings(request.headers.get('Accept-Encoding', ''))
+    mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    response = None
+    for encoding, suffix in PRECOMPRESSED:
+        if accepts_encoding(accepted, encoding) and os.path.isfile(os.path.join(app.static_folder, path + suffix)):
+            response = send_from_directory(app.static_folder, path + suffix, mimetype=mimetype)
+            response.headers['Content-Encoding'] = encoding
+            break
+    if response is None:
+        response = send_from_directory(app.static_folder, path)
+    response.headers['Vary'] = 'Accept-Encoding'
+
+    if HASHED_ASSET.search(path):
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        # index.html and unhashed files must revalidate so new deploys show up
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
 
-    return Response(resp.content, resp.status_code, headers)
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve(path):
     if path != "" and os.path.exists(os.path.join(app.static_folder, path)):
-        return send_from_directory(app.static_folder, path)
+        return send_static(path)
     else:
-        return send_from_directory(app.static_folder, 'index.html')
+        return send_static('index.html')
 
 if __name__ == '__main__':
+    precompress_assets(app.static_folder)
     # Serve on port 80 so ngrok (forwarding port 80) works
     app.run(host='0.0.0.0', port=80)
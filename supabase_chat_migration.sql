@@ -8,6 +8,8 @@ drop policy if exists "Auth users can upload vcf"    on storage.objects;
 drop policy if exists "Auth users can read own vcf"  on storage.objects;
 drop policy if exists "Auth users can delete own vcf" on storage.objects;
 
+drop table if exists analyses        cascade;
+drop table if exists patient_profiles cascade;
 drop table if exists chat_messages  cascade;
 drop table if exists reports        cascade;
 drop table if exists doctor_patients cascade;
@@ -134,9 +136,10 @@ create table chat_messages (
     created_at  timestamptz default now()
 );
 
-create index idx_chat_sender   on chat_messages(sender_id);
+-- Conversation pages: each direction of the or= history query is an
+-- index range scan on (sender_id, receiver_id) already ordered by time.
+create index idx_chat_conversation on chat_messages(sender_id, receiver_id, created_at desc);
 create index idx_chat_receiver on chat_messages(receiver_id);
-create index idx_chat_created  on chat_messages(created_at asc);
 
 alter table chat_messages enable row level security;
 
@@ -152,7 +155,41 @@ create policy "Users can read their conversations"
 
 
 -- ════════════════════════════════════════════════════════════════════
---  5. STORAGE POLICIES  (bucket "vcf-files" must exist already)
+--  5. PATIENT_PROFILES
+--     Latest computed genetic profile per patient (written by the backend
+--     after /api/analyze). Lets drug-only risk queries skip the VCF.
+-- ════════════════════════════════════════════════════════════════════
+create table patient_profiles (
+    patient_id text primary key,
+    profile    jsonb not null,
+    updated_at timestamptz default now()
+);
+
+alter table patient_profiles enable row level security;
+
+-- Patients can read their own stored profile (backend writes use the service key)
+create policy "Patients read own profile"
+    on patient_profiles for select
+    using (patient_id = auth.uid()::text);
+
+
+-- ════════════════════════════════════════════════════════════════════
+--  6. ANALYSES
+--     Full /api/analyze payloads by analysis_id (written by the backend),
+--     served by GET /api/analyses/{id} and its report.pdf.
+-- ════════════════════════════════════════════════════════════════════
+create table analyses (
+    id         text primary key,
+    payload    jsonb not null,
+    created_at timestamptz default now()
+);
+
+-- Backend-only table: reads and writes use the service key
+alter table analyses enable row level security;
+
+
+-- ════════════════════════════════════════════════════════════════════
+--  7. STORAGE POLICIES  (bucket "vcf-files" must exist already)
 --     Create bucket manually: Storage → New Bucket → "vcf-files" → Public ON
 -- ════════════════════════════════════════════════════════════════════
 create policy "Auth users can upload vcf"
@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import os
+from typing import Dict, List, Optional, Tuple, Union
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Statuses worth another attempt; anything else is returned to the caller as-is.
+_RETRY_STATUSES = {429, 502, 503, 504}
+_RETRY_BACKOFF = 0.2
+
+
+def supabase_settings():
+    """(url, key) from SUPABASE_URL and the service key (falling back to the anon key)."""
+    url = os.getenv("SUPABASE_URL", "")
+    key = os.getenv("SUPABASE_SERVICE_KEY", os.getenv("SUPABASE_ANON_KEY", ""))
+    return url, key
+
+
+def client_settings() -> Tuple[float, int, int]:
+    """(timeout, max_connections, retries) from the PHARMAGUARD_SUPABASE_* env vars."""
+    return (
+        float(os.getenv("PHARMAGUARD_SUPABASE_TIMEOUT", "5")),
+        int(os.getenv("PHARMAGUARD_SUPABASE_MAX_CONNECTIONS", "20")),
+        int(os.getenv("PHARMAGUARD_SUPABASE_RETRIES", "2"))
+    )
+
+
+class SupabaseClient:
+    """
+    Shared async PostgREST client.
+
+    One pooled httpx.AsyncClient (keep-alive, bounded connections, timeouts)
+    per event loop, so requests reuse TLS connections instead of
+    handshaking on every call. Reads are retried with backoff on connection
+    errors and 429/5xx; writes are only retried when the request never
+    reached the server.
+
+    Settings left as None are taken from client_settings() when first
+    needed.
+    """
+
+    def __init__(self, timeout: Optional[float] = None, max_connections: Optional[int] = None, retries: Optional[int] = None):
+        self._settings = (timeout, max_connections, retries)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _setting(self, index: int):
+        value = self._settings[index]
+        return client_settings()[index] if value is None else value
+
+    @property
+    def timeout(self) -> float:
+        return self._setting(0)
+
+    @property
+    def max_connections(self) -> int:
+        return self._setting(1)
+
+    @property
+    def retries(self) -> int:
+        return self._setting(2)
+
+    @property
+    def configured(self) -> bool:
+        return bool(supabase_settings()[0])
+
+    def _http(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            url, key = supabase_settings()
+            self._loop = loop
+            self._client = httpx.AsyncClient(
+                base_url=f"{url.rstrip('/')}/rest/v1",
+                headers={"apikey": key, "Authorization": f"Bearer {key}", "Accept": "application/json"},
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _request(self, method: str, path: str, idempotent: bool, **kwargs) -> httpx.Response:
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            try:
+                response = await self._http().request(method, path, **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout):
+                if last:
+                    raise
+            except httpx.TransportError:
+                if last or not idempotent:
+                    raise
+            else:
+                if response.status_code not in _RETRY_STATUSES or last or not idempotent:
+                    return response
+            await asyncio.sleep(_RETRY_BACKOFF * (2 ** attempt))
+
+    async def select(self, table: str, params: Union[Dict[str, str], List[Tuple[str, str]]]) -> List[Dict]:
+        """
+        GET /rest/v1/{table} with PostgREST query params (a list of pairs
+        when a column is filtered more than once).
+
+        Returns:
+            The rows, or [] if PostgREST answered with an error status.
+            Transport failures (after retries) are raised.
+        """
+        response = await self._request("GET", f"/{table}", True, params=params)
+        if response.is_success:
+            return response.json()
+        logger.warning(f"[Supabase] GET {table} failed: {response.status_code} - {response.text[:200]}")
+        return []
+
+    async def insert(self, table: str, row: Dict, upsert: bool = False) -> bool:
+        """POST a row; upsert merges on the table's primary key. Returns success."""
+        headers = {"Content-Type": "application/json"}
+        if upsert:
+            headers["Prefer"] = "resolution=merge-duplicates"
+        response = await self._request("POST", f"/{table}", upsert, json=row, headers=headers)
+        if response.is_success:
+            return True
+        logger.warning(f"[Supabase] POST {table} failed: {response.status_code} - {response.text[:200]}")
+        return False
+
+
+supabase = SupabaseClient()
@@ -0,0 +1,58 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import analysis_store
+import report_renderer
+import vcf_authenticator
+from analysis_store import etag_matches
+
+ANALYSIS = {
+    "analysis_id": "a1",
+    "results": [{
+        "patient_id": "PATIENT_001",
+        "drug": "CODEINE",
+        "timestamp": "2026-01-01T00:00:00Z",
+        "risk_assessment": {"risk_label": "Toxic", "confidence_score": 0.9, "severity": "high"},
+        "pharmacogenomic_profile": {
+            "primary_gene": "CYP2D6", "diplotype": "*4/*4", "phenotype": "PM", "detected_variants": []
+        },
+        "clinical_recommendation": {"summary": "Avoid codeine."},
+        "llm_generated_explanation": {"summary": "No CYP2D6 function."},
+    }],
+}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    store = analysis_store.AnalysisStore()
+    store._remember(ANALYSIS["analysis_id"], ANALYSIS)
+    monkeypatch.setattr(vcf_authenticator, "analysis_store", store)
+    return TestClient(vcf_authenticator.app)
+
+
+@pytest.mark.parametrize("header, etag, expected", [
+    ('W/"abc"', 'W/"abc"', True),
+    ('"abc"', 'W/"abc"', True),
+    ('W/"abc"', '"abc"', True),
+    ('"x", W/"abc"', '"abc"', True),
+    ("*", '"abc"', True),
+    ('"abd"', 'W/"abc"', False),
+    (None, '"abc"', False),
+])
+def test_etag_matches_uses_weak_comparison(header, etag, expected):
+    assert etag_matches(header, etag) is expected
+
+
+def test_report_etag_is_weak_and_survives_rerender(client, monkeypatch):
+    first = client.get("/api/analyses/a1/report.pdf")
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert etag.startswith('W/"')
+
+    # Evicted from the report cache: re-rendered with a new timestamp
+    monkeypatch.setattr(report_renderer, "_report_cache", None)
+    assert client.get("/api/analyses/a1/report.pdf").headers["etag"] == etag
+
+    revalidated = client.get("/api/analyses/a1/report.pdf", headers={"If-None-Match": etag})
+    assert revalidated.status_code == 304
+    assert revalidated.content == b""
@@ -0,0 +1,166 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import vcf_authenticator
+from chat_pubsub import InProcessPubSub, RedisPubSub
+from vcf_authenticator import WS_CLOSE_TRY_AGAIN_LATER, ChatConnection, ConnectionManager
+
+
+class FakeRedis:
+    """Minimal redis.asyncio stand-in: one in-memory broker shared by every client built on it."""
+
+    def __init__(self, broker=None):
+        self.broker = broker if broker is not None else {}
+
+    def pubsub(self):
+        return FakeRedisPubSub(self.broker)
+
+    async def publish(self, channel, data):
+        for queue in self.broker.get(channel, []):
+            queue.put_nowait({"type": "message", "channel": channel, "data": data.encode()})
+
+
+class FakeRedisPubSub:
+    def __init__(self, broker):
+        self.broker = broker
+        self.queue = asyncio.Queue()
+
+    async def subscribe(self, channel):
+        self.broker.setdefault(channel, []).append(self.queue)
+
+    async def unsubscribe(self, channel):
+        self.broker[channel].remove(self.queue)
+
+    async def get_message(self, ignore_subscribe_messages=True, timeout=1.0):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def aclose(self):
+        pass
+
+
+class FakeWebSocket:
+    def __init__(self, stalled=False):
+        self.sent = []
+        self.closed_with = None
+        self._stalled = stalled
+
+    async def accept(self):
+        pass
+
+    async def send_json(self, data):
+        if self._stalled:
+            await asyncio.Event().wait()
+        self.sent.append(data)
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+
+async def settle(condition, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "condition not reached"
+        await asyncio.sleep(0.01)
+
+
+def test_in_process_delivery_reaches_every_socket_of_the_user():
+    async def run():
+        manager = ConnectionManager(InProcessPubSub())
+        await manager.start()
+        tab1, tab2, other = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+        conns = [await manager.connect(tab1, "u1"), await manager.connect(tab2, "u1"), await manager.connect(other, "u2")]
+
+        await manager.send_to_user("u1", {"type": "new_message", "id": 1})
+        await settle(lambda: tab1.sent and tab2.sent)
+
+        assert tab1.sent == tab2.sent == [{"type": "new_message", "id": 1}]
+        assert other.sent == []
+        for conn in conns:
+            await conn.close()
+        assert manager.active_connections == {}
+
+    asyncio.run(run())
+
+
+def test_redis_fan_out_across_two_managers():
+    async def run():
+        broker = {}
+        worker_a = ConnectionManager(RedisPubSub(client=FakeRedis(broker)))
+        worker_b = ConnectionManager(RedisPubSub(client=FakeRedis(broker)))
+        await worker_a.start()
+        await worker_b.start()
+        on_a, on_b = FakeWebSocket(), FakeWebSocket()
+        conns = [await worker_a.connect(on_a, "u1"), await worker_b.connect(on_b, "u1")]
+
+        # Published on worker A, delivered by both workers' listeners
+        await worker_a.send_to_user("u1", {"type": "new_message", "id": 7})
+        await settle(lambda: on_a.sent and on_b.sent)
+
+        assert on_a.sent == on_b.sent == [{"type": "new_message", "id": 7}]
+        for conn in conns:
+            await conn.close()
+        await worker_a.pubsub.close()
+        await worker_b.pubsub.close()
+        assert broker["pharmaguard:chat"] == []
+
+    asyncio.run(run())
+
+
+def test_slow_consumer_is_evicted_with_try_again_later(monkeypatch):
+    monkeypatch.setenv("PHARMAGUARD_CHAT_QUEUE_SIZE", "3")
+    monkeypatch.setenv("PHARMAGUARD_CHAT_SEND_TIMEOUT", "60")
+
+    async def run():
+        manager = ConnectionManager(InProcessPubSub())
+        await manager.start()
+        slow, fast = FakeWebSocket(stalled=True), FakeWebSocket()
+        slow_conn = await manager.connect(slow, "u1")
+        fast_conn = await manager.connect(fast, "u1")
+
+        for i in range(10):
+            await manager.send_to_user("u1", {"id": i})
+            await asyncio.sleep(0.01) # messages arrive over time, as separate requests
+        await settle(lambda: slow.closed_with is not None and len(fast.sent) == 10)
+
+        assert slow.closed_with == WS_CLOSE_TRY_AGAIN_LATER
+        assert slow_conn.closed
+        assert manager.active_connections == {"u1": {fast_conn}}
+        assert [m["id"] for m in fast.sent] == list(range(10))
+        await fast_conn.close()
+
+    asyncio.run(run())
+
+
+def test_stalled_send_is_evicted_after_send_timeout(monkeypatch):
+    monkeypatch.setenv("PHARMAGUARD_CHAT_SEND_TIMEOUT", "0.05")
+
+    async def run():
+        closed = []
+        ws = FakeWebSocket(stalled=True)
+        conn = ChatConnection(ws, "u1", closed.append)
+        conn.start()
+
+        assert conn.offer({"id": 1})
+        await settle(lambda: conn.closed)
+
+        assert ws.closed_with == WS_CLOSE_TRY_AGAIN_LATER
+        assert closed == [conn]
+        assert not conn.offer({"id": 2})
+
+    asyncio.run(run())
+
+
+def test_idle_socket_is_closed(monkeypatch):
+    monkeypatch.setenv("PHARMAGUARD_CHAT_IDLE_TIMEOUT", "0.1")
+    client = TestClient(vcf_authenticator.app)
+
+    with client.websocket_connect("/ws/chat/idle-user") as ws:
+        message = ws.receive()
+
+    assert message["type"] == "websocket.close"
+    assert "idle-user" not in vcf_authenticator.chat_manager.active_connections
@@ -0,0 +1,36 @@
+import asyncio
+
+import explanation_cache
+import explanation_client
+from explanation_cache import ExplanationCache, explanation_key_space, warm
+
+
+class FakeGroqClient:
+    calls = []
+
+    async def call_groq(self, drug, gene, phenotype, api_key):
+        self.calls.append((drug, gene, phenotype))
+        return f"{drug} {gene} {phenotype}"
+
+    async def aclose(self):
+        pass
+
+
+def test_warm_reads_the_cache_once_and_fills_only_missing_keys(tmp_path, monkeypatch):
+    cache = ExplanationCache(str(tmp_path / "explanations.sqlite3"))
+    keys = explanation_key_space()
+    cache.put(*keys[0], "already cached")
+
+    lookups = []
+    get_many = cache.get_many
+    monkeypatch.setattr(cache, "get_many", lambda ks: lookups.append(list(ks)) or get_many(ks))
+    monkeypatch.setattr(explanation_cache, "get_explanation_cache", lambda: cache)
+    monkeypatch.setattr(explanation_client, "AsyncExplanationClient", FakeGroqClient)
+    FakeGroqClient.calls = []
+
+    stats = asyncio.run(warm("key"))
+
+    assert lookups == [keys]
+    assert stats == {"total": len(keys), "missing": len(keys) - 1, "generated": len(keys) - 1}
+    assert sorted(FakeGroqClient.calls) == sorted(keys[1:])
+    assert get_many(keys[:1]) == {keys[0]: "already cached"}
@@ -0,0 +1,67 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import ml_inference
+from ml_inference import MLInferenceClient
+from ml_insights import MLRiskScorer
+
+
+class FakeExtractor:
+    def predict_risk(self, vcf_text, drug):
+        return {
+            "risk_level": f"{vcf_text}:{drug}",
+            "probability": 0.5,
+            "features": {},
+            "recommendation": "",
+        }
+
+
+class CountingScorer(MLRiskScorer):
+    def __init__(self):
+        super().__init__(FakeExtractor(), {})
+        self.calls = []
+
+    def score_many(self, jobs):
+        self.calls.append(jobs)
+        return super().score_many(jobs)
+
+
+def test_concurrent_scores_share_one_model_call(monkeypatch):
+    scorer = CountingScorer()
+    monkeypatch.setattr(ml_inference, "_scorer", scorer)
+    pool = ThreadPoolExecutor(max_workers=1)
+    client = MLInferenceClient(max_batch=8, max_wait_ms=200)
+    monkeypatch.setattr(client, "_get_pool", lambda: pool)
+
+    async def run():
+        return await asyncio.gather(*(client.score(f"vcf{i}", ["warfarin", "codeine"]) for i in range(5)))
+
+    try:
+        results = asyncio.run(run())
+    finally:
+        pool.shutdown()
+
+    assert len(scorer.calls) == 1
+    assert len(scorer.calls[0]) == 5
+    assert client.stats()["batches"] == 1
+    for i, records in enumerate(results):
+        assert records["codeine"]["prediction_label"] == f"vcf{i}:codeine"
+        assert records["warfarin"]["prediction_label"] == f"vcf{i}:warfarin"
+
+
+def test_batch_is_split_at_max_batch(monkeypatch):
+    scorer = CountingScorer()
+    monkeypatch.setattr(ml_inference, "_scorer", scorer)
+    pool = ThreadPoolExecutor(max_workers=1)
+    client = MLInferenceClient(max_batch=2, max_wait_ms=200)
+    monkeypatch.setattr(client, "_get_pool", lambda: pool)
+
+    async def run():
+        return await asyncio.gather(*(client.score(f"vcf{i}", ["warfarin"]) for i in range(5)))
+
+    try:
+        asyncio.run(run())
+    finally:
+        pool.shutdown()
+
+    assert [len(jobs) for jobs in scorer.calls] == [2, 2, 1]
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import patient_profiles
+import vcf_authenticator
+
+PATIENT = "11111111-1111-1111-1111-111111111111"
+DOCTOR = "22222222-2222-2222-2222-222222222222"
+STRANGER = "33333333-3333-3333-3333-333333333333"
+
+
+class FakeSupabase:
+    configured = True
+
+    def __init__(self):
+        self.profiles = {}
+
+    async def select(self, table, params):
+        if table == "doctor_patients":
+            linked = params["doctor_id"] == f"eq.{DOCTOR}" and params["patient_id"] == f"eq.{PATIENT}"
+            return [{"doctor_id": DOCTOR}] if linked else []
+        if table == "patient_profiles":
+            profile = self.profiles.get(params["patient_id"][3:])
+            return [{"profile": profile}] if profile else []
+        return []
+
+    async def insert(self, table, row, upsert=False):
+        if table == "patient_profiles":
+            self.profiles[row["patient_id"]] = row["profile"]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(patient_profiles, "supabase", FakeSupabase())
+    monkeypatch.setattr(vcf_authenticator, "patient_profiles", patient_profiles.PatientProfileStore())
+    return TestClient(vcf_authenticator.app)
+
+
+def store_profile():
+    record = {"valid": True, "genetic_profile": {
+        "CYP2D6": {"diplotype": "*4/*4", "phenotype": "PM", "detected_variants": []}
+    }}
+    return vcf_authenticator.patient_profiles.save(PATIENT, record)
+
+
+def test_risk_query_requires_user_header(client):
+    assert client.get(f"/api/patients/{PATIENT}/risk", params={"drugs": "Codeine"}).status_code == 400
+
+
+def test_risk_query_rejects_unrelated_user(client):
+    r = client.get(f"/api/patients/{PATIENT}/risk", params={"drugs": "Codeine"}, headers={"x-user-id": STRANGER})
+    assert r.status_code == 403
+
+
+@pytest.mark.parametrize("user_id", [PATIENT, DOCTOR])
+def test_risk_query_allows_patient_and_linked_doctor(client, user_id):
+    asyncio.run(store_profile())
+    r = client.get(f"/api/patients/{PATIENT}/risk", params={"drugs": "Codeine"}, headers={"x-user-id": user_id})
+    assert r.status_code == 200
+    assert r.json()["results"][0]["pharmacogenomic_profile"]["phenotype"] == "PM"
+
+
+def test_upload_cannot_overwrite_another_patients_profile(client):
+    r = client.post(
+        "/api/analyze",
+        files={"vcf_file": ("s.vcf", b"##fileformat=VCFv4.2\n")},
+        data={"drugs": "Codeine", "patient_id": PATIENT},
+        headers={"x-user-id": STRANGER},
+    )
+    assert r.status_code == 403
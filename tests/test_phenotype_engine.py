@@ -0,0 +1,71 @@
+import json
+from collections import defaultdict
+
+import numpy as np
+import pytest
+
+from diplotype_builder import build_diplotypes_batch
+from phenotype_engine import (
+    ACTIVITY_THRESHOLDS, ALLELE_ACTIVITY, DATA_FILE, activity_phenotype, get_phenotype,
+)
+
+SCORED_GENES = sorted(ALLELE_ACTIVITY)
+
+
+@pytest.mark.parametrize("gene", SCORED_GENES)
+def test_equal_activity_diplotypes_agree(gene):
+    calls = defaultdict(set)
+    activity = ALLELE_ACTIVITY[gene]
+    for a, score_a in activity.items():
+        for b, score_b in activity.items():
+            calls[score_a + score_b].add(get_phenotype(gene, f"{a}/{b}"))
+    assert {score: phenotypes for score, phenotypes in calls.items() if len(phenotypes) > 1} == {}
+
+
+def test_curated_entries_match_activity_scores():
+    with open(DATA_FILE) as f:
+        curated = json.load(f)
+    mismatches = []
+    for gene, table in curated.items():
+        if gene not in ACTIVITY_THRESHOLDS:
+            continue
+        activity = ALLELE_ACTIVITY[gene]
+        for diplotype, phenotype in table.items():
+            a, b = diplotype.split("/")
+            if a in activity and b in activity:
+                expected = activity_phenotype(gene, activity[a] + activity[b])
+                if expected != phenotype:
+                    mismatches.append((gene, diplotype, phenotype, expected))
+    assert mismatches == []
+
+
+@pytest.mark.parametrize("diplotype, phenotype", [
+    ("*1/*5", "IM"),
+    ("*17/*17", "IM"),
+    ("*1/*10", "NM"),
+    ("*2/*41", "NM"),
+    ("*41/*35", "NM"),
+    ("*10/*41", "IM"),
+    ("*4/*4", "PM"),
+    ("*1/*1xN", "UM"),
+])
+def test_cyp2d6_calls(diplotype, phenotype):
+    assert get_phenotype("CYP2D6", diplotype) == phenotype
+
+
+def test_lookup_ignores_allele_order_and_unknown_alleles():
+    assert get_phenotype("CYP2D6", "*4/*1") == get_phenotype("CYP2D6", "*1/*4") == "IM"
+    assert get_phenotype("CYP2D6", "*1/*999") == "Unknown"
+    assert get_phenotype("CYP2D6", "*1") == "Unknown"
+    assert get_phenotype("NOT_A_GENE", "*1/*1") == "Unknown"
+
+
+def test_batch_phenotypes_match_single_lookup():
+    alleles = ["*4", "*10", "*41", "*1xN", "*999"]
+    rng = np.random.default_rng(3)
+    dosages = rng.choice([0, 0, 1, 2], size=(len(alleles), 200)).astype(np.int8)
+
+    diplotypes, phenotypes = build_diplotypes_batch("CYP2D6", alleles, dosages)
+
+    assert phenotypes == [get_phenotype("CYP2D6", d) for d in diplotypes]
+    assert {"PM", "IM", "NM", "UM", "Unknown"} <= set(phenotypes)
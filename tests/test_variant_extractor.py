@@ -0,0 +1,55 @@
+import io
+
+import pytest
+
+from variant_extractor import gt_dosage
+from vcf_processor import process_vcf_stream
+
+HEADER = "##fileformat=VCFv4.2\n" + "##comment=" + "x" * 1024 + "\n"
+
+
+def vcf(samples, rows):
+    """rows: (gene, star, rsid, [GT per sample])"""
+    lines = [HEADER + "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t" + "\t".join(samples)]
+    for i, (gene, star, rsid, gts) in enumerate(rows):
+        lines.append("\t".join(["chr1", str(100 + i), rsid, "A", "G", ".", "PASS",
+                                f"GENE={gene};STAR={star};RS={rsid}", "GT"] + gts))
+    return io.BytesIO(("\n".join(lines) + "\n").encode())
+
+
+@pytest.mark.parametrize("gt, dosage", [
+    ("0/1", 1), ("1/0", 1), ("0|1", 1), ("1|0", 1), ("1/1", 2), ("1|1", 2),
+    ("1/2", 1), ("2/1", 1), ("0/2", 0), ("2/2", 0), ("0/0", 0), ("./.", 0), (".", 0),
+])
+def test_gt_dosage_counts_only_the_annotated_alt(gt, dosage):
+    assert gt_dosage(gt) == dosage
+
+
+@pytest.mark.parametrize("gt, diplotype, phenotype", [
+    ("1/2", "*2A/*1", "IM"),
+    ("0|1", "*2A/*1", "IM"),
+    ("1|1", "*2A/*2A", "PM"),
+    ("0/2", "*1/*1", "NM"),
+])
+def test_single_sample_dpyd_calls(gt, diplotype, phenotype):
+    result = process_vcf_stream(vcf(["S1"], [("DPYD", "*2A", "rs3918290", [gt])]), "s.vcf")
+    profile = result["genetic_profile"]["DPYD"]
+    assert (profile["diplotype"], profile["phenotype"]) == (diplotype, phenotype)
+
+
+def test_first_sample_matches_single_sample_profile():
+    rows = [
+        ("CYP2C19", "*2", "rs4244285", ["1/2", "0/0"]),
+        ("CYP2C19", "*17", "rs12248560", ["0/0", "1|1"]),
+        ("CYP2D6", "*4", "rs3892097", ["1|0", "0/1"]),
+        ("TPMT", "*3A", "rs1800460", ["0/0", "./."]),
+    ]
+    result = process_vcf_stream(vcf(["S1", "S2"], rows), "cohort.vcf")
+    first = result["sample_profiles"]["S1"]
+    for gene, profile in result["genetic_profile"].items():
+        assert profile["diplotype"] == first[gene]["diplotype"]
+        assert profile["phenotype"] == first[gene]["phenotype"]
+        assert [(v["allele"], v["rsid"]) for v in profile["detected_variants"]] == \
+            [(v["allele"], v["rsid"]) for v in first[gene]["detected_variants"]]
+    assert result["genetic_profile"]["TPMT"]["detected_variants"] == []
+    assert result["genetic_profile"]["CYP2C19"]["diplotype"] == "*2/*1"
@@ -0,0 +1,116 @@
+import io
+import random
+import struct
+import zlib
+
+from vcf_index import TABIX_DEPTH, TABIX_MIN_SHIFT
+from vcf_processor import MAX_FILE_SIZE, process_vcf_stream, read_vcf_text
+
+HEADER = (
+    "##fileformat=VCFv4.2\n"
+    "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS1\n"
+)
+
+# BGZF end-of-file marker (an empty block)
+BGZF_EOF = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+
+def bgzf_block(data: bytes, level: int) -> bytes:
+    deflater = zlib.compressobj(level, zlib.DEFLATED, -15)
+    payload = deflater.compress(data) + deflater.flush()
+    header = b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00"
+    bsize = len(header) + 2 + len(payload) + 8 - 1
+    return header + struct.pack("<H", bsize) + payload + struct.pack("<II", zlib.crc32(data), len(data))
+
+
+def reg2bin(beg: int, end: int) -> int:
+    """htslib hts_reg2bin for a 0-based half-open interval."""
+    end -= 1
+    shift, level_offset = TABIX_MIN_SHIFT, ((1 << (TABIX_DEPTH * 3)) - 1) // 7
+    for level in range(TABIX_DEPTH, 0, -1):
+        if beg >> shift == end >> shift:
+            return level_offset + (beg >> shift)
+        shift += 3
+        level_offset -= 1 << (level * 3)
+    return 0
+
+
+def bgzip_with_tbi(header: str, records, level: int = 0, block_size: int = 60000):
+    """
+    bgzips a VCF (records as (contig, pos, line)) and builds a matching .tbi.
+    level=0 stores blocks uncompressed, so the upload is as large as the text.
+    """
+    out = bytearray(bgzf_block(header.encode(), level))
+    contigs, bins = [], {}
+    block, spans = b"", []
+
+    def flush():
+        # Records ending exactly at a block boundary end at the next block's offset 0
+        coffset = len(out)
+        out.extend(bgzf_block(block, level))
+        for contig, pos, beg, end in spans:
+            voff_end = (coffset << 16) | end if end < len(block) else len(out) << 16
+            bins.setdefault(contig, {}).setdefault(reg2bin(pos - 1, pos), []).append(((coffset << 16) | beg, voff_end))
+
+    for contig, pos, line in records:
+        data = (line + "\n").encode()
+        if len(block) + len(data) > block_size:
+            flush()
+            block, spans = b"", []
+        if contig not in contigs:
+            contigs.append(contig)
+        spans.append((contig, pos, len(block), len(block) + len(data)))
+        block += data
+    if block:
+        flush()
+    out.extend(BGZF_EOF)
+
+    names = b"".join(c.encode() + b"\x00" for c in contigs)
+    tbi = bytearray(b"TBI\x01" + struct.pack("<i", len(contigs)))
+    tbi += struct.pack("<7i", 2, 1, 2, 0, ord("#"), 0, len(names)) + names
+    for contig in contigs:
+        ref_bins = bins[contig]
+        tbi += struct.pack("<i", len(ref_bins))
+        for bin_id, chunks in sorted(ref_bins.items()):
+            tbi += struct.pack("<Ii", bin_id, len(chunks))
+            for beg, end in chunks:
+                tbi += struct.pack("<QQ", beg, end)
+        tbi += struct.pack("<i", 0) # no linear index
+    return bytes(out), zlib.compress(bytes(tbi), wbits=31)
+
+
+def test_indexed_upload_larger_than_streaming_limit():
+    rng = random.Random(7)
+    records = []
+    for pos in sorted(rng.sample(range(1, 90_000_000), 80000)):
+        pad = "%030x" % rng.getrandbits(120)
+        records.append(("chr10", pos, f"chr10\t{pos}\trs{pos}\tA\tG\t.\tPASS\tPAD={pad}\tGT\t0/1"))
+    records.append(("chr22", 42127000, "chr22\t42127000\trs3892097\tC\tT\t.\tPASS\tGENE=CYP2D6;STAR=*4;RS=rs3892097\tGT\t1/1"))
+    vcf_gz, tbi = bgzip_with_tbi(HEADER, records)
+    assert len(vcf_gz) > MAX_FILE_SIZE
+
+    result = process_vcf_stream(io.BytesIO(vcf_gz), "genome.vcf.gz", None, tbi)
+
+    assert result["valid"], result
+    assert result["genetic_profile"]["CYP2D6"]["diplotype"] == "*4/*4"
+    assert result["genetic_profile"]["CYP2D6"]["phenotype"] == "PM"
+
+
+def test_streamed_upload_over_limit_is_rejected():
+    big = HEADER.encode() + b"#" * (MAX_FILE_SIZE + 1)
+    result = process_vcf_stream(io.BytesIO(big), "big.vcf")
+    assert result["error_type"] == "FileTooLarge"
+
+
+def test_kept_text_holds_only_header_and_pharmacogene_records():
+    lines = [
+        f"chr1\t{pos}\trs{pos}\tA\tG\t.\tPASS\tPAD={'x' * 40}\tGT\t0/1" for pos in range(100, 200)
+    ]
+    pgx = "chr22\t42127000\trs3892097\tC\tT\t.\tPASS\tGENE=CYP2D6;STAR=*4;RS=rs3892097\tGT\t1/1"
+    vcf = (HEADER + "\n".join(lines + [pgx]) + "\n").encode()
+
+    result = process_vcf_stream(io.BytesIO(vcf), "sample.vcf", keep_text=True)
+
+    assert result["valid"], result
+    assert result["vcf_text"] == HEADER + pgx
+    assert read_vcf_text(io.BytesIO(vcf)) == result["vcf_text"]
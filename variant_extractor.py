@@ -1,10 +1,109 @@
-from typing import List, Dict, Set
+from typing import List, Dict, Optional
 import logging
 
+import numpy as np
+
 logger = logging.getLogger(__name__)
 
 TARGET_GENES = {"CYP2D6", "CYP2C19", "CYP2C9", "SLCO1B1", "TPMT", "DPYD"}
 
+def new_variant_map() -> Dict[str, Dict[str, List]]:
+    """Empty per-gene container filled by record_variant."""
+    return {gene: {"variants": [], "alleles": []} for gene in TARGET_GENES}
+
+
+def parse_info(info_field: str) -> Dict[str, object]:
+    """Splits a VCF INFO column into a dict (flags map to True)."""
+    info_dict = {}
+    for part in info_field.split(";"):
+        if "=" in part:
+            k, v = part.split("=", 1)
+            info_dict[k] = v
+        else:
+            info_dict[part] = True
+    return info_dict
+
+
+def parse_gt(format_col: str, sample_col: str) -> Optional[str]:
+    """Returns the raw GT value (e.g. "0/1") of one sample column, if present."""
+    if "GT" not in format_col:
+        return None
+    try:
+        gt_idx = format_col.split(":").index("GT")
+    except ValueError:
+        return None
+    sample_parts = sample_col.split(":")
+    if len(sample_parts) > gt_idx:
+        return sample_parts[gt_idx]
+    return None
+
+
+# An annotated variant whose sample has no (or an empty) GT counts as heterozygous
+DEFAULT_GT = "0/1"
+
+
+def sample_gt(format_col: str, sample_col: str) -> str:
+    """GT of one sample column, or DEFAULT_GT when the record carries none."""
+    return parse_gt(format_col, sample_col) or DEFAULT_GT
+
+
+def gt_dosage(gt: str) -> int:
+    """
+    Copies of the record's annotated ALT (allele index 1) in a GT string.
+
+    Unphased and phased calls count alike: "0/1" and "1|0" -> 1, "1/1" and
+    "1|1" -> 2. Other ALT indices belong to a different allele than the
+    record's STAR annotation, so they count as non-matches: "1/2" -> 1,
+    "0/2" -> 0; "0/0" and "./." -> 0. Used by both the single-sample
+    (record_variant / build_diplotype) and cohort (GenotypeMatrix) paths so
+    they agree on every call.
+    """
+    return min(gt.replace("|", "/").split("/").count("1"), 2)
+
+
+def record_variant(extracted_data: Dict[str, Dict[str, List]], cols: List[str], info_dict: Dict[str, object]) -> None:
+    """
+    Adds one already-tokenized VCF record to extracted_data.
+
+    Shared by extract_variants and the streaming validator, so each line is
+    split and its INFO parsed exactly once.
+
+    Args:
+        extracted_data: Map from new_variant_map(), updated in place.
+        cols: Record columns (CHROM..FORMAT, samples).
+        info_dict: Parsed INFO column from parse_info().
+    """
+    gene = info_dict.get("GENE")
+    star_allele = info_dict.get("STAR")
+    if gene not in TARGET_GENES or not star_allele:
+        return
+
+    rsid = info_dict.get("RS")
+
+    # Parse GT (Genotype) if available
+    gt_string = sample_gt(cols[8], cols[9]) if len(cols) >= 10 else DEFAULT_GT
+    dosage = gt_dosage(gt_string)
+    if dosage == 0:
+        # Not carried by this sample (e.g. "0/0"); GenotypeMatrix drops these too
+        return
+    is_homozygous = dosage == 2
+
+    # We keep a raw list of alleles for diplotype building (legacy support)
+    extracted_data[gene]["alleles"].append(star_allele)
+    if is_homozygous:
+        extracted_data[gene]["alleles"].append(star_allele)
+
+    # Structured variant object for new diplotype builder.
+    # If homozygous, the physical variant (SNP) causes both alleles, but
+    # "detected_variants" in the report lists influential SNPs, so the RSID
+    # is recorded once.
+    extracted_data[gene]["variants"].append({
+        "allele": star_allele,
+        "rsid": rsid if rsid else "N/A",
+        "gt": gt_string
+    })
+
+
 def extract_variants(vcf_lines: List[str]) -> Dict[str, Dict[str, List[str]]]:
     """
     Parses validated VCF lines and extracts pharmacogenomic variants grouped by gene.
@@ -17,11 +116,11 @@ def extract_variants(vcf_lines: List[str]) -> Dict[str, Dict[str, List[str]]]:
         {
             "CYP2D6": {
                 "alleles": ["*4", "*1"], # Raw list of detected alleles (may include duplicates or *1 if explicit)
-                "rsids": ["rs3892097", "rs1065852"]
+                "variants": [{"allele": "*4", "rsid": "rs3892097", "gt": "0/1"}]
             }
         }
     """
-    extracted_data = {gene: {"variants": [], "alleles": []} for gene in TARGET_GENES}
+    extracted_data = new_variant_map()
     
     for line in vcf_lines:
         line = line.strip()
@@ -36,59 +135,80 @@ def extract_variants(vcf_lines: List[str]) -> Dict[str, Dict[str, List[str]]]:
             
         if len(cols) < 8:
             continue
-            
-        info_field = cols[7]
-        # Parse INFO carefully
-        info_dict = {}
-        for part in info_field.split(";"):
-            if "=" in part:
-                k, v = part.split("=", 1)
-                info_dict[k] = v
-            else:
-                info_dict[part] = True
-        
+
+        record_variant(extracted_data, cols, parse_info(cols[7]))
+                  
+    return extracted_data
+
+
+class GenotypeMatrix:
+    """
+    Columnar genotypes for the pharmacogene records of a multi-sample VCF.
+
+    Each STAR-annotated record in a target gene becomes one row; GT values
+    for all samples are stored as int8 allele dosages (0/1/2), giving a
+    variants x samples matrix that is profiled for every sample at once.
+    """
+
+    def __init__(self, sample_ids: List[str]):
+        self.sample_ids = sample_ids
+        self.records: List[Dict[str, str]] = [] # {"gene", "allele", "rsid"} per row
+        self._rows: List[np.ndarray] = []
+
+    def add(self, cols: List[str], info_dict: Dict[str, object]) -> None:
+        """Adds one tokenized record (no-op for non-pharmacogene or unannotated rows)."""
         gene = info_dict.get("GENE")
         star_allele = info_dict.get("STAR")
+        if gene not in TARGET_GENES or not star_allele or not self.sample_ids:
+            return
+
+        # Same GT rules as record_variant: missing columns or GT fields count as DEFAULT_GT
+        sample_cols = cols[9:9 + len(self.sample_ids)]
+        if len(sample_cols) < len(self.sample_ids):
+            sample_cols = sample_cols + [DEFAULT_GT] * (len(self.sample_ids) - len(sample_cols))
+
+        format_col = cols[8] if len(cols) > 8 else ""
+        if "GT" not in format_col:
+            row = np.full(len(self.sample_ids), gt_dosage(DEFAULT_GT), dtype=np.int8)
+        else:
+            if format_col.startswith("GT"):
+                gts = np.char.partition(np.asarray(sample_cols), ":")[:, 0]
+            else:
+                gts = np.asarray([sample_gt(format_col, c) for c in sample_cols])
+            # Cohorts repeat a handful of GT strings, so decode each distinct one once
+            uniq, inverse = np.unique(gts, return_inverse=True)
+            dosages = np.fromiter((gt_dosage(u or DEFAULT_GT) for u in uniq), dtype=np.int8, count=len(uniq))
+            row = dosages[inverse]
+
         rsid = info_dict.get("RS")
-        
-        if gene in TARGET_GENES:
-            # Parse GT (Genotype) if available
-            is_homozygous = False
-            gt_string = None  # Store the raw GT string (e.g. "0/1", "1/1")
-            
-            if len(cols) >= 10:
-                format_col = cols[8]
-                sample_col = cols[9]
-                if "GT" in format_col:
-                    try:
-                        format_parts = format_col.split(":")
-                        gt_idx = format_parts.index("GT")
-                        sample_parts = sample_col.split(":")
-                        if len(sample_parts) > gt_idx:
-                            gt_value = sample_parts[gt_idx]
-                            gt_string = gt_value  # Capture it
-                            if gt_value == "1/1" or gt_value == "1|1":
-                                is_homozygous = True
-                    except ValueError:
-                        pass
-            
-            # Record variant
-            if star_allele:
-                # We keep a raw list of alleles for diplotype building (legacy support)
-                extracted_data[gene]["alleles"].append(star_allele)
-                if is_homozygous:
-                    extracted_data[gene]["alleles"].append(star_allele)
-                
-                # Structured variant object for new diplotype builder
-                variant_obj = {
-                    "allele": star_allele,
-                    "rsid": rsid if rsid else "N/A",
-                    "gt": gt_string if gt_string else "0/1" # Default to hetero if GT missing/unparsable but variant present
-                }
-                extracted_data[gene]["variants"].append(variant_obj)
-                
-                # If homozygous, strictly speaking the physical variant (SNP) is causing both alleles.
-                # But "detected_variants" in the report is usually a list of influential SNPs.
-                # So listing the RSID once is correct.
-                  
-    return extracted_data
\ No newline at end of file
+        self.records.append({"gene": gene, "allele": star_allele, "rsid": rsid if rsid else "N/A"})
+        self._rows.append(row)
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """int8 dosage matrix of shape (n_variants, n_samples)."""
+        if not self._rows:
+            return np.zeros((0, len(self.sample_ids)), dtype=np.int8)
+        return np.vstack(self._rows)
+
+    def variant_maps(self) -> Dict[str, Dict[str, Dict[str, List]]]:
+        """
+        Per-sample variant maps in the extract_variants format, ready for
+        build_diplotype. Only carriers (dosage > 0) get a variant entry.
+        """
+        matrix = self.matrix
+        maps = {}
+        for j, sample_id in enumerate(self.sample_ids):
+            extracted = new_variant_map()
+            for i in np.flatnonzero(matrix[:, j]):
+                rec = self.records[i]
+                homozygous = matrix[i, j] == 2
+                gene_data = extracted[rec["gene"]]
+                gene_data["alleles"].extend([rec["allele"]] * (2 if homozygous else 1))
+                gene_data["variants"].append({
+                    "allele": rec["allele"],
+                    "rsid": rec["rsid"],
+                    "gt": "1/1" if homozygous else "0/1"
+                })
+            maps[sample_id] = extracted
+        return maps
@@ -1,79 +1,176 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException, status, Form, WebSocket, WebSocketDisconnect, Request
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.responses import JSONResponse, HTMLResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Set, Tuple
+import asyncio
 import logging
-import io
 import uuid
 import datetime
-from variant_extractor import extract_variants
-from diplotype_builder import build_diplotype
-from phenotype_engine import get_phenotype
-from drug_risk_engine import predict_drug_risks
-from pydantic import BaseModel
-import sys
-import os
-# ReportLab Imports
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from fastapi.responses import StreamingResponse
 
-# Load .env file for SUPABASE_URL, SUPABASE_SERVICE_KEY, etc.
+# Load .env file for SUPABASE_URL, SUPABASE_SERVICE_KEY, PHARMAGUARD_*, etc.
+# Modules read their settings when first used, never at import.
 try:
     from dotenv import load_dotenv
     load_dotenv()
 except ImportError:
     pass  # dotenv optional — env vars can be set directly
 
-# Import ML features
-try:
-    from vcf_feature_extractor.extractor import VCFFeatureExtractor
-    HAS_ML = True
-except ImportError:
-    HAS_ML = False
+from drug_risk_engine import predict_drug_risks, predict_drug_risks_many
+from batch_analysis import stream_batch_results, iter_batch_sources, shutdown_batch_pool
+from profile_cache import get_profile_cache, profile_cache_key, digest_fileobj
+from explanation_cache import get_explanation_cache
+from patient_profiles import patient_profiles, can_access_patient
+from analysis_store import analysis_store, payload_etag, etag_matches
+from supabase_client import supabase
+from chat_pubsub import create_pubsub
+from ml_inference import get_ml_inference
+from vcf_processor import (
+    process_vcf_stream, read_vcf_text, vcf_extension, REQUIRED_TAGS,
+    MAX_FILE_SIZE, MAX_DECOMPRESSED_SIZE, MIN_FILE_SIZE, INDEX_EXTENSIONS,
+)
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel
+import sys
+import os
+from report_renderer import get_report_pdf, get_report_cache, report_cache_key, shutdown_report_pool, warm_report_pool
+from fastapi.responses import StreamingResponse
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize ML Extractor if available
-ml_extractor = None
-if HAS_ML:
-    model_dir = os.path.join(os.path.dirname(__file__), "vcf_feature_extractor", "models")
-    ml_extractor = VCFFeatureExtractor(model_dir=model_dir)
-    ml_extractor.load_model()
+# ML ensemble runs in its own inference process (None if the module is absent)
+ml_inference = get_ml_inference()
 
 # ── WebSocket Connection Manager ──────────────────────────────────────
+WS_CLOSE_TRY_AGAIN_LATER = 1013
+
+
+def chat_settings() -> Tuple[int, float, float, float]:
+    """(send queue size, send timeout, ping interval, idle timeout) from the PHARMAGUARD_CHAT_* env vars."""
+    return (
+        int(os.getenv("PHARMAGUARD_CHAT_QUEUE_SIZE", "100")),
+        float(os.getenv("PHARMAGUARD_CHAT_SEND_TIMEOUT", "10")),
+        float(os.getenv("PHARMAGUARD_CHAT_PING_INTERVAL", "20")),
+        float(os.getenv("PHARMAGUARD_CHAT_IDLE_TIMEOUT", "60"))
+    )
+
+
+class ChatConnection:
+    """
+    One chat socket with its own bounded outbound queue.
+
+    A dedicated task drains the queue, so senders only ever enqueue and a
+    slow client can't hold up anyone else. A client whose queue fills up,
+    or whose send stalls past the send timeout, is evicted. A ping is
+    queued every ping interval; the client answers with "pong". Settings
+    come from chat_settings() when the connection is opened.
+    """
+
+    def __init__(self, websocket: WebSocket, user_id: str, on_close):
+        self.websocket = websocket
+        self.user_id = user_id
+        queue_size, self.send_timeout, self.ping_interval, _ = chat_settings()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.closed = False
+        self._evicted = False
+        self._on_close = on_close
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._send_loop()), asyncio.create_task(self._ping_loop())]
+
+    def offer(self, data: dict) -> bool:
+        """Queues data without waiting; evicts the connection if it is too far behind."""
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(data)
+            return True
+        except asyncio.QueueFull:
+            if not self._evicted:
+                self._evicted = True
+                logger.warning(f"[Chat] Evicting slow consumer {self.user_id} ({self.queue.qsize()} queued)")
+                self._tasks.append(asyncio.create_task(self.close(WS_CLOSE_TRY_AGAIN_LATER)))
+            return False
+
+    async def _send_loop(self):
+        try:
+            while True:
+                data = await self.queue.get()
+                await asyncio.wait_for(self.websocket.send_json(data), self.send_timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.info(f"[Chat] Send to {self.user_id} failed: {e!r}")
+            await self.close(WS_CLOSE_TRY_AGAIN_LATER)
+
+    async def _ping_loop(self):
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            self.offer({"type": "ping"})
+
+    async def close(self, code: int = 1000):
+        if self.closed:
+            return
+        self.closed = True
+        self._on_close(self)
+        current = asyncio.current_task()
+        for task in self._tasks:
+            if task is not current:
+                task.cancel()
+        try:
+            await self.websocket.close(code)
+        except Exception:
+            pass # already closed by the client
+
+
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}  # user_id -> websocket
+    """
+    Chat sockets held by this worker, several per user (tabs, devices).
+
+    send_to_user publishes through the pub/sub backend; every worker's
+    subscriber then calls deliver_local for the sockets it holds, so a
+    message reaches the receiver whichever worker they are connected to.
+    Delivery only enqueues onto each ChatConnection, so it never waits on
+    a client's network.
+    """
+
+    def __init__(self, pubsub):
+        self.active_connections: Dict[str, Set[ChatConnection]] = {}  # user_id -> connections
+        self.pubsub = pubsub
 
-    async def connect(self, websocket: WebSocket, user_id: str):
+    async def start(self):
+        await self.pubsub.start(self.deliver_local)
+
+    async def connect(self, websocket: WebSocket, user_id: str) -> ChatConnection:
         await websocket.accept()
-        self.active_connections[user_id] = websocket
+        conn = ChatConnection(websocket, user_id, self.disconnect)
+        self.active_connections.setdefault(user_id, set()).add(conn)
+        conn.start()
         logger.info(f"[Chat] User {user_id} connected")
+        return conn
 
-    def disconnect(self, user_id: str):
-        self.active_connections.pop(user_id, None)
-        logger.info(f"[Chat] User {user_id} disconnected")
+    def disconnect(self, conn: ChatConnection):
+        conns = self.active_connections.get(conn.user_id)
+        if conns is not None:
+            conns.discard(conn)
+            if not conns:
+                del self.active_connections[conn.user_id]
+        logger.info(f"[Chat] User {conn.user_id} disconnected")
 
     async def send_to_user(self, user_id: str, data: dict):
-        ws = self.active_connections.get(user_id)
-        if ws:
-            try:
-                await ws.send_json(data)
-            except Exception:
-                self.disconnect(user_id)
+        try:
+            await self.pubsub.publish(user_id, data)
+        except Exception as e:
+            logger.warning(f"[Chat] Publish failed: {e}")
 
-chat_manager = ConnectionManager()
+    async def deliver_local(self, user_id: str, data: dict):
+        for conn in list(self.active_connections.get(user_id, ())):
+            conn.offer(data)
 
-# ── Supabase helper (uses env vars) ────────────────────────────────────
-def get_supabase_headers():
-    url = os.getenv("SUPABASE_URL", "")
-    key = os.getenv("SUPABASE_SERVICE_KEY", os.getenv("SUPABASE_ANON_KEY", ""))
-    return url, {"apikey": key, "Authorization": f"Bearer {key}", "Content-Type": "application/json"}
+chat_manager = ConnectionManager(create_pubsub())
+profile_cache = get_profile_cache()
 
 app = FastAPI(title="PharmaGuard VCF Authenticator", version="1.0.0")
 
@@ -86,11 +183,6 @@ app.add_middleware(
 )
 
 TARGET_GENES = {"CYP2D6", "CYP2C19", "CYP2C9", "SLCO1B1", "TPMT", "DPYD"}
-# Required tags that MUST be present in the INFO field for Pharmacogene entries
-REQUIRED_TAGS = {"GENE", "RS", "STAR"}
-
-MAX_FILE_SIZE = 5 * 1024 * 1024 # 5MB
-MIN_FILE_SIZE = 1 * 1024 # 1KB
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -240,8 +332,8 @@ async def main():
             
             <form id="analyzeForm">
                 <div class="form-group">
-                    <label>1. Upload VCF File (v4.2)</label>
-                    <input type="file" id="vcfFile" accept=".vcf" required>
+                    <label>1. Upload VCF File (v4.2, plain or .vcf.gz)</label>
+                    <input type="file" id="vcfFile" accept=".vcf,.gz,.bgz" required>
                 </div>
                 
                 <div class="form-group">
@@ -375,6 +467,17 @@ async def predict_risk(req: RiskRequest):
     return predict_drug_risks(req.drug_names, req.phenotype_profile)
 
 
+class CohortRiskRequest(BaseModel):
+
+    drug_names: str
+    phenotype_profiles: List[dict]
+
+@app.post("/predict-risk/batch")
+async def predict_risk_batch(req: CohortRiskRequest):
+    """predict_drug_risks for many phenotype profiles against one drug panel, in request order."""
+    return predict_drug_risks_many(req.phenotype_profiles, req.drug_names)
+
+
 EXPLANATION_RULES = {
     "CODEINE_PM": "Codeine requires CYP2D6 activation. Poor metabolizers cannot convert codeine into morphine, leading to ineffective pain relief.",
     "CLOPIDOGREL_PM": "Clopidogrel requires CYP2C19 activation. Poor metabolizers cannot activate the drug, increasing cardiovascular event risk.",
@@ -390,16 +493,40 @@ class AnalyzeRequest(BaseModel):
     pass
 
 from response_formatter import format_analysis_result
-from explanation_templates import get_explanation
+from explanation_client import explanation_client
+
+async def patient_access_error(request: Request, patient_id: str) -> Optional[JSONResponse]:
+    """
+    None if the caller (X-User-Id header) is patient_id or their linked
+    doctor; otherwise the 400/403 response to return.
+    """
+    user_id = request.headers.get("x-user-id")
+    if not user_id:
+        return JSONResponse(status_code=400, content={"error": "Missing x-user-id header"})
+    if not await can_access_patient(user_id, patient_id):
+        return JSONResponse(status_code=403, content={"error": "Not authorised for this patient"})
+    return None
+
 
 @app.post("/api/analyze")
 async def analyze_vcf(
+    request: Request,
     vcf_file: UploadFile = File(...),
-    drugs:str = Form(...)
+    drugs:str = Form(...),
+    index_file: Optional[UploadFile] = File(None),
+    assembly: str = Form("GRCh38"),
+    patient_id: Optional[str] = Form(None)
 ):
+    # Storing a profile under patient_id is limited to that patient and their doctor
+    if patient_id:
+        denied = await patient_access_error(request, patient_id)
+        if denied is not None:
+            return denied
+
     try:
         # 1. Processing Pipeline: Validate & Profile
-        vcf_result = await process_vcf_file(vcf_file)
+        # An optional .tbi/.csi index switches to region reads of the pharmacogene loci.
+        vcf_result = await process_vcf_file(vcf_file, index_file, assembly, keep_text=ml_inference is not None)
         
         if not vcf_result.get("valid"):
             logger.error(f"VCF Validation Failed: {vcf_result}")
@@ -413,68 +540,44 @@ async def analyze_vcf(
             )
             
         genetic_profile = vcf_result.get("genetic_profile", {})
+
+        # Keep the profile so later drug-only queries for this patient skip the VCF
+        if patient_id:
+            await patient_profiles.save(patient_id, vcf_result)
         
         # 2. Risk Prediction
         simple_profile = {gene: data["phenotype"] for gene, data in genetic_profile.items()}
         risk_assessments = predict_drug_risks(drugs, simple_profile)
         
-        # 3. Generate Explanations
-        explanations_map = {}
-        for assessment in risk_assessments:
-            drug_name = assessment["drug"]
-            gene = assessment["primary_gene"]
-            pheno = assessment["phenotype"]
-            
-            import os
-            api_key = os.getenv("GROQ_API_KEY", "")
-            
-            explanations_map[drug_name] = get_explanation(drug_name, gene, pheno, api_key)
+        # 3. Generate Explanations (concurrent, deadline-bounded, template fallback)
+        api_key = os.getenv("GROQ_API_KEY", "")
+        explanations_map = await explanation_client.explain_many(risk_assessments, api_key)
 
     
         # 4. Final Data Collection
         # Since we cannot change the schema of formatted_results easily without breaking things, 
         # we will add a 'supplemental_ml_info' key to each result at the end.
-        final_response = format_analysis_result(vcf_result, risk_assessments, explanations_map)
+        final_response = format_analysis_result(vcf_result, risk_assessments, explanations_map, patient_id=patient_id)
         
         # 5. Add ML Insights if available
-        if ml_extractor:
+        # (the ML extractor needs the full file, so indexed region reads skip it)
+        if ml_inference and index_file is None:
             try:
-                # We need the VCF content as string for the ML extractor
-                # vcf_file was already read in process_vcf_file, so we might need to seek(0)?
-                # Actually, process_vcf_file already extracted lines if valid.
-                # But ML extractor takes a string.
-                # Let's just re-read the file content once more or use the stored lines.
-                # Wait, process_vcf_file returns valid_lines_for_profiling? No, it's local.
-                # Let's just re-read the file content from the UploadFile object (it's in memory usually or we can seek).
-                await vcf_file.seek(0)
-                vcf_content = (await vcf_file.read()).decode("utf-16le" if "utf-16le" in str(vcf_file.content_type) else "utf-8", errors="ignore")
-                
-                for res in final_response["results"]:
-                    drug_name = res["drug"]
-                    ml_pred = ml_extractor.predict_risk(vcf_content, drug_name)
-                    
-                    # Load model metadata for transparency
-                    model_metadata = {}
-                    try:
-                        import json
-                        meta_path = os.path.join(model_dir, "ensemble_metadata.json")
-                        with open(meta_path, "r") as f:
-                            model_metadata = json.load(f)
-                    except:
-                        pass
-
-                    # Add ML metrics to the JSON record
-                    res["ml_risk_analysis"] = {
-                        "prediction_label": ml_pred["risk_level"],
-                        "confidence_probability": round(ml_pred["probability"], 4),
-                        "ml_model_used": model_metadata.get("model_type", "Ensemble_v1.0_Stochastic"),
-                        "model_auc_score": model_metadata.get("ensemble_auc", 0.95),
-                        "ml_features": ml_pred["features"],
-                        "medication_alternatives": ml_pred["recommendation"]
-                    }
+                # The text was collected while validating; only a cached profile needs a decode
+                if "vcf_text" in vcf_result:
+                    vcf_text = vcf_result["vcf_text"]
+                else:
+                    vcf_text = await run_in_threadpool(read_vcf_text, vcf_file.file, vcf_file.content_type)
+                # None: even the pharmacogene records exceed MAX_ML_TEXT_SIZE
+                if vcf_text is not None:
+                    ml_records = await ml_inference.score(vcf_text, [res["drug"] for res in final_response["results"]])
+                    for res in final_response["results"]:
+                        res["ml_risk_analysis"] = ml_records[res["drug"]]
             except Exception as ml_err:
                 logger.error(f"ML Processing failed: {ml_err}")
 
+        # Stored so reports and re-fetches can reference it by analysis_id
+        await analysis_store.save(final_response)
         return final_response
     except Exception as e:
         logger.exception("Unexpected error in /api/analyze")
@@ -483,230 +586,175 @@ async def analyze_vcf(
             content={"error": "Internal Server Error", "message": str(e)}
         )
 
-@app.post("/validate-vcf", status_code=status.HTTP_200_OK)
-async def validate_vcf(file: UploadFile = File(...)):
+async def process_vcf_file(
+    file: UploadFile,
+    index_file: Optional[UploadFile] = None,
+    assembly: str = "GRCh38",
+    keep_text: bool = False
+):
     """
-    Validates an uploaded VCF file for pharmacogenomic analysis using streaming.
+    Validates and profiles an uploaded VCF (see vcf_processor.process_vcf_stream).
+    Parsing runs in the threadpool so large uploads don't stall the event loop.
+
+    Whole-file uploads are looked up in the profile cache by content digest
+    and extension first, so a repeat upload of the same VCF skips parsing entirely. With
+    keep_text, a freshly parsed result also carries "vcf_text", its header and
+    pharmacogene records for the ML extractor (never cached).
     """
-async def process_vcf_file(file: UploadFile):
+    index_data = None
+    if index_file is not None:
+        if not index_file.filename.lower().endswith(INDEX_EXTENSIONS):
+             return {"valid": False, "error_type": "InvalidExtension", "message": "Index file must be a .tbi or .csi index", "status_code": status.HTTP_400_BAD_REQUEST}
+        index_data = await index_file.read()
+        # Indexed reads exist to avoid touching the whole file, so hashing it
+        # for the cache would defeat the point; go straight to the regions.
+        return await run_in_threadpool(
+            process_vcf_stream, file.file, file.filename, file.content_type, index_data, assembly
+        )
+
+    # Names that fail the extension check skip the cache and get process_vcf_stream's rejection
+    extension = vcf_extension(file.filename)
+    cache_key = profile_cache_key(await run_in_threadpool(digest_fileobj, file.file), extension) if extension else None
+    cached = profile_cache.get(cache_key) if cache_key else None
+    if cached is not None:
+        return cached
+
+    result = await run_in_threadpool(
+        process_vcf_stream, file.file, file.filename, file.content_type, None, "GRCh38", keep_text
+    )
+    if cache_key and result.get("valid"):
+        profile_cache.put(cache_key, {k: v for k, v in result.items() if k != "vcf_text"})
+    return result
+
+
+@app.post("/api/analyze/batch")
+async def analyze_batch(
+    vcf_files: List[UploadFile] = File(...),
+    drugs: str = Form(...)
+):
     """
-    Core logic to validate and profile a VCF file.
-    Returns a dictionary with validation results, profile, or error details.
+    Cohort analysis: many VCFs (or .zip/.tar archives of VCFs) against one drug list.
+
+    Files are analysed in a process pool and streamed back as NDJSON, one
+    line per patient in completion order. Each line is the /api/analyze
+    payload plus "file", or an error record for that file.
     """
-    try:
-        # Step 1: File Extension Check
-        if not file.filename.lower().endswith('.vcf'):
-             return {"valid": False, "error_type": "InvalidExtension", "message": "Uploaded file is not a valid VCF file", "status_code": status.HTTP_400_BAD_REQUEST}
-        
-        # Validation State
-        vcf_version = None
-        has_chrom_header = False
-        total_variants = 0
-        pharmacogene_variants = 0
-        genes_detected: Set[str] = set()
-        warnings: List[str] = []
-        
-        seen_gene_tag = False
-        seen_rs_tag = False
-        seen_star_tag = False
-        space_normalization_active = False
-        valid_lines_for_profiling = [] # Store lines for profiling engine
-        
-        def process_line(line_str: str, line_num: int):
-            nonlocal vcf_version, has_chrom_header, total_variants, pharmacogene_variants
-            nonlocal seen_gene_tag, seen_rs_tag, seen_star_tag, space_normalization_active
-            
-            line_str = line_str.strip()
-            if not line_str:
-                return 
-
-            # Header Validation
-            if line_str.startswith("##"):
-                if line_str.startswith("##fileformat="):
-                    vcf_version = line_str.split("=")[1].strip()
-                    if vcf_version != "VCFv4.2":
-                         raise ValueError("Invalid VCF header — missing required fields (Version mismatch)")
-                return
-
-            if line_str.startswith("#"):
-                if line_str.startswith("#CHROM"):
-                    if line_str.startswith("#CHROM\t"):
-                         cols = line_str.split("\t")
-                    else:
-                         parts = line_str.split()
-                         if len(parts) >= 8 and parts[0] == "#CHROM":
-                              space_normalization_active = True
-                              if "File normalized: space-separated VCF converted to tab-separated format" not in warnings:
-                                   warnings.append("File normalized: space-separated VCF converted to tab-separated format")
-                              cols = parts
-                         else:
-                              raise ValueError("Invalid VCF header — missing required fields or invalid separator")
-
-                    if len(cols) < 8:
-                         raise ValueError("Invalid VCF header — missing required fields")
-                    has_chrom_header = True
-                return
-            
-            if not has_chrom_header:
-                raise ValueError("Invalid VCF header — missing required fields (Missing #CHROM header)")
-
-            # Split columns
-            if space_normalization_active:
-                cols = line_str.split()
-            else:
-                cols = line_str.split("\t")
-            
-            # Auto-detect normalization fallback
-            if len(cols) < 8 and not space_normalization_active:
-                 parts = line_str.split()
-                 if len(parts) >= 8:
-                      space_normalization_active = True
-                      if "File normalized: space-separated VCF converted to tab-separated format" not in warnings:
-                           warnings.append("File normalized: space-separated VCF converted to tab-separated format")
-                      cols = parts
-            
-            if len(cols) < 8:
-                 raise ValueError(f"Malformed variant records detected (Line {line_num}: Insufficient columns)")
-            
-            try:
-                if cols[1] == '.': 
-                     raise ValueError(f"Corrupted variant entries detected (Line {line_num}: Missing POS)")
-                pos = int(cols[1])
-            except ValueError:
-                 raise ValueError(f"Malformed variant records detected (Line {line_num}: POS not integer)")
-            
-            ref = cols[3].upper()
-            alt = cols[4].upper()
-            var_id = cols[2]
-            
-            if alt == '.' or var_id == '.':
-                 raise ValueError(f"Corrupted variant entries detected (Line {line_num}: Missing ID or ALT)")
-            
-            valid_bases = set("ACGT")
-            if not all(c in valid_bases for c in ref):
-                 raise ValueError(f"Malformed variant records detected (Line {line_num}: Invalid REF bases)")
-            if not all(c in valid_bases for c in alt):
-                 raise ValueError(f"Malformed variant records detected (Line {line_num}: Invalid ALT bases)")
-
-            info_field = cols[7]
-            info_parts = info_field.split(";")
-            info_dict = {}
-            for part in info_parts:
-                if "=" in part:
-                    k, v = part.split("=", 1)
-                    info_dict[k] = v
-                else:
-                    info_dict[part] = True
-            
-            if "GENE" in info_dict: seen_gene_tag = True
-            if "RS" in info_dict: seen_rs_tag = True
-            if "STAR" in info_dict: seen_star_tag = True
-            
-            gene = info_dict.get("GENE")
-            if gene:
-                genes_detected.add(gene)
-                if gene in TARGET_GENES:
-                    pharmacogene_variants += 1
-            
-            total_variants += 1
+    api_key = os.getenv("GROQ_API_KEY", "")
+    uploads = [(f.filename, f.file) for f in vcf_files]
+    return StreamingResponse(
+        stream_batch_results(iter_batch_sources(uploads), drugs, api_key),
+        media_type="application/x-ndjson"
+    )
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    """Hit/miss counters for the profile and explanation caches, plus ML batching stats."""
+    explanation_cache = get_explanation_cache()
+    return {
+        "profile_cache": profile_cache.stats(),
+        "explanation_cache": explanation_cache.stats() if explanation_cache else {"enabled": False},
+        "ml_inference": ml_inference.stats() if ml_inference else {"enabled": False},
+        "report_cache": get_report_cache().stats()
+    }
 
-            if not line_str.startswith("##"):
-                 valid_lines_for_profiling.append(line_str)
+def _warm_up():
+    # Process spawns block for a moment each; keep them off the startup path
+    if ml_inference:
+        ml_inference.start()
+    warm_report_pool()
+    logger.info("[Startup] ML and report workers warming in the background")
+
+@app.on_event("startup")
+async def _start_workers():
+    await chat_manager.start()
+    # Spawn the ML and report workers in the background once the server is
+    # up. Set PHARMAGUARD_WARMUP=0 on serverless deployments, where workers
+    # would only be started by the request that needs them.
+    if os.getenv("PHARMAGUARD_WARMUP", "1") != "0":
+        asyncio.get_running_loop().run_in_executor(None, _warm_up)
+
+@app.on_event("shutdown")
+async def _shutdown_workers():
+    shutdown_batch_pool()
+    shutdown_report_pool()
+    await explanation_client.aclose()
+    await supabase.aclose()
+    await chat_manager.pubsub.close()
+    if ml_inference:
+        await ml_inference.aclose()
+
+@app.get("/api/patients/{patient_id}/risk")
+async def patient_drug_risk(patient_id: str, drugs: str, request: Request):
+    """
+    Drug-only risk query against a patient's stored genetic profile.
 
-        
-        # Read loop - Single Pass
-        line_buffer = ""
-        line_number = 0
-        total_size = 0
-        chunk_size = 64 * 1024
-        
-        while True:
-            chunk = await file.read(chunk_size)
-            if not chunk:
-                break
-            
-            total_size += len(chunk)
-            if total_size > MAX_FILE_SIZE:
-                 return {"valid": False, "error_type": "FileTooLarge", "message": "File size must be < 5MB", "status_code": status.HTTP_413_REQUEST_ENTITY_TOO_LARGE}
-            
-            text = chunk.decode("utf-8", errors="ignore")
-            line_buffer += text
-            
-            while '\n' in line_buffer:
-                line, line_buffer = line_buffer.split('\n', 1)
-                line_number += 1
-                try:
-                    process_line(line, line_number)
-                except ValueError as e:
-                    err_msg = str(e)
-                    user_msg = err_msg.split("(")[0].strip()
-                    return {"valid": False, "error_type": "ValidationError", "message": user_msg, "status_code": status.HTTP_400_BAD_REQUEST}
-        
-        
-        if line_buffer:
-            line_number += 1
-            try:
-                process_line(line_buffer, line_number)
-            except ValueError as e:
-                 err_msg = str(e)
-                 user_msg = err_msg.split("(")[0].strip()
-                 return {"valid": False, "error_type": "ValidationError", "message": user_msg, "status_code": status.HTTP_400_BAD_REQUEST}
-
-        if total_size < MIN_FILE_SIZE:
-             return {"valid": False, "error_type": "FileTooSmall", "message": "File size must be > 1KB", "status_code": status.HTTP_400_BAD_REQUEST}
-        
-        if not vcf_version:
-             return {"valid": False, "error_type": "InvalidHeader", "message": "Invalid VCF header — missing required fields", "status_code": status.HTTP_400_BAD_REQUEST}
-            
-        if not has_chrom_header:
-             return {"valid": False, "error_type": "InvalidHeader", "message": "Invalid VCF header — missing required fields", "status_code": status.HTTP_400_BAD_REQUEST}
+    The profile is saved by /api/analyze when a patient_id is supplied, so
+    only the risk, explanation and formatting stages run here — no VCF.
+    The caller's user ID (X-User-Id header) must be the patient's or their
+    linked doctor's.
+    """
+    denied = await patient_access_error(request, patient_id)
+    if denied is not None:
+        return denied
 
-        if total_variants < 1:
-             return {"valid": False, "error_type": "InsufficientData", "message": "VCF file contains insufficient genomic data (must have at least 1 variant)", "status_code": status.HTTP_400_BAD_REQUEST}
+    record = await patient_profiles.load(patient_id)
+    if record is None:
+        return JSONResponse(status_code=404, content={"error": "No stored genetic profile for this patient"})
 
-        if pharmacogene_variants == 0:
-             return {"valid": False, "error_type": "NoPharmacogenes", "message": "No pharmacogenomic variants detected in file", "status_code": status.HTTP_400_BAD_REQUEST}
-            
-        if not (seen_gene_tag and seen_rs_tag and seen_star_tag):
-             return {"valid": False, "error_type": "MissingAnnotations", "message": "VCF lacks pharmacogenomic annotations (GENE/STAR/RS)", "status_code": status.HTTP_400_BAD_REQUEST}
+    genetic_profile = record.get("genetic_profile", {})
+    simple_profile = {gene: data["phenotype"] for gene, data in genetic_profile.items()}
+    risk_assessments = predict_drug_risks(drugs, simple_profile)
 
-        # Genetic Profiling Engine Integration
-        profiling_result = {}
-        try:
-            extracted_data = extract_variants(valid_lines_for_profiling)
-            raw_diplotypes = build_diplotype(extracted_data)
-            
-            for gene in TARGET_GENES:
-                diplotype = raw_diplotypes.get(gene, "*1/*1")
-                phenotype = get_phenotype(gene, diplotype)
-                detected = extracted_data.get(gene, {})
-                
-                profiling_result[gene] = {
-                    "diplotype": diplotype,
-                    "phenotype": phenotype,
-                    "detected_variants": detected.get("variants", [])
-                }
-                
-        except Exception as e:
-            logger.error(f"Profiling Engine Error: {e}")
-            warnings.append(f"Genetic profiling failed: {str(e)}")
-
-        return {
-            "valid": True,
-            "vcf_version": vcf_version,
-            "total_variants": total_variants,
-            "pharmacogene_variants": pharmacogene_variants,
-            "genes_detected": list(genes_detected),
-            "warnings": warnings,
-            "genetic_profile": profiling_result,
-            "status_code": status.HTTP_200_OK
-        }
+    api_key = os.getenv("GROQ_API_KEY", "")
+    explanations_map = await explanation_client.explain_many(risk_assessments, api_key)
+    analysis = format_analysis_result(record, risk_assessments, explanations_map, patient_id=patient_id)
+    await analysis_store.save(analysis)
+    return analysis
 
-    except Exception as e:
-        logger.error(f"Error processing VCF: {e}")
-        return {"valid": False, "error_type": "ProcessingError", "message": "An unexpected error occurred processing the file", "status_code": status.HTTP_400_BAD_REQUEST}
+
+@app.get("/api/analyses/{analysis_id}")
+async def get_analysis(analysis_id: str, request: Request):
+    """
+    A stored /api/analyze payload. Supports If-None-Match, so clients that
+    already hold the current version get an empty 304.
+    """
+    analysis = await analysis_store.load(analysis_id)
+    if analysis is None:
+        return JSONResponse(status_code=404, content={"error": "Analysis not found"})
+
+    etag = payload_etag(analysis)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return JSONResponse(content=analysis, headers=headers)
 
 
+@app.get("/api/analyses/{analysis_id}/report.pdf")
+async def get_analysis_report(analysis_id: str, request: Request):
+    """
+    PDF report for a stored analysis. The ETag is the report cache key, so
+    a conditional re-fetch is answered without rendering or sending the PDF.
+    It is weak: a re-render (e.g. after eviction from the report cache)
+    carries a new "Generated on" time, so the bytes differ while the report
+    content does not.
+    """
+    analysis = await analysis_store.load(analysis_id)
+    if analysis is None:
+        return JSONResponse(status_code=404, content={"error": "Analysis not found"})
+
+    etag = f'W/"{report_cache_key(analysis["results"])}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    try:
+        pdf, _ = await get_report_pdf(analysis["results"])
+    except Exception as e:
+        logger.error(f"Report generation failed: {e}")
+        return JSONResponse(status_code=500, content={"error": str(e)})
+    headers["Content-Disposition"] = f"attachment; filename=PharmaGuard_Report_{analysis_id}.pdf"
+    return Response(content=pdf, media_type="application/pdf", headers=headers)
+
 @app.post("/validate-vcf", status_code=status.HTTP_200_OK)
 async def validate_vcf(file: UploadFile = File(...)):
     """
@@ -737,13 +785,19 @@ async def chat_websocket(websocket: WebSocket, user_id: str):
     Each authenticated user connects here with their Supabase user ID.
     The server keeps them in a room so we can push messages to them in real-time.
     """
-    await chat_manager.connect(websocket, user_id)
+    conn = await chat_manager.connect(websocket, user_id)
+    idle_timeout = chat_settings()[3]
     try:
         while True:
-            # Keep connection alive — client messages are sent via REST
-            await websocket.receive_text()
-    except WebSocketDisconnect:
-        chat_manager.disconnect(user_id)
+            # Client messages are sent via REST; anything received here
+            # (normally "pong") just proves the client is still alive.
+            await asyncio.wait_for(websocket.receive_text(), idle_timeout)
+    except asyncio.TimeoutError:
+        logger.info(f"[Chat] Closing idle connection for {user_id}")
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        await conn.close()
 
 
 # ── Chat REST Endpoints ─────────────────────────────────────────────────
@@ -761,8 +815,6 @@ async def send_chat_message(req: ChatSendRequest, request: Request):
     if not sender_id:
         return JSONResponse(status_code=400, content={"error": "Missing x-user-id header"})
 
-    supabase_url, headers = get_supabase_headers()
-
     new_message = {
         "id": str(uuid.uuid4()),
         "sender_id": sender_id,
@@ -773,14 +825,9 @@ async def send_chat_message(req: ChatSendRequest, request: Request):
     }
 
     # 1. Save to Supabase (if configured)
-    if supabase_url:
+    if supabase.configured:
         try:
-            import requests as http_requests
-            http_requests.post(
-                f"{supabase_url}/rest/v1/chat_messages",
-                json=new_message,
-                headers=headers
-            )
+            await supabase.insert("chat_messages", new_message)
         except Exception as e:
             logger.warning(f"[Chat] Supabase save failed: {e}")
 
@@ -793,43 +840,57 @@ async def send_chat_message(req: ChatSendRequest, request: Request):
     return new_message
 
 
+CHAT_PAGE_SIZE = 50
+CHAT_MAX_PAGE_SIZE = 200
+
 @app.get("/api/chat/{receiver_id}")
-async def get_chat_history(receiver_id: str, request: Request):
+async def get_chat_history(
+    receiver_id: str,
+    request: Request,
+    limit: int = CHAT_PAGE_SIZE,
+    before: Optional[str] = None,
+    since: Optional[str] = None
+):
     """
-    Returns all messages between the requesting user and the specified receiver.
+    Returns one page of messages between the requesting user and the
+    specified receiver, oldest first.
+
+    Without cursors this is the latest `limit` messages. `before` pages
+    backwards (messages older than that created_at); `since` syncs forward
+    (the first `limit` messages newer than that created_at).
     """
     sender_id = request.headers.get("x-user-id")
     if not sender_id:
         return JSONResponse(status_code=400, content={"error": "Missing x-user-id header"})
 
-    supabase_url, headers = get_supabase_headers()
+    # IDs are embedded in the or= filter expression, so only accept real UUIDs
+    try:
+        uuid.UUID(sender_id)
+        uuid.UUID(receiver_id)
+    except ValueError:
+        return JSONResponse(status_code=400, content={"error": "User IDs must be UUIDs"})
 
-    if not supabase_url:
+    if not supabase.configured:
         return []  # Chat history not available without Supabase
 
-    try:
-        import requests as http_requests
-        hdrs = {**headers, "Accept": "application/json"}
-
-        # Fetch A→B
-        r1 = http_requests.get(
-            f"{supabase_url}/rest/v1/chat_messages"
-            f"?sender_id=eq.{sender_id}&receiver_id=eq.{receiver_id}&order=created_at.asc",
-            headers=hdrs
-        )
-        # Fetch B→A
-        r2 = http_requests.get(
-            f"{supabase_url}/rest/v1/chat_messages"
-            f"?sender_id=eq.{receiver_id}&receiver_id=eq.{sender_id}&order=created_at.asc",
-            headers=hdrs
-        )
-        msgs1 = r1.json() if r1.ok else []
-        msgs2 = r2.json() if r2.ok else []
+    limit = max(1, min(limit, CHAT_MAX_PAGE_SIZE))
+    params = [
+        ("or", f"(and(sender_id.eq.{sender_id},receiver_id.eq.{receiver_id}),"
+               f"and(sender_id.eq.{receiver_id},receiver_id.eq.{sender_id}))"),
+        # Forward sync reads oldest-first; otherwise take the newest page and flip it
+        ("order", "created_at.asc" if since else "created_at.desc"),
+        ("limit", str(limit)),
+    ]
+    if before:
+        params.append(("created_at", f"lt.{before}"))
+    if since:
+        params.append(("created_at", f"gt.{since}"))
 
-        # Merge and sort by created_at
-        all_msgs = msgs1 + msgs2
-        all_msgs.sort(key=lambda m: m.get("created_at", ""))
-        return all_msgs
+    try:
+        messages = await supabase.select("chat_messages", params)
+        if not since:
+            messages.reverse()
+        return messages
     except Exception as e:
         logger.error(f"[Chat] History fetch failed: {e}")
         return []
@@ -846,32 +907,23 @@ async def get_my_doctor(request: Request):
     if not patient_id:
         return JSONResponse(status_code=400, content={"error": "Missing x-user-id header"})
 
-    supabase_url, headers = get_supabase_headers()
-    if not supabase_url:
+    if not supabase.configured:
         return JSONResponse(status_code=503, content={"error": "Supabase not configured"})
 
-    import requests as http_requests
-
     try:
         # Step 1: find the doctor_id for this patient
-        dp_res = http_requests.get(
-            f"{supabase_url}/rest/v1/doctor_patients"
-            f"?patient_id=eq.{patient_id}&select=doctor_id&limit=1",
-            headers={**headers, "Accept": "application/json"}
-        )
-        dp_data = dp_res.json() if dp_res.ok else []
+        dp_data = await supabase.select("doctor_patients", {
+            "patient_id": f"eq.{patient_id}", "select": "doctor_id", "limit": "1"
+        })
         if not dp_data:
             return JSONResponse(status_code=404, content={"error": "No linked doctor found"})
 
         doctor_id = dp_data[0]["doctor_id"]
 
         # Step 2: fetch doctor's name from profiles (service key bypasses RLS)
-        prof_res = http_requests.get(
-            f"{supabase_url}/rest/v1/profiles"
-            f"?id=eq.{doctor_id}&select=id,name&limit=1",
-            headers={**headers, "Accept": "application/json"}
-        )
-        prof_data = prof_res.json() if prof_res.ok else []
+        prof_data = await supabase.select("profiles", {
+            "id": f"eq.{doctor_id}", "select": "id,name", "limit": "1"
+        })
         if not prof_data:
             return JSONResponse(status_code=404, content={"error": "Doctor profile not found"})
 
@@ -891,79 +943,13 @@ class ReportRequest(BaseModel):
 async def generate_report(req: ReportRequest):
     """
     Generates a PDF report based on the analysis results.
+    Rendering happens in the report worker pool; repeat requests for the
+    same results are served from the PDF cache.
     """
     try:
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter)
-        story = []
-        styles = getSampleStyleSheet()
-        
-        # Custom Styles
-        title_style = styles['Title']
-        heading_style = styles['Heading2']
-        normal_style = styles['Normal']
-        
-        # Title
-        story.append(Paragraph("PharmaGuard Pharmacogenomic Report", title_style))
-        story.append(Spacer(1, 12))
-        
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        story.append(Paragraph(f"Generated on: {timestamp}", normal_style))
-        story.append(Spacer(1, 24))
-
-        # Iterate through results
-        for item in req.results:
-            drug = item.get("drug", "Unknown Drug")
-            risk = item.get("risk_assessment", {})
-            profile = item.get("pharmacogenomic_profile", {})
-            explanation = item.get("llm_generated_explanation", {}).get("summary", "")
-            
-            # Drug Header
-            story.append(Paragraph(f"Drug: {drug}", heading_style))
-            
-            # Risk Table Data
-            data = [
-                ["Risk Level", risk.get("risk_label", "Unknown")],
-                ["Severity", risk.get("severity", "None").title()],
-                ["Genotype", f"{profile.get('primary_gene')} {profile.get('diplotype')}"],
-                ["Phenotype", profile.get("phenotype")]
-            ]
-            
-            # Table Style based on risk
-            risk_color = colors.green
-            label = risk.get("risk_label", "").upper()
-            if label in ["TOXIC", "INEFFECTIVE", "HIGH"]:
-                risk_color = colors.red
-            elif label == "ADJUST DOSAGE" or label == "MODERATE":
-                risk_color = colors.orange
-                
-            t = Table(data, colWidths=[150, 300])
-            t.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (0, 3), colors.whitesmoke),
-                ('TEXTCOLOR', (0, 0), (0, 3), colors.black),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-                ('TEXTCOLOR', (1, 0), (1, 0), risk_color), # Color the Risk Label
-            ]))
-            
-            story.append(t)
-            story.append(Spacer(1, 12))
-            
-            # Explanation
-            story.append(Paragraph("<b>Clinical Explanation:</b>", normal_style))
-            story.append(Paragraph(explanation, normal_style))
-            story.append(Spacer(1, 24))
-            
-            # Divider
-            story.append(Paragraph("_" * 60, normal_style))
-            story.append(Spacer(1, 24))
-
-        doc.build(story)
-        buffer.seek(0)
-        
-        return StreamingResponse(
-            buffer,
+        pdf, _ = await get_report_pdf(req.results)
+        return Response(
+            content=pdf,
             media_type="application/pdf",
             headers={"Content-Disposition": "attachment; filename=PharmaGuard_Report.pdf"}
         )
@@ -0,0 +1,328 @@
+import struct
+import zlib
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from vcf_stream import DecompressedSizeExceeded, DecompressionError
+
+# ── Pharmacogene loci ──────────────────────────────────────────────────
+# Gene bodies (1-based, inclusive) per reference assembly. Contigs are given
+# without the "chr" prefix; both spellings are tried against the index.
+PHARMACOGENE_REGIONS: Dict[str, Dict[str, Tuple[str, int, int]]] = {
+    "GRCh38": {
+        "CYP2D6": ("22", 42126499, 42130881),
+        "CYP2C19": ("10", 94762681, 94855547),
+        "CYP2C9": ("10", 94938658, 94990091),
+        "SLCO1B1": ("12", 21130388, 21239796),
+        "TPMT": ("6", 18128311, 18155305),
+        "DPYD": ("1", 97077743, 97921049),
+    },
+    "GRCh37": {
+        "CYP2D6": ("22", 42522501, 42526883),
+        "CYP2C19": ("10", 96522463, 96612671),
+        "CYP2C9": ("10", 96698415, 96749147),
+        "SLCO1B1": ("12", 21284128, 21392730),
+        "TPMT": ("6", 18128542, 18155374),
+        "DPYD": ("1", 97543299, 98386615),
+    },
+}
+
+# Promoter/upstream star-allele variants (e.g. CYP2C19*17 at -806) sit just
+# outside the gene body, so every region is widened by this flank.
+REGION_FLANK = 5000
+
+TABIX_MIN_SHIFT = 14
+TABIX_DEPTH = 5
+
+
+class VCFIndexError(Exception):
+    """Raised when an index file is unreadable or does not match the VCF."""
+
+
+class TabixIndex:
+    """
+    In-memory view of a .tbi or .csi index.
+
+    Only the pieces needed for region queries are kept: contig names,
+    the bin -> chunk lists and (for tabix) the 16kb linear index.
+    """
+
+    def __init__(self, names: List[str], bins: List[Dict[int, List[Tuple[int, int]]]],
+                 linear: List[List[int]], min_shift: int, depth: int):
+        self.names = names
+        self.ref_ids = {name: i for i, name in enumerate(names)}
+        self.bins = bins
+        self.linear = linear
+        self.min_shift = min_shift
+        self.depth = depth
+
+    def resolve_contig(self, contig: str) -> Optional[str]:
+        """Finds the index's spelling of a contig ("22" vs "chr22")."""
+        bare = contig[3:] if contig.lower().startswith("chr") else contig
+        for candidate in (contig, bare, "chr" + bare):
+            if candidate in self.ref_ids:
+                return candidate
+        return None
+
+    def query(self, contig: str, start: int, end: int) -> List[Tuple[int, int]]:
+        """
+        Returns merged (begin, end) virtual-offset chunks that may hold
+        records overlapping the 1-based inclusive interval [start, end].
+        """
+        rid = self.ref_ids.get(contig)
+        if rid is None:
+            return []
+
+        beg0 = max(start - 1, 0)
+        ref_bins = self.bins[rid]
+        min_offset = 0
+        if self.linear[rid]:
+            window = min(beg0 >> TABIX_MIN_SHIFT, len(self.linear[rid]) - 1)
+            min_offset = self.linear[rid][window]
+
+        chunks = []
+        for bin_id in reg2bins(beg0, end, self.min_shift, self.depth):
+            for cnk_beg, cnk_end in ref_bins.get(bin_id, ()):
+                if cnk_end > min_offset:
+                    chunks.append((max(cnk_beg, min_offset), cnk_end))
+
+        chunks.sort()
+        merged: List[Tuple[int, int]] = []
+        for cnk_beg, cnk_end in chunks:
+            if merged and cnk_beg <= merged[-1][1]:
+                if cnk_end > merged[-1][1]:
+                    merged[-1] = (merged[-1][0], cnk_end)
+            else:
+                merged.append((cnk_beg, cnk_end))
+        return merged
+
+
+def reg2bins(beg: int, end: int, min_shift: int = TABIX_MIN_SHIFT, depth: int = TABIX_DEPTH) -> List[int]:
+    """Bins overlapping the 0-based half-open interval [beg, end) (htslib hts_reg2bins)."""
+    bins = []
+    end -= 1
+    shift = min_shift + depth * 3
+    offset = 0
+    for level in range(depth + 1):
+        bins.extend(range(offset + (beg >> shift), offset + (end >> shift) + 1))
+        shift -= 3
+        offset += 1 << (level * 3)
+    return bins
+
+
+def _parse_names(blob: bytes) -> List[str]:
+    return [n.decode("ascii", errors="replace") for n in blob.split(b"\x00") if n]
+
+
+def load_index(data: bytes) -> TabixIndex:
+    """
+    Parses a tabix (.tbi) or coordinate-sorted (.csi) index.
+
+    Args:
+        data: Raw index file bytes (BGZF-compressed, as written by tabix/bcftools).
+    """
+    try:
+        members = []
+        rest = data
+        while rest:
+            inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            members.append(inflater.decompress(rest))
+            rest = inflater.unused_data
+        buf = b"".join(members)
+    except zlib.error as e:
+        raise VCFIndexError(f"Index is not BGZF-compressed: {e}")
+
+    try:
+        if buf[:4] == b"TBI\x01":
+            return _load_tbi(buf)
+        if buf[:4] == b"CSI\x01":
+            return _load_csi(buf)
+    except struct.error:
+        raise VCFIndexError("Index file is truncated")
+    raise VCFIndexError("Unrecognised index format (expected .tbi or .csi)")
+
+
+def _load_tbi(buf: bytes) -> TabixIndex:
+    (n_ref,) = struct.unpack_from("<i", buf, 4)
+    # format, col_seq, col_beg, col_end, meta, skip, l_nm
+    l_nm = struct.unpack_from("<7i", buf, 8)[6]
+    pos = 36
+    names = _parse_names(buf[pos:pos + l_nm])
+    pos += l_nm
+
+    all_bins, all_linear = [], []
+    for _ in range(n_ref):
+        (n_bin,) = struct.unpack_from("<i", buf, pos)
+        pos += 4
+        ref_bins = {}
+        for _ in range(n_bin):
+            bin_id, n_chunk = struct.unpack_from("<Ii", buf, pos)
+            pos += 8
+            flat = struct.unpack_from(f"<{2 * n_chunk}Q", buf, pos)
+            pos += 16 * n_chunk
+            ref_bins[bin_id] = list(zip(flat[::2], flat[1::2]))
+        (n_intv,) = struct.unpack_from("<i", buf, pos)
+        pos += 4
+        all_linear.append(list(struct.unpack_from(f"<{n_intv}Q", buf, pos)))
+        pos += 8 * n_intv
+        all_bins.append(ref_bins)
+
+    return TabixIndex(names, all_bins, all_linear, TABIX_MIN_SHIFT, TABIX_DEPTH)
+
+
+def _load_csi(buf: bytes) -> TabixIndex:
+    min_shift, depth, l_aux = struct.unpack_from("<3i", buf, 4)
+    pos = 16
+    aux = buf[pos:pos + l_aux]
+    pos += l_aux
+    if len(aux) < 28:
+        raise VCFIndexError("CSI index has no contig names (not a VCF index?)")
+    l_nm = struct.unpack_from("<7i", aux, 0)[6]
+    names = _parse_names(aux[28:28 + l_nm])
+
+    (n_ref,) = struct.unpack_from("<i", buf, pos)
+    pos += 4
+    all_bins = []
+    for _ in range(n_ref):
+        (n_bin,) = struct.unpack_from("<i", buf, pos)
+        pos += 4
+        ref_bins = {}
+        for _ in range(n_bin):
+            # bin, loffset, n_chunk
+            bin_id, _loffset, n_chunk = struct.unpack_from("<IQi", buf, pos)
+            pos += 16
+            flat = struct.unpack_from(f"<{2 * n_chunk}Q", buf, pos)
+            pos += 16 * n_chunk
+            ref_bins[bin_id] = list(zip(flat[::2], flat[1::2]))
+        all_bins.append(ref_bins)
+
+    return TabixIndex(names, all_bins, [[] for _ in names], min_shift, depth)
+
+
+class BGZFReader:
+    """
+    Random-access reader over a seekable BGZF file.
+
+    Decompressed blocks are memoised by file offset, since neighbouring
+    genes (CYP2C19/CYP2C9) often share blocks.
+    """
+
+    def __init__(self, fileobj: BinaryIO, max_output: Optional[int] = None):
+        self.fileobj = fileobj
+        self.max_output = max_output
+        self.total_out = 0
+        self._blocks: Dict[int, Tuple[bytes, int]] = {}
+
+    def read_block(self, coffset: int) -> Tuple[bytes, int]:
+        """Returns (decompressed data, compressed size) for the block at coffset."""
+        cached = self._blocks.get(coffset)
+        if cached is not None:
+            return cached
+
+        self.fileobj.seek(coffset)
+        header = self.fileobj.read(18)
+        if len(header) < 18:
+            return b"", 0
+        if header[:4] != b"\x1f\x8b\x08\x04" or header[12:14] != b"BC":
+            raise DecompressionError("File is not BGZF-compressed (bgzip it before indexing)")
+        (bsize,) = struct.unpack_from("<H", header, 16)
+        block = header + self.fileobj.read(bsize + 1 - 18)
+        try:
+            data = zlib.decompress(block, 16 + zlib.MAX_WBITS)
+        except zlib.error as e:
+            raise DecompressionError(f"Corrupt compressed data: {e}")
+
+        self.total_out += len(data)
+        if self.max_output is not None and self.total_out > self.max_output:
+            raise DecompressedSizeExceeded(f"Decompressed size exceeds {self.max_output} bytes")
+
+        self._blocks[coffset] = (data, bsize + 1)
+        return data, bsize + 1
+
+    def read_range(self, voff_beg: int, voff_end: int) -> bytes:
+        """Decompresses everything between two virtual offsets."""
+        coffset, uoffset = voff_beg >> 16, voff_beg & 0xFFFF
+        end_coffset, end_uoffset = voff_end >> 16, voff_end & 0xFFFF
+        out = []
+        while coffset <= end_coffset:
+            data, csize = self.read_block(coffset)
+            if not csize:
+                break
+            stop = end_uoffset if coffset == end_coffset else len(data)
+            out.append(data[uoffset:stop])
+            coffset += csize
+            uoffset = 0
+        return b"".join(out)
+
+    def read_header(self) -> List[bytes]:
+        """Returns the '#' header lines from the start of the file."""
+        lines: List[bytes] = []
+        pending = b""
+        coffset = 0
+        while True:
+            data, csize = self.read_block(coffset)
+            if not csize:
+                break
+            pending += data
+            *complete, pending = pending.split(b"\n")
+            for line in complete:
+                if not line.startswith(b"#"):
+                    return lines
+                lines.append(line)
+            coffset += csize
+        if pending.startswith(b"#"):
+            lines.append(pending)
+        return lines
+
+
+def read_pharmacogene_lines(
+    vcf_fileobj: BinaryIO,
+    index_data: bytes,
+    assembly: str = "GRCh38",
+    genes: Optional[List[str]] = None,
+    max_output: Optional[int] = None,
+) -> List[bytes]:
+    """
+    Pulls the header plus only the records overlapping pharmacogene loci.
+
+    Args:
+        vcf_fileobj: Seekable binary handle on a bgzipped VCF.
+        index_data: Bytes of the matching .tbi or .csi index.
+        assembly: Key into PHARMACOGENE_REGIONS ("GRCh38" or "GRCh37").
+        genes: Restrict to these genes (defaults to all known loci).
+        max_output: Ceiling on total decompressed bytes.
+
+    Returns:
+        Raw VCF lines (header first, then records in region order, deduplicated).
+    """
+    regions = PHARMACOGENE_REGIONS.get(assembly)
+    if regions is None:
+        raise VCFIndexError(f"Unknown assembly '{assembly}' (expected one of {', '.join(PHARMACOGENE_REGIONS)})")
+
+    index = load_index(index_data)
+    reader = BGZFReader(vcf_fileobj, max_output=max_output)
+    lines = reader.read_header()
+
+    targets = []
+    for gene in genes or regions:
+        contig, start, end = regions[gene]
+        name = index.resolve_contig(contig)
+        if name is not None:
+            targets.append((index.ref_ids[name], name, max(start - REGION_FLANK, 1), end + REGION_FLANK))
+    targets.sort()
+
+    seen = set()
+    for _, contig, start, end in targets:
+        contig_bytes = contig.encode("ascii")
+        for voff_beg, voff_end in index.query(contig, start, end):
+            for line in reader.read_range(voff_beg, voff_end).split(b"\n"):
+                cols = line.split(b"\t", 2)
+                if len(cols) < 3 or cols[0] != contig_bytes:
+                    continue
+                try:
+                    pos = int(cols[1])
+                except ValueError:
+                    continue
+                if start <= pos <= end and line not in seen:
+                    seen.add(line)
+                    lines.append(line)
+    return lines
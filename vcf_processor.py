@@ -0,0 +1,407 @@
+import logging
+import os
+from typing import BinaryIO, Dict, List, Optional, Set
+
+from fastapi import status
+
+from variant_extractor import new_variant_map, parse_info, record_variant, GenotypeMatrix, TARGET_GENES
+from diplotype_builder import build_diplotype, build_diplotypes_batch
+from phenotype_engine import get_phenotype
+from vcf_stream import (
+    VCFLineReader, GzipStreamDecoder, is_gzip, COMPRESSED_EXTENSIONS,
+    DecompressionError, DecompressedSizeExceeded,
+)
+from vcf_index import read_pharmacogene_lines, VCFIndexError
+
+logger = logging.getLogger(__name__)
+
+# Required tags that MUST be present in the INFO field for Pharmacogene entries
+REQUIRED_TAGS = {"GENE", "RS", "STAR"}
+
+MAX_FILE_SIZE = 5 * 1024 * 1024 # 5MB (applies to the uploaded bytes, compressed or not)
+# Indexed uploads are whole-genome bgzipped VCFs of which only the pharmacogene
+# regions are read, so they get a far larger ceiling than streamed uploads.
+MAX_INDEXED_FILE_SIZE = 64 * 1024 * 1024 * 1024 # 64GB
+MAX_DECOMPRESSED_SIZE = 256 * 1024 * 1024 # 256MB ceiling for .vcf.gz / BGZF contents
+MIN_FILE_SIZE = 1 * 1024 # 1KB
+INDEX_EXTENSIONS = (".tbi", ".csi")
+# Ceiling on the text kept for the ML extractor (header + pharmacogene records)
+MAX_ML_TEXT_SIZE = 2 * 1024 * 1024 # 2MB
+VCF_EXTENSIONS = (".vcf",) + COMPRESSED_EXTENSIONS
+
+
+def vcf_extension(filename: str) -> Optional[str]:
+    """The accepted VCF extension filename ends with (lower-cased), or None."""
+    name = (filename or "").lower()
+    return next((ext for ext in VCF_EXTENSIONS if name.endswith(ext)), None)
+
+
+class PharmacogeneText:
+    """
+    Header and pharmacogene record lines of a VCF, kept for the ML extractor.
+
+    Everything else is dropped as it streams past, and at most max_bytes are
+    retained: past that, text() is None and the caller skips ML scoring
+    rather than holding an arbitrarily large file in memory.
+    """
+
+    def __init__(self, max_bytes: int = MAX_ML_TEXT_SIZE):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.overflow = False
+        self._lines: List[str] = []
+
+    def add(self, line: str):
+        if self.overflow:
+            return
+        self.size += len(line) + 1
+        if self.size > self.max_bytes:
+            self.overflow = True
+            self._lines = []
+        else:
+            self._lines.append(line)
+
+    def text(self) -> Optional[str]:
+        return None if self.overflow else "\n".join(self._lines)
+
+
+def is_pharmacogene_record(line: str) -> bool:
+    """True for a data line whose INFO names one of TARGET_GENES."""
+    if "GENE=" not in line:
+        return False
+    cols = line.split("\t") if "\t" in line else line.split()
+    return len(cols) >= 8 and parse_info(cols[7]).get("GENE") in TARGET_GENES
+
+
+def build_genetic_profile(extracted_data: Dict[str, Dict[str, List]]) -> Dict[str, Dict]:
+    """
+    Turns a per-gene variant map into {gene: {diplotype, phenotype, detected_variants}}.
+    """
+    raw_diplotypes = build_diplotype(extracted_data)
+    profile = {}
+    for gene in TARGET_GENES:
+        diplotype = raw_diplotypes.get(gene, "*1/*1")
+        profile[gene] = {
+            "diplotype": diplotype,
+            "phenotype": get_phenotype(gene, diplotype),
+            "detected_variants": extracted_data.get(gene, {}).get("variants", [])
+        }
+    return profile
+
+
+def build_genetic_profiles(genotypes: GenotypeMatrix) -> Dict[str, Dict[str, Dict]]:
+    """
+    build_genetic_profile for every sample of a multi-sample VCF. Diplotypes
+    and phenotypes are called per gene for all samples at once.
+    """
+    sample_ids = genotypes.sample_ids
+    variant_maps = genotypes.variant_maps()
+    matrix = genotypes.matrix
+    profiles = {s: {} for s in sample_ids}
+    for gene in TARGET_GENES:
+        rows = [i for i, rec in enumerate(genotypes.records) if rec["gene"] == gene]
+        diplotypes, phenotypes = build_diplotypes_batch(gene, [genotypes.records[i]["allele"] for i in rows], matrix[rows])
+        for sample_id, diplotype, phenotype in zip(sample_ids, diplotypes, phenotypes):
+            profiles[sample_id][gene] = {
+                "diplotype": diplotype,
+                "phenotype": phenotype,
+                "detected_variants": variant_maps[sample_id][gene]["variants"]
+            }
+    return profiles
+
+
+def process_vcf_stream(
+    fileobj: BinaryIO,
+    filename: str,
+    content_type: Optional[str] = None,
+    index_data: Optional[bytes] = None,
+    assembly: str = "GRCh38",
+    keep_text: bool = False
+) -> Dict:
+    """
+    Core logic to validate and profile a VCF file.
+    Returns a dictionary with validation results, profile, or error details.
+
+    Synchronous and free of request objects, so it can run in a threadpool
+    or a worker process. When index_data (.tbi/.csi bytes) is supplied, the
+    (bgzipped) VCF is read by region and only records at the pharmacogene
+    loci are validated.
+
+    keep_text adds "vcf_text" for the ML extractor, collected during the
+    same pass: the header and pharmacogene records only (PharmacogeneText),
+    or None if even those exceed MAX_ML_TEXT_SIZE.
+    """
+    try:
+        # Step 1: File Extension Check
+        if vcf_extension(filename) is None:
+             return {"valid": False, "error_type": "InvalidExtension", "message": "Uploaded file is not a valid VCF file", "status_code": status.HTTP_400_BAD_REQUEST}
+        
+        # Validation State
+        vcf_version = None
+        has_chrom_header = False
+        total_variants = 0
+        pharmacogene_variants = 0
+        genes_detected: Set[str] = set()
+        warnings: List[str] = []
+        
+        seen_gene_tag = False
+        seen_rs_tag = False
+        seen_star_tag = False
+        space_normalization_active = False
+        # Structured variant records, filled as each line is validated so the
+        # profiling engine never has to re-split or re-parse the raw text.
+        extracted_data = new_variant_map()
+        genotypes: Optional[GenotypeMatrix] = None # all sample columns, built once #CHROM is seen
+        
+        def process_line(line_str: str, line_num: int):
+            nonlocal vcf_version, has_chrom_header, total_variants, pharmacogene_variants
+            nonlocal seen_gene_tag, seen_rs_tag, seen_star_tag, space_normalization_active
+            nonlocal genotypes
+            
+            line_str = line_str.strip()
+            if not line_str:
+                return 
+
+            if kept_text is not None and line_str.startswith("#"):
+                kept_text.add(line_str)
+
+            # Header Validation
+            if line_str.startswith("##"):
+                if line_str.startswith("##fileformat="):
+                    vcf_version = line_str.split("=")[1].strip()
+                    if vcf_version != "VCFv4.2":
+                         raise ValueError("Invalid VCF header — missing required fields (Version mismatch)")
+                return
+
+            if line_str.startswith("#"):
+                if line_str.startswith("#CHROM"):
+                    if line_str.startswith("#CHROM\t"):
+                         cols = line_str.split("\t")
+                    else:
+                         parts = line_str.split()
+                         if len(parts) >= 8 and parts[0] == "#CHROM":
+                              space_normalization_active = True
+                              if "File normalized: space-separated VCF converted to tab-separated format" not in warnings:
+                                   warnings.append("File normalized: space-separated VCF converted to tab-separated format")
+                              cols = parts
+                         else:
+                              raise ValueError("Invalid VCF header — missing required fields or invalid separator")
+
+                    if len(cols) < 8:
+                         raise ValueError("Invalid VCF header — missing required fields")
+                    has_chrom_header = True
+                    genotypes = GenotypeMatrix(cols[9:])
+                return
+            
+            if not has_chrom_header:
+                raise ValueError("Invalid VCF header — missing required fields (Missing #CHROM header)")
+
+            # Split columns
+            if space_normalization_active:
+                cols = line_str.split()
+            else:
+                cols = line_str.split("\t")
+            
+            # Auto-detect normalization fallback
+            if len(cols) < 8 and not space_normalization_active:
+                 parts = line_str.split()
+                 if len(parts) >= 8:
+                      space_normalization_active = True
+                      if "File normalized: space-separated VCF converted to tab-separated format" not in warnings:
+                           warnings.append("File normalized: space-separated VCF converted to tab-separated format")
+                      cols = parts
+            
+            if len(cols) < 8:
+                 raise ValueError(f"Malformed variant records detected (Line {line_num}: Insufficient columns)")
+            
+            try:
+                if cols[1] == '.': 
+                     raise ValueError(f"Corrupted variant entries detected (Line {line_num}: Missing POS)")
+                pos = int(cols[1])
+            except ValueError:
+                 raise ValueError(f"Malformed variant records detected (Line {line_num}: POS not integer)")
+            
+            ref = cols[3].upper()
+            alt = cols[4].upper()
+            var_id = cols[2]
+            
+            if alt == '.' or var_id == '.':
+                 raise ValueError(f"Corrupted variant entries detected (Line {line_num}: Missing ID or ALT)")
+            
+            valid_bases = set("ACGT")
+            if not all(c in valid_bases for c in ref):
+                 raise ValueError(f"Malformed variant records detected (Line {line_num}: Invalid REF bases)")
+            if not all(c in valid_bases for c in alt):
+                 raise ValueError(f"Malformed variant records detected (Line {line_num}: Invalid ALT bases)")
+
+            info_dict = parse_info(cols[7])
+            
+            if "GENE" in info_dict: seen_gene_tag = True
+            if "RS" in info_dict: seen_rs_tag = True
+            if "STAR" in info_dict: seen_star_tag = True
+            
+            gene = info_dict.get("GENE")
+            if gene:
+                genes_detected.add(gene)
+                if gene in TARGET_GENES:
+                    pharmacogene_variants += 1
+                    if kept_text is not None:
+                        kept_text.add(line_str)
+            
+            total_variants += 1
+
+            record_variant(extracted_data, cols, info_dict)
+            genotypes.add(cols, info_dict)
+
+        
+        # Read loop - Single Pass
+        # content_type is only a hint; a BOM in the data takes precedence.
+        default_encoding = "utf-16-le" if "utf-16le" in str(content_type) else "utf-8"
+        reader = VCFLineReader(default_encoding=default_encoding)
+        inflater = None
+        line_number = 0
+        kept_text: Optional[PharmacogeneText] = PharmacogeneText() if keep_text else None
+        total_size = 0 # bytes received (compressed size for .vcf.gz)
+        decoded_size = 0 # bytes of VCF text after decompression
+        chunk_size = 64 * 1024
+        
+        def run_lines(lines: List[str]):
+            nonlocal line_number
+            for line in lines:
+                line_number += 1
+                process_line(line, line_number)
+
+        try:
+            if index_data is not None:
+                # Indexed mode: seek straight to the pharmacogene loci via the
+                # .tbi/.csi index instead of inflating the whole genome. The
+                # upload is checked against MAX_INDEXED_FILE_SIZE; region reads
+                # only get the decompressed-size cap.
+                fileobj.seek(0, os.SEEK_END)
+                total_size = fileobj.tell()
+                fileobj.seek(0)
+                if total_size > MAX_INDEXED_FILE_SIZE:
+                     return {"valid": False, "error_type": "FileTooLarge", "message": "Indexed VCF size must be < 64GB", "status_code": status.HTTP_413_REQUEST_ENTITY_TOO_LARGE}
+                raw_lines = read_pharmacogene_lines(fileobj, index_data, assembly, None, MAX_DECOMPRESSED_SIZE)
+                for raw in raw_lines:
+                    decoded_size += len(raw) + 1
+                run_lines([raw.decode("utf-8", errors="ignore") for raw in raw_lines])
+            else:
+                while True:
+                    chunk = fileobj.read(chunk_size)
+                    if not chunk:
+                        break
+                
+                    total_size += len(chunk)
+                    if total_size > MAX_FILE_SIZE:
+                         return {"valid": False, "error_type": "FileTooLarge", "message": "File size must be < 5MB", "status_code": status.HTTP_413_REQUEST_ENTITY_TOO_LARGE}
+                
+                    # Sniff gzip/BGZF from the magic bytes rather than trusting the name
+                    if total_size == len(chunk) and is_gzip(chunk):
+                        inflater = GzipStreamDecoder(max_output=MAX_DECOMPRESSED_SIZE)
+
+                    data = inflater.feed(chunk) if inflater else chunk
+                    decoded_size += len(data)
+                    run_lines(reader.feed(data))
+
+                if inflater:
+                    data = inflater.close()
+                    decoded_size += len(data)
+                    run_lines(reader.feed(data))
+                run_lines(reader.close())
+        except DecompressedSizeExceeded:
+            return {"valid": False, "error_type": "FileTooLarge", "message": "Decompressed VCF size must be < 256MB", "status_code": status.HTTP_413_REQUEST_ENTITY_TOO_LARGE}
+        except DecompressionError as e:
+            return {"valid": False, "error_type": "InvalidCompression", "message": str(e), "status_code": status.HTTP_400_BAD_REQUEST}
+        except VCFIndexError as e:
+            return {"valid": False, "error_type": "InvalidIndex", "message": str(e), "status_code": status.HTTP_400_BAD_REQUEST}
+        except ValueError as e:
+            err_msg = str(e)
+            user_msg = err_msg.split("(")[0].strip()
+            return {"valid": False, "error_type": "ValidationError", "message": user_msg, "status_code": status.HTTP_400_BAD_REQUEST}
+
+        # An indexed read only yields the pharmacogene regions, so it is the upload that must clear the minimum
+        if (total_size if index_data is not None else decoded_size) < MIN_FILE_SIZE:
+             return {"valid": False, "error_type": "FileTooSmall", "message": "File size must be > 1KB", "status_code": status.HTTP_400_BAD_REQUEST}
+        
+        if not vcf_version:
+             return {"valid": False, "error_type": "InvalidHeader", "message": "Invalid VCF header — missing required fields", "status_code": status.HTTP_400_BAD_REQUEST}
+            
+        if not has_chrom_header:
+             return {"valid": False, "error_type": "InvalidHeader", "message": "Invalid VCF header — missing required fields", "status_code": status.HTTP_400_BAD_REQUEST}
+
+        if total_variants < 1:
+             return {"valid": False, "error_type": "InsufficientData", "message": "VCF file contains insufficient genomic data (must have at least 1 variant)", "status_code": status.HTTP_400_BAD_REQUEST}
+
+        if pharmacogene_variants == 0:
+             return {"valid": False, "error_type": "NoPharmacogenes", "message": "No pharmacogenomic variants detected in file", "status_code": status.HTTP_400_BAD_REQUEST}
+            
+        if not (seen_gene_tag and seen_rs_tag and seen_star_tag):
+             return {"valid": False, "error_type": "MissingAnnotations", "message": "VCF lacks pharmacogenomic annotations (GENE/STAR/RS)", "status_code": status.HTTP_400_BAD_REQUEST}
+
+        # Genetic Profiling Engine Integration
+        # genetic_profile keeps the first-sample view used by the single-patient
+        # endpoints; sample_profiles covers every sample column of the file.
+        profiling_result = {}
+        sample_profiles = {}
+        try:
+            profiling_result = build_genetic_profile(extracted_data)
+            sample_profiles = build_genetic_profiles(genotypes)
+
+        except Exception as e:
+            logger.error(f"Profiling Engine Error: {e}")
+            warnings.append(f"Genetic profiling failed: {str(e)}")
+
+        result = {
+            "valid": True,
+            "vcf_version": vcf_version,
+            "total_variants": total_variants,
+            "pharmacogene_variants": pharmacogene_variants,
+            "genes_detected": list(genes_detected),
+            "warnings": warnings,
+            "genetic_profile": profiling_result,
+            "samples": genotypes.sample_ids,
+            "sample_profiles": sample_profiles,
+            "status_code": status.HTTP_200_OK
+        }
+        if kept_text is not None:
+            result["vcf_text"] = kept_text.text()
+            if kept_text.overflow:
+                logger.warning(f"[VCF] Pharmacogene text exceeds {MAX_ML_TEXT_SIZE} bytes, not kept for ML")
+        return result
+
+    except Exception as e:
+        logger.error(f"Error processing VCF: {e}")
+        return {"valid": False, "error_type": "ProcessingError", "message": "An unexpected error occurred processing the file", "status_code": status.HTTP_400_BAD_REQUEST}
+
+
+def read_vcf_text(fileobj: BinaryIO, content_type: Optional[str] = None) -> Optional[str]:
+    """
+    Header and pharmacogene records of an already-validated VCF (plain or
+    gzip/BGZF), in one pass; None if they exceed MAX_ML_TEXT_SIZE. Used when
+    a cached profile skipped parsing but the ML extractor still needs text.
+    """
+    fileobj.seek(0)
+    default_encoding = "utf-16-le" if "utf-16le" in str(content_type) else "utf-8"
+    reader = VCFLineReader(default_encoding=default_encoding)
+    inflater = None
+    kept = PharmacogeneText()
+
+    def keep(lines: List[str]):
+        for line in lines:
+            line = line.strip()
+            if line.startswith("#") or is_pharmacogene_record(line):
+                kept.add(line)
+
+    first = True
+    for chunk in iter(lambda: fileobj.read(64 * 1024), b""):
+        if first and is_gzip(chunk):
+            inflater = GzipStreamDecoder(max_output=MAX_DECOMPRESSED_SIZE)
+        first = False
+        keep(reader.feed(inflater.feed(chunk) if inflater else chunk))
+        if kept.overflow:
+            return None
+    if inflater:
+        keep(reader.feed(inflater.close()))
+    keep(reader.close())
+    return kept.text()
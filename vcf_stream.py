@@ -0,0 +1,211 @@
+import codecs
+import zlib
+from typing import Iterable, Iterator, List, Optional
+
+# BOM signatures, longest first so UTF-8's 3-byte mark is tested before the
+# 2-byte UTF-16 marks.
+_BOMS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+# Every VCF starts with "##fileformat", so a NUL next to the first '#' is a
+# reliable sign of BOM-less UTF-16 (e.g. files saved by PowerShell redirects).
+_BOMLESS_UTF16 = (
+    (b"#\x00", "utf-16-le"),
+    (b"\x00#", "utf-16-be"),
+)
+
+SNIFF_BYTES = 4
+
+
+def detect_encoding(head: bytes, default: str = "utf-8") -> str:
+    """
+    Guesses the text encoding of a VCF from its first few bytes.
+
+    Args:
+        head: Leading bytes of the file (at least SNIFF_BYTES when available).
+        default: Encoding to use when no BOM or UTF-16 pattern is found.
+
+    Returns:
+        A codec name suitable for codecs.getincrementaldecoder.
+    """
+    for bom, encoding in _BOMS:
+        if head.startswith(bom):
+            return encoding
+    for prefix, encoding in _BOMLESS_UTF16:
+        if head.startswith(prefix):
+            return encoding
+    return default
+
+
+class VCFLineReader:
+    """
+    Incremental bytes -> lines reader for streamed uploads.
+
+    Chunks are decoded with an incremental decoder, so multi-byte characters
+    split across chunk boundaries are reassembled instead of dropped. Only the
+    unterminated tail of the previous chunk is carried over, and long lines are
+    collected as a list of fragments, so total work stays linear in the input.
+
+    Usage:
+        reader = VCFLineReader()
+        for chunk in chunks:
+            for line in reader.feed(chunk):
+                ...
+        for line in reader.close():
+            ...
+    """
+
+    def __init__(self, encoding: Optional[str] = None, default_encoding: str = "utf-8", errors: str = "ignore"):
+        self.encoding = encoding
+        self.default_encoding = default_encoding
+        self.errors = errors
+        self._decoder = None
+        self._head = b""
+        self._fragments: List[str] = []
+
+        if encoding:
+            self._decoder = codecs.getincrementaldecoder(encoding)(errors=errors)
+
+    def feed(self, chunk: bytes) -> List[str]:
+        """Decodes a chunk and returns every line it completes (without '\\n')."""
+        if self._decoder is None:
+            self._head += chunk
+            if len(self._head) < SNIFF_BYTES:
+                return []
+            chunk, self._head = self._head, b""
+            self._start_decoder(chunk)
+
+        return self._split(self._decoder.decode(chunk))
+
+    def close(self) -> List[str]:
+        """Flushes the decoder and returns the final unterminated line, if any."""
+        if self._decoder is None:
+            chunk, self._head = self._head, b""
+            self._start_decoder(chunk)
+            lines = self._split(self._decoder.decode(chunk, final=True))
+        else:
+            lines = self._split(self._decoder.decode(b"", final=True))
+
+        if self._fragments:
+            tail = "".join(self._fragments)
+            self._fragments = []
+            if tail:
+                lines.append(tail)
+        return lines
+
+    def _start_decoder(self, head: bytes):
+        self.encoding = detect_encoding(head, self.default_encoding)
+        self._decoder = codecs.getincrementaldecoder(self.encoding)(errors=self.errors)
+
+    def _split(self, text: str) -> List[str]:
+        if not text:
+            return []
+
+        pieces = text.split("\n")
+        if len(pieces) == 1:
+            self._fragments.append(text)
+            return []
+
+        if self._fragments:
+            self._fragments.append(pieces[0])
+            pieces[0] = "".join(self._fragments)
+
+        tail = pieces.pop()
+        self._fragments = [tail] if tail else []
+        return pieces
+
+
+def iter_lines(chunks: Iterable[bytes], encoding: Optional[str] = None, default_encoding: str = "utf-8") -> Iterator[str]:
+    """
+    Yields decoded lines from an iterable of byte chunks.
+
+    Args:
+        chunks: Any iterable of bytes (file.read loop, network stream, ...).
+        encoding: Force a codec instead of sniffing the BOM.
+        default_encoding: Codec to fall back to when sniffing finds nothing.
+    """
+    reader = VCFLineReader(encoding=encoding, default_encoding=default_encoding)
+    for chunk in chunks:
+        yield from reader.feed(chunk)
+    yield from reader.close()
+
+
+# ── Compressed input (gzip / BGZF) ─────────────────────────────────────
+GZIP_MAGIC = b"\x1f\x8b"
+COMPRESSED_EXTENSIONS = (".vcf.gz", ".vcf.bgz")
+
+# Largest slice handed back per inflate call, so a tiny malicious chunk
+# cannot balloon into one huge allocation before the ceiling is checked.
+_INFLATE_STEP = 1024 * 1024
+
+
+class DecompressionError(Exception):
+    """Raised when a gzip/BGZF stream is corrupt or truncated."""
+
+
+class DecompressedSizeExceeded(Exception):
+    """Raised when the decompressed output passes the configured ceiling."""
+
+
+def is_gzip(head: bytes) -> bool:
+    return head[:2] == GZIP_MAGIC
+
+
+class GzipStreamDecoder:
+    """
+    Streaming gzip inflater that also understands BGZF.
+
+    BGZF is a series of independent gzip members, so whenever one member
+    ends the decoder starts a fresh one on the leftover input. Output is
+    metered against max_output and DecompressedSizeExceeded is raised as
+    soon as the ceiling is crossed.
+    """
+
+    def __init__(self, max_output: Optional[int] = None):
+        self.max_output = max_output
+        self.total_in = 0
+        self.total_out = 0
+        self._inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self._member_open = False
+
+    def feed(self, chunk: bytes) -> bytes:
+        """Inflates a compressed chunk and returns the bytes it produced."""
+        self.total_in += len(chunk)
+        out = []
+        data = chunk
+        try:
+            while data:
+                self._member_open = True
+                piece = self._inflater.decompress(data, _INFLATE_STEP)
+                self._count(piece)
+                out.append(piece)
+                if self._inflater.eof:
+                    data = self._inflater.unused_data
+                    self._inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                    self._member_open = False
+                else:
+                    data = self._inflater.unconsumed_tail
+        except zlib.error as e:
+            raise DecompressionError(f"Corrupt compressed data: {e}")
+        return b"".join(out)
+
+    def close(self) -> bytes:
+        """Flushes the decoder; raises if the last member was cut short."""
+        try:
+            tail = self._inflater.flush()
+        except zlib.error as e:
+            raise DecompressionError(f"Corrupt compressed data: {e}")
+        self._count(tail)
+        if self._member_open and not self._inflater.eof:
+            raise DecompressionError("Compressed stream ended unexpectedly")
+        return tail
+
+    def _count(self, piece: bytes):
+        self.total_out += len(piece)
+        if self.max_output is not None and self.total_out > self.max_output:
+            raise DecompressedSizeExceeded(
+                f"Decompressed size exceeds {self.max_output} bytes"
+            )